@@ -0,0 +1,180 @@
+from __future__ import annotations
+from .camera import Camera
+from .canvas import Canvas, write_ppm_to_file
+from .matrices import Matrix
+from .scene import World
+from .shapes import Shape
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import math
+import multiprocessing
+import os
+import time
+
+Target = Union[Shape, Camera]
+
+
+class Keyframes:
+    # a transformation at a number of frames, interpolated in between and held before the first
+    # and after the last frame. every matrix is split into a translation, a rotation and a
+    # stretch, which are interpolated separately: the rotation along the shortest arc, so
+    # keyframes of a full turn need to be less than half a turn apart
+    def __init__(self, keys: Dict[int, Matrix]):
+        if not keys:
+            raise ValueError('at least one keyframe is needed')
+        self.keys: List[Tuple[int, Matrix]] = sorted(keys.items(), key=lambda key: key[0])
+        self._decomposed = [_decompose(matrix) for _, matrix in self.keys]
+
+    def __call__(self, frame: int) -> Matrix:
+        first_frame, first = self.keys[0]
+        if frame <= first_frame:
+            return first
+        for index, (next_frame, following) in enumerate(self.keys[1:]):
+            if frame <= next_frame:
+                fraction = (frame - first_frame) / (next_frame - first_frame)
+                (t1, q1, s1), (t2, q2, s2) = self._decomposed[index], self._decomposed[index + 1]
+                return _compose(_lerp(t1, t2, fraction), _slerp(q1, q2, fraction), _lerp(s1, s2, fraction))
+            first_frame, first = next_frame, following
+        return first
+
+
+def _decompose(m: Matrix) -> Tuple[tuple, tuple, tuple]:
+    # the translation, the rotation as a unit quaternion (w, x, y, z), and the symmetric stretch
+    # matrix applied before the rotation as 9 entries, from the polar decomposition of m
+    translation = (m[0, 3], m[1, 3], m[2, 3])
+    linear = [[m[row, col] for col in range(3)] for row in range(3)]
+    # averaging a matrix with its inverse transpose converges to the nearest orthogonal matrix
+    r = linear
+    for _ in range(100):
+        inverse_transpose = _inverse_transpose(r)
+        following = [[(a + b) / 2 for a, b in zip(row1, row2)] for row1, row2 in zip(r, inverse_transpose)]
+        converged = all(abs(a - b) < 1e-12 for row1, row2 in zip(r, following) for a, b in zip(row1, row2))
+        r = following
+        if converged:
+            break
+    if _determinant(r) < 0:
+        # a mirroring is kept in the stretch, so the rotation is a proper one
+        r = [[-c for c in row] for row in r]
+    stretch = tuple(sum(r[k][row] * linear[k][col] for k in range(3)) for row in range(3) for col in range(3))
+    return translation, _quaternion(r), stretch
+
+
+def _determinant(m: list) -> float:
+    return m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1]) - \
+        m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0]) + \
+        m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0])
+
+
+def _inverse_transpose(m: list) -> list:
+    # the cofactors divided by the determinant
+    determinant = _determinant(m)
+    return [[(m[(row + 1) % 3][(col + 1) % 3] * m[(row + 2) % 3][(col + 2) % 3] -
+              m[(row + 1) % 3][(col + 2) % 3] * m[(row + 2) % 3][(col + 1) % 3]) / determinant
+             for col in range(3)] for row in range(3)]
+
+
+def _quaternion(r: list) -> tuple:
+    trace = r[0][0] + r[1][1] + r[2][2]
+    if trace > 0:
+        s = math.sqrt(trace + 1) * 2
+        return s / 4, (r[2][1] - r[1][2]) / s, (r[0][2] - r[2][0]) / s, (r[1][0] - r[0][1]) / s
+    elif r[0][0] > r[1][1] and r[0][0] > r[2][2]:
+        s = math.sqrt(1 + r[0][0] - r[1][1] - r[2][2]) * 2
+        return (r[2][1] - r[1][2]) / s, s / 4, (r[0][1] + r[1][0]) / s, (r[0][2] + r[2][0]) / s
+    elif r[1][1] > r[2][2]:
+        s = math.sqrt(1 + r[1][1] - r[0][0] - r[2][2]) * 2
+        return (r[0][2] - r[2][0]) / s, (r[0][1] + r[1][0]) / s, s / 4, (r[1][2] + r[2][1]) / s
+    else:
+        s = math.sqrt(1 + r[2][2] - r[0][0] - r[1][1]) * 2
+        return (r[1][0] - r[0][1]) / s, (r[0][2] + r[2][0]) / s, (r[1][2] + r[2][1]) / s, s / 4
+
+
+def _compose(translation: tuple, rotation: tuple, stretch: tuple) -> Matrix:
+    w, x, y, z = rotation
+    r = [[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+         [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+         [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]]
+    return Matrix([[sum(r[row][k] * stretch[k * 3 + col] for k in range(3)) for col in range(3)] +
+                   [translation[row]] for row in range(3)] + [[0, 0, 0, 1]])
+
+
+def _lerp(a: tuple, b: tuple, fraction: float) -> tuple:
+    return tuple(x + (y - x) * fraction for x, y in zip(a, b))
+
+
+def _slerp(q1: tuple, q2: tuple, fraction: float) -> tuple:
+    cos_angle = sum(a * b for a, b in zip(q1, q2))
+    # q and -q are the same rotation, the one closest to q1 takes the shortest arc
+    if cos_angle < 0:
+        q2 = tuple(-c for c in q2)
+        cos_angle = -cos_angle
+    if cos_angle > 0.9995:
+        q = _lerp(q1, q2, fraction)
+    else:
+        angle = math.acos(cos_angle)
+        w1 = math.sin((1 - fraction) * angle) / math.sin(angle)
+        w2 = math.sin(fraction * angle) / math.sin(angle)
+        q = tuple(w1 * a + w2 * b for a, b in zip(q1, q2))
+    length = math.sqrt(sum(c * c for c in q))
+    return tuple(c / length for c in q)
+
+
+class Animation:
+    def __init__(self):
+        self._tracks: List[Tuple[Target, Callable[[int], Matrix]]] = []
+
+    def animate(self, target: Target, transformation_at: Union[Keyframes, Callable[[int], Matrix]]) -> None:
+        # target is a shape or the camera, transformation_at gives its transformation per frame
+        self._tracks.append((target, transformation_at))
+
+    def apply(self, frame: int) -> None:
+        # only transformations change between frames. the hierarchy of the scene,
+        # including groups divided into a bounding volume hierarchy, stays as it is
+        # and only the cached bounds along the changed paths are refitted
+        for target, transformation_at in self._tracks:
+            target.transformation = transformation_at(frame)
+
+
+def _render_frame(camera: Camera, world: World, animation: Animation, frame: int,
+                  file_name: Optional[str]) -> Canvas:
+    animation.apply(frame)
+    canvas = camera.render(world)
+    if file_name:
+        write_ppm_to_file(canvas.to_ppm(), file_name.format(frame))
+    return canvas
+
+
+_worker_scene: Optional[Tuple[Camera, World, Animation]] = None
+
+
+def _init_worker(camera: Camera, world: World, animation: Animation) -> None:
+    # every worker process receives the scene once, and animates its own copy
+    global _worker_scene
+    _worker_scene = camera, world, animation
+
+
+def _render_worker_frame(frame: int, file_name: Optional[str]) -> Canvas:
+    camera, world, animation = _worker_scene
+    return _render_frame(camera, world, animation, frame, file_name)
+
+
+def render_sequence(camera: Camera, world: World, animation: Animation, frames: range,
+                    file_name: Optional[str] = 'frame_{:04d}.ppm', processes: int = None,
+                    divide_threshold: int = None) -> List[Canvas]:
+    # renders every frame, writing each one to file_name formatted with the frame number.
+    # frames are rendered in parallel by processes worker processes, all cpus by default
+    if divide_threshold is not None:
+        for obj in world.objects:
+            obj.divide(divide_threshold)
+
+    print(f'Rendering {len(frames)} frames...')
+    start = time.perf_counter()
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        canvases = [_render_frame(camera, world, animation, frame, file_name) for frame in frames]
+    else:
+        with multiprocessing.Pool(processes, _init_worker, (camera, world, animation)) as pool:
+            canvases = pool.starmap(_render_worker_frame, [(frame, file_name) for frame in frames])
+
+    duration = time.perf_counter() - start
+    print(f'Rendered {len(frames)} frames in {duration:.2f} seconds')
+    return canvases
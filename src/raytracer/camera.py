@@ -1,11 +1,29 @@
 from .canvas import Canvas
 from .matrices import Matrix
 from .rays import Ray
-from .scene import World
-from .tuples import Point
+from .scene import RayStatistics, World
+from .tuples import Color, Point
+from typing import Iterator, NamedTuple
 import math
 import time
 
+# the block sizes of the passes of a render with a time budget, and the number of samples
+# per pixel it stops at when there is time left
+BLOCK_SIZES = (8, 4, 2, 1)
+MAX_PROGRESSIVE_SAMPLES = 16
+
+
+class Tile(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+    def pixels(self) -> Iterator[tuple]:
+        for y in range(self.y, self.y + self.height):
+            for x in range(self.x, self.x + self.width):
+                yield x, y
+
 
 class Camera:
     def __init__(self, hsize: int, vsize: int, field_of_view: float):
@@ -13,8 +31,20 @@ class Camera:
         self.vsize = vsize
         self.field_of_view = field_of_view
         self.transformation = Matrix.identity()
+        # rays per pixel, spread over the pixel and averaged for antialiasing
+        self.samples = 1
+        self._inverted = None
+        self._inverse = None
         self._derive_properties()
 
+    @property
+    def inverse_transformation(self) -> Matrix:
+        # the inverse stays valid for as long as the same transformation matrix is assigned
+        if self._inverted is not self.transformation:
+            self._inverse = self.transformation.inverse()
+            self._inverted = self.transformation
+        return self._inverse
+
     def _derive_properties(self):
         half_view = math.tan(self.field_of_view / 2)
         aspect = self.hsize / self.vsize
@@ -26,10 +56,11 @@ class Camera:
             self.half_height = half_view
         self.pixel_size = (self.half_width * 2) / self.hsize
 
-    def ray_for_pixel(self, px: int, py: int) -> Ray:
-        # the offset from the edge of the canvas to the pixel's center
-        x_offset = (px + 0.5) * self.pixel_size
-        y_offset = (py + 0.5) * self.pixel_size
+    def ray_for_pixel(self, px: int, py: int, dx: float = 0.5, dy: float = 0.5) -> Ray:
+        # the offset from the edge of the canvas to the pixel's center,
+        # or to another point within the pixel given by dx and dy
+        x_offset = (px + dx) * self.pixel_size
+        y_offset = (py + dy) * self.pixel_size
 
         # the untransformed coordinates of the pixel in world space.
         # (remember that the camera looks toward -z, so +x is to the *left*.)
@@ -39,24 +70,89 @@ class Camera:
         # using the camera Matrix, transform the canvas point and the origin,
         # and then compute the ray's direction vector.
         # (remember that canvas is at z=-1)
-        pixel = self.transformation.inverse() * Point(world_x, world_y, -1)
-        origin = self.transformation.inverse() * Point(0, 0, 0)
+        inverse = self.inverse_transformation
+        pixel = inverse * Point(world_x, world_y, -1)
+        origin = inverse * Point(0, 0, 0)
         direction = (pixel - origin).normalize()
 
         return Ray(origin, direction)
 
-    def render(self, world: World) -> Canvas:
+    def pixel_color(self, world: World, px: int, py: int) -> Color:
+        # a single sample goes through the pixel's center, more samples are spread over the
+        # pixel by the world's sampler. either way the color only depends on the pixel, not
+        # on the order pixels are rendered in or on how they are divided over processes
+        if self.samples == 1:
+            return self._sample_color(world, px, py, 0, centered=True)
+        color = Color.black()
+        for index in range(self.samples):
+            color = color + self._sample_color(world, px, py, index)
+        return color * (1 / self.samples)
+
+    def _sample_color(self, world: World, px: int, py: int, index: int, centered: bool = False) -> Color:
+        world.start_sample(px, py, index)
+        if centered:
+            return world.color_at(self.ray_for_pixel(px, py))
+        dx = world.next_sample()
+        dy = world.next_sample()
+        return world.color_at(self.ray_for_pixel(px, py, dx, dy))
+
+    def tiles(self, size: int = 16) -> Iterator[Tile]:
+        for y in range(0, self.vsize, size):
+            for x in range(0, self.hsize, size):
+                yield Tile(x, y, min(size, self.hsize - x), min(size, self.vsize - y))
+
+    def render_tile(self, world: World, tile: Tile, image: Canvas) -> None:
+        # the world is expected to be compiled already
+        image.write_tile(tile, [self.pixel_color(world, x, y) for x, y in tile.pixels()])
+
+    def render(self, world: World, time_budget: float = None) -> Canvas:
+        # with a time budget in seconds, the image is refined in passes until the time is up
         image = Canvas(self.hsize, self.vsize)
+        world.compile()
+        world.statistics = RayStatistics()
 
         print('Rendering...')
         start = time.perf_counter()
-        for y in range(self.vsize):
-            for x in range(self.hsize):
-                ray = self.ray_for_pixel(x, y)
-                color = world.color_at(ray)
-                image.write_pixel(x, y, color)
-            print(f'{int(y / self.vsize * 100)}%')
+        if time_budget is not None:
+            self._render_progressively(world, image, start + time_budget)
+        else:
+            for y in range(self.vsize):
+                for x in range(self.hsize):
+                    image.write_pixel(x, y, self.pixel_color(world, x, y))
+                print(f'{int(y / self.vsize * 100)}%')
 
         duration = time.perf_counter() - start
         print(f'Rendered in {duration:.2f} seconds')
+        statistics = world.statistics
+        print(f'Traced {statistics.secondary_rays} secondary rays, '
+              f'skipped {statistics.terminated_rays} with too little contribution')
         return image
+
+    def _render_progressively(self, world: World, image: Canvas, deadline: float) -> None:
+        # every pass traces the top left pixel of smaller blocks, and fills the block with its
+        # color, so there is a complete image after the first pass. pixels traced in a pass are
+        # not traced again in the next, their block just shrinks. the first pass always
+        # completes, the others stop when the deadline has passed
+        for size in BLOCK_SIZES:
+            coarsest = size == BLOCK_SIZES[0]
+            for y in range(0, self.vsize, size):
+                for x in range(0, self.hsize, size):
+                    if not coarsest and x % (size * 2) == 0 and y % (size * 2) == 0:
+                        continue
+                    if not coarsest and time.perf_counter() >= deadline:
+                        return
+                    color = self.pixel_color(world, x, y)
+                    for block_y in range(y, min(y + size, self.vsize)):
+                        for block_x in range(x, min(x + size, self.hsize)):
+                            image.write_pixel(block_x, block_y, color)
+            print(f'Rendered {size}x{size} blocks')
+
+        # then more samples per pixel, averaged with the ones before
+        for index in range(self.samples, MAX_PROGRESSIVE_SAMPLES):
+            for y in range(self.vsize):
+                for x in range(self.hsize):
+                    if time.perf_counter() >= deadline:
+                        return
+                    color = self._sample_color(world, x, y, index)
+                    image.write_pixel(x, y, (image.pixel_at(x, y) * index + color) * (1 / (index + 1)))
+            print(f'Rendered {index + 1} samples per pixel')
@@ -1,5 +1,8 @@
 from raytracer.tuples import Color
-from typing import List
+from typing import Iterable, Iterator, List
+import numpy as np
+
+MAX_COLOR_VALUE = 255
 
 
 class Canvas:
@@ -14,27 +17,102 @@ class Canvas:
     def pixel_at(self, x: int, y: int) -> Color:
         return self._pixels[x][y]
 
+    def write_tile(self, tile, colors: Iterable[Color]) -> None:
+        # colors holds the colors of the pixels of a camera tile, in the order of tile.pixels()
+        for (x, y), color in zip(tile.pixels(), colors):
+            self.write_pixel(x, y, color)
+
     def to_ppm(self) -> List[str]:
-        max_color_value: int = 255
-        ppm_header = ['P3\n', f'{self.width} {self.height}\n', f'{max_color_value}\n']
-        pixel_data = []
+        return list(self.ppm_lines())
+
+    def ppm_lines(self) -> Iterator[str]:
+        # the lines of the ppm file one at a time, so they can be written to a file
+        # without holding all of them in memory
+        yield 'P3\n'
+        yield f'{self.width} {self.height}\n'
+        yield f'{MAX_COLOR_VALUE}\n'
         for y in range(self.height):
-            line = ''
-            for x in range(self.width):
-                color = self.pixel_at(x, y)
-                pixel = tuple(map(lambda c: min(max(0, round(c * max_color_value)), max_color_value), color))
-                for index in range(3):
-                    text = f'{pixel[index]} '
-                    if len(line + text) <= 70:
-                        line += text
-                    else:
-                        pixel_data.append(line[:-1] + '\n')
-                        line = text
-            pixel_data.append(line[:-1] + '\n')
-        ppm = ppm_header + pixel_data
-        return ppm
-
-
-def write_ppm_to_file(ppm: List[str], file_name: str) -> None:
+            yield from _ppm_row(self._row_values(y))
+
+    def _row_values(self, y: int) -> List[int]:
+        values = []
+        for x in range(self.width):
+            values.extend(min(max(0, round(c * MAX_COLOR_VALUE)), MAX_COLOR_VALUE) for c in self.pixel_at(x, y))
+        return values
+
+
+def _ppm_row(values: Iterable[int]) -> Iterator[str]:
+    # lines are at most 70 characters long, and every row of the image starts on a new line
+    line = ''
+    for value in values:
+        text = f'{value} '
+        if len(line + text) <= 70:
+            line += text
+        else:
+            yield line[:-1] + '\n'
+            line = text
+    yield line[:-1] + '\n'
+
+
+class TiledCanvas(Canvas):
+    # a canvas for images too large to keep in memory, such as posters of 16k by 16k pixels.
+    # the pixels are kept in the file at path, mapped into memory, so only the pages in use
+    # take up memory whatever the resolution. the file holds the image tile by tile, which
+    # keeps the pixels of a tile rendered with the same tile size together.
+    # colors are stored as floats, or with dtype uint8 as the 8 bit values of the ppm file.
+    # write the image with write_ppm_to_file(canvas.ppm_lines(), ...), as to_ppm would hold
+    # the whole file in memory
+    def __init__(self, width: int, height: int, path: str, tile_size: int = 64, dtype=np.float32):
+        self.width = width
+        self.height = height
+        self.path = path
+        self.tile_size = tile_size
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64, np.uint8):
+            raise ValueError(f'pixels can not be stored as {self.dtype}')
+        shape = (-(-height // tile_size), -(-width // tile_size), tile_size, tile_size, 3)
+        self._tiles = np.memmap(path, dtype=self.dtype, mode='w+', shape=shape)
+
+    def _encode(self, values: np.ndarray) -> np.ndarray:
+        if self.dtype == np.uint8:
+            return np.clip(np.round(values * MAX_COLOR_VALUE), 0, MAX_COLOR_VALUE)
+        return values
+
+    def _decode(self, values: np.ndarray) -> np.ndarray:
+        if self.dtype == np.uint8:
+            return values / MAX_COLOR_VALUE
+        return values.astype(float)
+
+    def write_pixel(self, x: int, y: int, color: Color) -> None:
+        size = self.tile_size
+        self._tiles[y // size, x // size, y % size, x % size] = self._encode(np.array(color, dtype=float))
+
+    def pixel_at(self, x: int, y: int) -> Color:
+        size = self.tile_size
+        return Color(*self._decode(self._tiles[y // size, x // size, y % size, x % size]).tolist())
+
+    def write_tile(self, tile, colors: Iterable[Color]) -> None:
+        size = self.tile_size
+        row, column = tile.y // size, tile.x // size
+        if row != (tile.y + tile.height - 1) // size or column != (tile.x + tile.width - 1) // size:
+            # the tile spans several tiles of the file
+            super().write_tile(tile, colors)
+            return
+        values = np.array(list(colors), dtype=float).reshape(tile.height, tile.width, 3)
+        y, x = tile.y % size, tile.x % size
+        self._tiles[row, column, y:y + tile.height, x:x + tile.width] = self._encode(values)
+
+    def _row_values(self, y: int) -> List[int]:
+        size = self.tile_size
+        values = self._tiles[y // size, :, y % size].reshape(-1, 3)[:self.width]
+        if self.dtype != np.uint8:
+            values = np.clip(np.round(values.astype(float) * MAX_COLOR_VALUE), 0, MAX_COLOR_VALUE)
+        return values.astype(int).ravel().tolist()
+
+    def flush(self) -> None:
+        self._tiles.flush()
+
+
+def write_ppm_to_file(ppm: Iterable[str], file_name: str) -> None:
     with open(file_name, 'wt') as file:
         file.writelines(ppm)
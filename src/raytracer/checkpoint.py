@@ -0,0 +1,158 @@
+from __future__ import annotations
+from .camera import Camera, Tile
+from .canvas import Canvas
+from .matrices import Matrix
+from .scene import RayStatistics, World
+from .shapes import Group, Shape
+from .textures import Texture
+from .tuples import Color
+from enum import Enum
+from typing import Dict, List
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+
+def scene_hash(camera: Camera, world: World) -> str:
+    # a fingerprint of everything that determines the rendered image, so a checkpoint
+    # of a scene that changed since is detected. caches and statistics are left out
+    digest = hashlib.sha256()
+    seen: Dict[int, int] = {}
+
+    def update(*values) -> None:
+        for value in values:
+            add(value)
+
+    def add(value) -> None:
+        if value is None or isinstance(value, (bool, int, float, str, Enum)):
+            digest.update(repr(value).encode())
+        elif isinstance(value, Matrix):
+            add(value.values)
+        elif isinstance(value, (tuple, list)):
+            digest.update(f'{type(value).__name__}[{len(value)}'.encode())
+            update(*value)
+            digest.update(b']')
+        elif isinstance(value, np.ndarray):
+            digest.update(value.tobytes())
+        elif id(value) in seen:
+            # shared prototypes, materials and patterns are only described once
+            digest.update(f'@{seen[id(value)]}'.encode())
+        else:
+            seen[id(value)] = len(seen)
+            digest.update(f'{type(value).__name__}('.encode())
+            if isinstance(value, Texture):
+                update(value.path, os.path.getmtime(value.path))
+            else:
+                if isinstance(value, Shape):
+                    add(value.transformation)
+                    for name in value.geometry_attributes:
+                        update(name, getattr(value, name))
+                if isinstance(value, Group):
+                    add(list(value))
+                for name, attribute in sorted(vars(value).items()):
+                    if not name.startswith('_') and name != 'parent':
+                        update(name, attribute)
+            digest.update(b')')
+
+    update(camera.hsize, camera.vsize, camera.field_of_view, camera.transformation, camera.samples,
+           world.objects, world.light_source, world.min_contribution, world.russian_roulette,
+           world.sampler.seed)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    # the tiles of a render completed so far, kept in a sidecar file. the first line of the
+    # file describes the render, every following line holds one tile. lines are only ever
+    # appended, so a crash while writing costs at most the tile being written
+    def __init__(self, path: str, camera: Camera, world: World, tile_size: int = 16):
+        self.path = path
+        self.header = {'scene': scene_hash(camera, world), 'width': camera.hsize,
+                       'height': camera.vsize, 'tile_size': tile_size}
+        self.tiles: Dict[Tile, List[Color]] = {}
+        self._unsaved: List[str] = []
+
+    def load(self) -> bool:
+        # reads the tiles of an earlier render of the same scene, returns whether there was one
+        self.tiles = {}
+        try:
+            with open(self.path, 'rt') as file:
+                lines = file.read().split('\n')
+        except FileNotFoundError:
+            return False
+        try:
+            if json.loads(lines[0]) != self.header:
+                return False
+        except ValueError:
+            return False
+        # a line cut short by a crash is ended, so the next tile starts on a line of its own
+        self._unsaved = [] if lines[-1] == '' else ['\n']
+        for line in lines[1:]:
+            try:
+                x, y, width, height, values = json.loads(line)
+            except ValueError:
+                # an incomplete last line
+                continue
+            colors = [Color(*values[i:i + 3]) for i in range(0, len(values), 3)]
+            self.tiles[Tile(x, y, width, height)] = colors
+        return True
+
+    def start(self) -> None:
+        # starts a new checkpoint file, for a render without usable earlier tiles
+        self.tiles = {}
+        self._unsaved = []
+        self._write(json.dumps(self.header) + '\n', 'wt')
+
+    def add(self, tile: Tile, colors: List[Color]) -> None:
+        self.tiles[tile] = colors
+        values = [component for color in colors for component in color]
+        self._unsaved.append(json.dumps([tile.x, tile.y, tile.width, tile.height, values]) + '\n')
+
+    def save(self) -> None:
+        if self._unsaved:
+            self._write(''.join(self._unsaved), 'at')
+            self._unsaved = []
+
+    def _write(self, text: str, mode: str) -> None:
+        with open(self.path, mode) as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def render_with_checkpoint(camera: Camera, world: World, path: str, tile_size: int = 16,
+                           interval: float = 30.0) -> Canvas:
+    # renders tile by tile, saving the completed tiles to the checkpoint file at path every
+    # interval seconds. when the file holds tiles of an earlier, interrupted render of the
+    # same scene, only the missing tiles are rendered. the file is left in place afterwards,
+    # so remove it once the image itself is saved
+    checkpoint = Checkpoint(path, camera, world, tile_size)
+    image = Canvas(camera.hsize, camera.vsize)
+    if checkpoint.load():
+        print(f'Resuming from {len(checkpoint.tiles)} tiles in {path}')
+    else:
+        checkpoint.start()
+    for tile, colors in checkpoint.tiles.items():
+        image.write_tile(tile, colors)
+
+    world.compile()
+    world.statistics = RayStatistics()
+    missing = [tile for tile in camera.tiles(tile_size) if tile not in checkpoint.tiles]
+
+    print(f'Rendering {len(missing)} tiles...')
+    start = time.perf_counter()
+    saved = start
+    try:
+        for tile in missing:
+            camera.render_tile(world, tile, image)
+            checkpoint.add(tile, [image.pixel_at(x, y) for x, y in tile.pixels()])
+            if time.perf_counter() - saved >= interval:
+                checkpoint.save()
+                saved = time.perf_counter()
+    finally:
+        checkpoint.save()
+
+    duration = time.perf_counter() - start
+    print(f'Rendered in {duration:.2f} seconds')
+    return image
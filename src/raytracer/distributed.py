@@ -0,0 +1,198 @@
+from __future__ import annotations
+from .camera import Camera, Tile
+from .canvas import Canvas
+from .scene import World
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+import multiprocessing
+import pickle
+import socket
+import struct
+import threading
+import time
+
+# messages are pickled, so coordinator and workers have to trust each other:
+# only use this on networks where nobody else can connect
+_LENGTH = struct.Struct('!Q')
+
+
+def _send(connection: socket.socket, message: Any) -> None:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    connection.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _receive(connection: socket.socket) -> Any:
+    size, = _LENGTH.unpack(_receive_exactly(connection, _LENGTH.size))
+    return pickle.loads(_receive_exactly(connection, size))
+
+
+class Coordinator:
+    # hands out the tiles of one frame to workers connecting over tcp. every worker receives
+    # the scene once and then asks for one tile at a time. when no tiles are left to hand out,
+    # idle workers steal tiles still being rendered by others, and whichever result comes in
+    # first is used. tiles of workers that disconnect go back into the queue
+    def __init__(self, camera: Camera, world: World, tile_size: int = 16,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.camera = camera
+        self.world = world
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()[:2]
+        self._scene = pickle.dumps((camera, world), pickle.HIGHEST_PROTOCOL)
+
+        self._lock = threading.Condition()
+        self._pending: Deque[Tile] = deque(camera.tiles(tile_size))
+        self._tile_count = len(self._pending)
+        self._assigned: Dict[Tile, Set[int]] = {}
+        self._done: Set[Tile] = set()
+        self._connected = 0
+        self._image = Canvas(camera.hsize, camera.vsize)
+        self.retried_tiles = 0
+        self.stolen_tiles = 0
+
+    @property
+    def finished(self) -> bool:
+        return len(self._done) == self._tile_count
+
+    def render(self, timeout: float = None, idle_timeout: float = 30) -> Canvas:
+        # waits for workers to render every tile, raising TimeoutError after timeout seconds,
+        # or ConnectionError when no worker has been connected for idle_timeout seconds
+        print(f'Rendering {self._tile_count} tiles on workers connecting to {self.address}...')
+        start = time.perf_counter()
+        idle_since = start
+        self._server.settimeout(0.1)
+        threads: List[threading.Thread] = []
+        worker = 0
+        try:
+            while not self.finished:
+                if timeout is not None and time.perf_counter() - start > timeout:
+                    raise TimeoutError(f'{self._tile_count - len(self._done)} tiles were not rendered in time')
+                with self._lock:
+                    connected = self._connected
+                if connected:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.perf_counter()
+                elif time.perf_counter() - idle_since > idle_timeout:
+                    raise ConnectionError(f'no workers left to render {self._tile_count - len(self._done)} tiles')
+                try:
+                    connection, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                worker += 1
+                with self._lock:
+                    self._connected += 1
+                idle_since = None
+                thread = threading.Thread(target=self._serve, args=(connection, worker), daemon=True)
+                thread.start()
+                threads.append(thread)
+        finally:
+            self._server.close()
+        with self._lock:
+            self._lock.notify_all()
+        for thread in threads:
+            thread.join()
+
+        duration = time.perf_counter() - start
+        print(f'Rendered in {duration:.2f} seconds on {worker} workers, '
+              f'{self.retried_tiles} tiles retried, {self.stolen_tiles} stolen')
+        return self._image
+
+    def _serve(self, connection: socket.socket, worker: int) -> None:
+        tile = None
+        try:
+            with connection:
+                connection.sendall(_LENGTH.pack(len(self._scene)) + self._scene)
+                while True:
+                    tile = self._next_tile(worker)
+                    _send(connection, tile)
+                    if tile is None:
+                        return
+                    colors = _receive(connection)
+                    self._complete(tile, colors, worker)
+                    tile = None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            if tile is not None:
+                self._abandon(tile, worker)
+        finally:
+            with self._lock:
+                self._connected -= 1
+
+    def _next_tile(self, worker: int) -> Optional[Tile]:
+        with self._lock:
+            while True:
+                if self.finished:
+                    return None
+                if self._pending:
+                    tile = self._pending.popleft()
+                    self._assigned[tile] = {worker}
+                    return tile
+                # nothing left to hand out, so help with the tile the fewest workers are on
+                candidates = [tile for tile, workers in self._assigned.items() if worker not in workers]
+                if candidates:
+                    tile = min(candidates, key=lambda t: len(self._assigned[t]))
+                    self._assigned[tile].add(worker)
+                    self.stolen_tiles += 1
+                    return tile
+                self._lock.wait()
+
+    def _complete(self, tile: Tile, colors: list, worker: int) -> None:
+        with self._lock:
+            if tile not in self._done:
+                self._image.write_tile(tile, colors)
+                self._done.add(tile)
+                self._assigned.pop(tile, None)
+            self._lock.notify_all()
+
+    def _abandon(self, tile: Tile, worker: int) -> None:
+        with self._lock:
+            workers = self._assigned.get(tile)
+            if workers is not None:
+                workers.discard(worker)
+                if not workers:
+                    del self._assigned[tile]
+                    self._pending.appendleft(tile)
+                    self.retried_tiles += 1
+            self._lock.notify_all()
+
+
+def run_worker(host: str, port: int) -> None:
+    # renders tiles for the coordinator at host and port until it has none left
+    with socket.create_connection((host, port)) as connection:
+        camera, world = _receive(connection)
+        world.compile()
+        while True:
+            tile = _receive(connection)
+            if tile is None:
+                return
+            colors = [camera.pixel_color(world, x, y) for x, y in tile.pixels()]
+            _send(connection, colors)
+
+
+def render_distributed(camera: Camera, world: World, workers: int = 2, tile_size: int = 16,
+                       timeout: float = None, idle_timeout: float = 30) -> Canvas:
+    # renders with a coordinator and local worker processes standing in for other machines
+    coordinator = Coordinator(camera, world, tile_size)
+    host, port = coordinator.address
+    processes = [multiprocessing.Process(target=run_worker, args=(host, port), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        return coordinator.render(timeout, idle_timeout)
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+from .camera import Camera, Tile
+from .canvas import Canvas
+from .scene import World
+from .shapes import Shape
+from .tuples import Point
+from typing import Dict, Iterator, List, Optional, Tuple
+import math
+import time
+
+
+# renders a world once, and after that only the tiles affected by changed objects.
+# for every tile, the top-level objects intersected by any ray traced for its pixels
+# (primary, shadow, reflected and refracted rays) are kept as a bitmask. after a change,
+# a tile is rendered again when its mask holds a changed object, or when the changed
+# object's new bounds cover the tile on screen. shadows an object starts casting onto
+# tiles it neither covers nor touched before are not picked up, so call render() again
+# after large moves
+class IncrementalRenderer:
+    def __init__(self, camera: Camera, world: World, tile_size: int = 16):
+        self.camera = camera
+        self.world = world
+        self.tile_size = tile_size
+        self.image: Optional[Canvas] = None
+        self._touched: Dict[Tile, int] = {}
+        # a bit per object, kept for as long as the renderer lives so masks stay
+        # valid when objects are added to or removed from the world
+        self._bits: Dict[int, Tuple[Shape, int]] = {}
+        self.rendered_tiles = 0
+
+    def render(self) -> Canvas:
+        self.image = Canvas(self.camera.hsize, self.camera.vsize)
+        self._render_tiles(list(self.camera.tiles(self.tile_size)))
+        return self.image
+
+    def update(self, *changed: Shape) -> Canvas:
+        # changed are the top-level objects of the world that were moved or changed
+        # since the last render, including objects added to the world
+        if self.image is None or len(self._touched) == 0:
+            return self.render()
+
+        changed_mask = 0
+        for obj in changed:
+            changed_mask |= self._bit(obj)
+
+        screen_bounds = [self._screen_bounds(obj) for obj in changed]
+        dirty = [tile for tile, touched in self._touched.items()
+                 if touched & changed_mask or any(_overlaps(tile, bounds) for bounds in screen_bounds)]
+        self._render_tiles(dirty)
+        return self.image
+
+    def _bit(self, obj: Shape) -> int:
+        if id(obj) not in self._bits:
+            self._bits[id(obj)] = (obj, 1 << len(self._bits))
+        return self._bits[id(obj)][1]
+
+    def _render_tiles(self, tiles: List[Tile]) -> None:
+        world = self.world
+        world.compile()
+        masks = {id(obj): self._bit(obj) for obj in world.objects}
+
+        print(f'Rendering {len(tiles)} tiles...')
+        start = time.perf_counter()
+        for tile in tiles:
+            world.touched_objects = set()
+            self.camera.render_tile(world, tile, self.image)
+            mask = 0
+            for touched in world.touched_objects:
+                mask |= masks.get(touched, 0)
+            self._touched[tile] = mask
+        world.touched_objects = None
+        self.rendered_tiles = len(tiles)
+
+        duration = time.perf_counter() - start
+        print(f'Rendered in {duration:.2f} seconds')
+
+    def _screen_bounds(self, obj: Shape) -> Optional[Tuple[float, float, float, float]]:
+        # the pixel rectangle covered by the object's bounding box, or None
+        # when it can't be projected and could cover the whole image
+        box = obj.parent_space_bounds()
+        camera = self.camera
+        xs, ys = [], []
+        for corner in _corners(box.minimum, box.maximum):
+            if any(math.isinf(c) or math.isnan(c) for c in corner):
+                return None
+            x, y, z, _ = camera.transformation * corner
+            if z > -1e-9:
+                # the box reaches behind the camera
+                return None
+            xs.append((camera.half_width - x / -z) / camera.pixel_size - 0.5)
+            ys.append((camera.half_height - y / -z) / camera.pixel_size - 0.5)
+        return min(xs), min(ys), max(xs), max(ys)
+
+
+def _corners(minimum: Point, maximum: Point) -> Iterator[Point]:
+    for x in (minimum.x, maximum.x):
+        for y in (minimum.y, maximum.y):
+            for z in (minimum.z, maximum.z):
+                yield Point(x, y, z)
+
+
+def _overlaps(tile: Tile, bounds: Optional[Tuple[float, float, float, float]]) -> bool:
+    if bounds is None:
+        return True
+    min_x, min_y, max_x, max_y = bounds
+    return min_x <= tile.x + tile.width and max_x >= tile.x - 1 and \
+        min_y <= tile.y + tile.height and max_y >= tile.y - 1
@@ -1,31 +1,75 @@
 from __future__ import annotations
-from dataclasses import dataclass
 from math import sqrt
-from typing import Optional
+from operator import attrgetter
+from typing import Iterable, Iterator, Optional
 from . import EPSILON
 from .rays import Ray
 from .tuples import Point, Vector, dot
 
 
-@dataclass
+_by_t = attrgetter('t')
+
+
 class Computations:
-    t: float
-    object: object
-    point: Point
-    eyev: Vector
-    normalv: Vector
-    reflectv: Vector = 0.0
-    n1: float = 0.0
-    n2: float = 0.0
-
-    def __post_init__(self):
-        if dot(self.normalv, self.eyev) < 0:
-            self.normalv = -self.normalv
-            self.inside = True
-        else:
-            self.inside = False
-        self.over_point = self.point + self.normalv * EPSILON
-        self.under_point = self.point - self.normalv * EPSILON
+    # over_point, under_point, reflectv and n1 and n2 are only computed when shading first
+    # asks for them, as most hits only need a few of them
+    __slots__ = ('t', 'object', 'point', 'eyev', 'normalv', 'inside', 'hit', 'xs',
+                 '_over_point', '_under_point', '_reflectv', '_refractive_indices')
+
+    def __init__(self, t: float, _object: object, point: Point, eyev: Vector, normalv: Vector,
+                 hit: Intersection = None, xs: Intersections = None):
+        self.t = t
+        self.object = _object
+        self.point = point
+        self.eyev = eyev
+        self.inside = dot(normalv, eyev) < 0
+        self.normalv = -normalv if self.inside else normalv
+        self.hit = hit
+        self.xs = xs
+        self._over_point: Optional[Point] = None
+        self._under_point: Optional[Point] = None
+        self._reflectv: Optional[Vector] = None
+        self._refractive_indices: Optional[(float, float)] = None
+
+    @property
+    def over_point(self) -> Point:
+        if self._over_point is None:
+            self._over_point = self.point + self.normalv * EPSILON
+        return self._over_point
+
+    @property
+    def under_point(self) -> Point:
+        if self._under_point is None:
+            self._under_point = self.point - self.normalv * EPSILON
+        return self._under_point
+
+    @property
+    def reflectv(self) -> Vector:
+        # the eye vector points back along the ray
+        if self._reflectv is None:
+            self._reflectv = (-self.eyev).reflect(self.normalv)
+        return self._reflectv
+
+    @property
+    def refractive_indices(self) -> (float, float):
+        # n1 and n2 are derived from the intersection list, which takes a walk along it
+        if self._refractive_indices is None:
+            if self.hit is None or self.xs is None:
+                self._refractive_indices = (0.0, 0.0)
+            else:
+                self._refractive_indices = _refractive_indices(self.hit, self.xs)
+        return self._refractive_indices
+
+    def __repr__(self):
+        return f'Computations(t={self.t}, object={self.object}, point={self.point})'
+
+    @property
+    def n1(self) -> float:
+        return self.refractive_indices[0]
+
+    @property
+    def n2(self) -> float:
+        return self.refractive_indices[1]
 
     def schlick(self) -> float:
         cos = dot(self.eyev, self.normalv)
@@ -46,46 +90,73 @@ class Computations:
 
 
 class Intersections:
+    # the intersections are sorted by t when they are read, not when they are added, so the
+    # results of many shapes are put in order by a single sort at the end, if at all. the hit
+    # is tracked while adding, which makes finding it independent of the order. the to_sort
+    # arguments of append and extend are still accepted, but reading always sorts
+    __slots__ = ('_collection', '_sorted', '_hit')
+
     def __init__(self, *intersections):
-        self._collection = sorted(intersections, key=lambda intersection: intersection.t)
-        self._sorted = True
+        self._collection = list(intersections)
+        self._sorted = len(intersections) < 2
+        hit = None
+        for intersection in intersections:
+            if intersection.t >= 0 and (hit is None or intersection.t < hit.t):
+                hit = intersection
+        self._hit = hit
 
     @property
     def count(self):
         return len(self._collection)
 
     def append(self, intersection: Intersection, to_sort: bool = True):
-        self._collection.append(intersection)
+        collection = self._collection
+        # appending in order keeps the collection sorted
+        if self._sorted and collection and intersection.t < collection[-1].t:
+            self._sorted = False
+        collection.append(intersection)
+        t = intersection.t
+        if t >= 0 and (self._hit is None or t < self._hit.t):
+            self._hit = intersection
+
+    def extend(self, intersections: Iterable[Intersection], to_sort: bool = True):
+        if not isinstance(intersections, Intersections):
+            for intersection in intersections:
+                self.append(intersection)
+            return
+        if not intersections._collection:
+            return
+        self._collection.extend(intersections._collection)
         self._sorted = False
-        if to_sort:
-            self.sort()
-
-    def extend(self, intersections: Intersections, to_sort: bool = True):
-        for intersection in intersections:
-            self._collection.append(intersection)
-        self._sorted = False
-        if to_sort:
-            self.sort()
+        hit = intersections._hit
+        if hit is not None and (self._hit is None or hit.t < self._hit.t):
+            self._hit = hit
 
     def sort(self):
         if not self._sorted:
-            self._collection = sorted(self._collection, key=lambda x: x.t)
+            self._collection.sort(key=_by_t)
             self._sorted = True
 
     def __getitem__(self, item) -> Intersection:
+        self.sort()
         return self._collection[item]
 
+    def __iter__(self) -> Iterator[Intersection]:
+        self.sort()
+        return iter(self._collection)
+
     def hit(self) -> Optional[Intersection]:
-        for intersection in self._collection:
-            # return the first non-negative t intersection from the ordered list
-            if intersection.t >= 0:
-                return intersection
+        # the intersection with the smallest non-negative t
+        return self._hit
 
     def __repr__(self):
+        self.sort()
         return self._collection.__repr__()
 
 
 class Intersection:
+    __slots__ = ('t', 'object', 'u', 'v')
+
     def __init__(self, t: float, _object: object, u: float = None, v: float = None):
         self.t = t
         self.object = _object
@@ -96,28 +167,30 @@ class Intersection:
         point = ray.position(self.t)
         eyev = -ray.direction
         normalv = self.object.normal_at(point, self)
-        reflectv = ray.direction.reflect(normalv)
-
-        containers = []
-        n1, n2 = 0.0, 0.0
-        for i in xs:
-            if i == self:
-                if len(containers) == 0:
-                    n1 = 1.0
-                else:
-                    n1 = containers[-1].material.refractive_index
-            if i.object in containers:
-                containers.remove(i.object)
-            else:
-                containers.append(i.object)
-            if i == self:
-                if len(containers) == 0:
-                    n2 = 1.0
-                else:
-                    n2 = containers[-1].material.refractive_index
-                break
-
-        return Computations(self.t, self.object, point, eyev, normalv, reflectv, n1, n2)
+        return Computations(self.t, self.object, point, eyev, normalv, self, xs)
 
     def __repr__(self):
         return f'Intersection(t={self.t}, object={self.object})'
+
+
+def _refractive_indices(hit: Intersection, xs: Intersections) -> (float, float):
+    # the objects the ray is currently inside of, in the order they were entered.
+    # a dict keeps insertion order and gives O(1) membership tests and removals
+    containers = {}
+    for i in xs:
+        if i is hit:
+            n1 = _refractive_index_of_last(containers)
+        if i.object in containers:
+            del containers[i.object]
+        else:
+            containers[i.object] = None
+        if i is hit:
+            # nothing beyond the hit influences n1 and n2
+            return n1, _refractive_index_of_last(containers)
+    return 0.0, 0.0
+
+
+def _refractive_index_of_last(containers: dict) -> float:
+    if not containers:
+        return 1.0
+    return next(reversed(containers)).material.refractive_index
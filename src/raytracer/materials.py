@@ -1,20 +1,31 @@
 from . import EPSILON
 from .lights import PointLight
 from .tuples import Color, Vector, Point, dot
+from typing import NamedTuple
 import math
 
 
+class MaterialFeatures(NamedTuple):
+    reflective: bool
+    refractive: bool
+    patterned: bool
+
+
 class Material:
     def __init__(self):
-        self.color = Color(1, 1, 1)
-        self.ambient = 0.1
-        self.diffuse = 0.9
-        self.specular = 0.9
-        self.shininess = 200.0
-        self.reflective = 0.0
-        self.transparency = 0.0
-        self.refractive_index = 1.0
-        self.pattern = None
+        # set directly, so a new material starts out at version 0
+        self.__dict__.update(color=Color(1, 1, 1), ambient=0.1, diffuse=0.9, specular=0.9, shininess=200.0,
+                             reflective=0.0, transparency=0.0, refractive_index=1.0, pattern=None, _version=0)
+
+    def __setattr__(self, name, value):
+        # every change of the material counts up its version, so snapshots of it can tell
+        # they are out of date
+        object.__setattr__(self, name, value)
+        self.__dict__['_version'] += 1
+
+    @property
+    def version(self) -> int:
+        return self._version
 
     def __eq__(self, other):
         return self.color == other.color and \
@@ -24,46 +35,69 @@ class Material:
             abs(self.shininess - other.shininess) < EPSILON and \
             self.pattern == other.pattern
 
+    def features(self) -> MaterialFeatures:
+        return MaterialFeatures(self.reflective > 0, self.transparency > 0, self.pattern is not None)
+
     def lighting(self, _object, light: PointLight, point: Point, eyev: Vector, normalv: Vector,
                  in_shadow: bool = False) -> Color:
-        if self.pattern:
-            color = self.pattern.pattern_at_shape(_object, point)
-        else:
-            color = self.color
-
-        # combine surface color with light's color/intensity
-        effective_color = color * light.intensity
-
-        # find direction to light source
-        lightv = (light.position - point).normalize()
-
-        # compute ambient contribution
-        ambient = effective_color * self.ambient
-        diffuse = Color.black()
-        specular = Color.black()
-
-        if not in_shadow:
-            # light_dot_normal represents the cosine of the angle between light vector and
-            # normal vector. Negative number means light is on other side of surface
-            light_dot_normal = dot(lightv, normalv)
-            if light_dot_normal < 0:
-                diffuse = Color.black()
-                specular = Color.black()
-            else:
-                diffuse = effective_color * self.diffuse * light_dot_normal
-
-                # reflect_dot_eye represents the cosine of the angle between the reflection
-                # vector and eye vector. Negative number means light reflects away from the eye
-                reflectv = (-lightv).reflect(normalv)
-                reflect_dot_eye = dot(reflectv, eyev)
-                if reflect_dot_eye <= 0:
-                    specular = Color.black()
-                else:
-                    factor = math.pow(reflect_dot_eye, self.shininess)
-                    specular = light.intensity * self.specular * factor
-
-        return ambient + diffuse + specular
+        return MaterialLighting(self, light)(_object, point, eyev, normalv, in_shadow)
 
     def __repr__(self):
         return f'Material({self.color}, d:{self.diffuse}, a:{self.ambient}' \
                f', s:{self.specular}, r:{self.reflective})'
+
+
+class MaterialLighting:
+    # the phong lighting of one material by one light. everything that only depends on the two
+    # is computed once per render instead of for every hit, and the diffuse and specular terms
+    # are left out altogether for materials without them. current tells whether the material
+    # and light are still the ones it was computed for
+    def __init__(self, material: Material, light: PointLight):
+        self.material = material
+        self.light = light
+        self.version = material.version
+        self.pattern = material.pattern
+        self.intensity = light.intensity
+        self.position = light.position
+        self.ambient = material.ambient
+        self.diffuse = material.diffuse
+        self.shininess = material.shininess
+        # the colors are only known in advance without a pattern
+        self.effective_color = material.color * light.intensity
+        self.ambient_color = self.effective_color * material.ambient
+        self.specular_color = light.intensity * material.specular if material.specular != 0 else None
+
+    def current(self, material: Material, light: PointLight) -> bool:
+        return self.material is material and self.version == material.version and self.light is light and \
+            self.position is light.position and self.intensity is light.intensity
+
+    def __call__(self, _object, point: Point, eyev: Vector, normalv: Vector, in_shadow: bool = False) -> Color:
+        if self.pattern:
+            effective_color = self.pattern.pattern_at_shape(_object, point) * self.intensity
+            ambient = effective_color * self.ambient
+        else:
+            effective_color = self.effective_color
+            ambient = self.ambient_color
+
+        if in_shadow or (self.diffuse == 0 and self.specular_color is None):
+            return ambient
+
+        # light_dot_normal represents the cosine of the angle between light vector and
+        # normal vector. Negative number means light is on other side of surface
+        lightv = (self.position - point).normalize()
+        light_dot_normal = dot(lightv, normalv)
+        if light_dot_normal < 0:
+            return ambient
+
+        color = ambient
+        if self.diffuse != 0:
+            color = color + effective_color * (self.diffuse * light_dot_normal)
+
+        if self.specular_color is not None:
+            # reflect_dot_eye represents the cosine of the angle between the reflection vector and
+            # eye vector. Negative number means light reflects away from the eye. the light vector
+            # reflected around the normal is 2 * light_dot_normal * normalv - lightv
+            reflect_dot_eye = 2 * light_dot_normal * dot(normalv, eyev) - dot(lightv, eyev)
+            if reflect_dot_eye > 0:
+                color = color + self.specular_color * math.pow(reflect_dot_eye, self.shininess)
+        return color
@@ -0,0 +1,118 @@
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+import math
+import random
+import numpy as np
+
+
+# the twelve edge directions of a cube, as used by Ken Perlin's improved noise
+_GRADIENTS = ((1, 1, 0), (-1, 1, 0), (1, -1, 0), (-1, -1, 0),
+              (1, 0, 1), (-1, 0, 1), (1, 0, -1), (-1, 0, -1),
+              (0, 1, 1), (0, -1, 1), (0, 1, -1), (0, -1, -1))
+_GRADIENT_ARRAY = np.array(_GRADIENTS, dtype=float)
+
+_CORNERS = tuple((dx, dy, dz) for dx in (0, 1) for dy in (0, 1) for dz in (0, 1))
+
+Gradients = Tuple[Tuple[int, int, int], ...]
+
+
+def _fade(t: float) -> float:
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def _lerp(t: float, a: float, b: float) -> float:
+    return a + t * (b - a)
+
+
+class PerlinNoise:
+    def __init__(self, seed: int = 0, cache_lattice: bool = False, max_cached_cells: int = 1 << 16):
+        self.seed = seed
+        permutation = list(range(256))
+        random.Random(seed).shuffle(permutation)
+        # doubled, so lookups of the form p[p[x] + y] never need wrapping
+        self._permutation = permutation * 2
+        self._permutation_array = np.array(self._permutation, dtype=np.intp)
+        self._lattice: Optional[Dict[Tuple[int, int, int], Gradients]] = {} if cache_lattice else None
+        self._max_cached_cells = max_cached_cells
+
+    def _hash(self, x: int, y: int, z: int) -> int:
+        p = self._permutation
+        return p[p[p[x] + y] + z]
+
+    def _cell_gradients(self, xi: int, yi: int, zi: int) -> Gradients:
+        # the gradients at the eight corners of a lattice cell, in _CORNERS order
+        if self._lattice is not None:
+            gradients = self._lattice.get((xi, yi, zi))
+            if gradients is not None:
+                return gradients
+        gradients = tuple(_GRADIENTS[self._hash((xi + dx) & 255, (yi + dy) & 255, (zi + dz) & 255) % 12]
+                          for dx, dy, dz in _CORNERS)
+        if self._lattice is not None and len(self._lattice) < self._max_cached_cells:
+            self._lattice[(xi, yi, zi)] = gradients
+        return gradients
+
+    def noise(self, x: float, y: float, z: float) -> float:
+        # returns a smoothly varying value in roughly [-1, 1]
+        xf, yf, zf = math.floor(x), math.floor(y), math.floor(z)
+        x, y, z = x - xf, y - yf, z - zf
+        gradients = self._cell_gradients(xf & 255, yf & 255, zf & 255)
+
+        dots = [gx * (x - dx) + gy * (y - dy) + gz * (z - dz)
+                for (gx, gy, gz), (dx, dy, dz) in zip(gradients, _CORNERS)]
+
+        u, v, w = _fade(x), _fade(y), _fade(z)
+        x00 = _lerp(w, dots[0], dots[1])
+        x01 = _lerp(w, dots[2], dots[3])
+        x10 = _lerp(w, dots[4], dots[5])
+        x11 = _lerp(w, dots[6], dots[7])
+        return _lerp(u, _lerp(v, x00, x01), _lerp(v, x10, x11))
+
+    def noise_many(self, points: np.ndarray) -> np.ndarray:
+        # vectorized noise for an (n, 3) array of points, same values as noise()
+        floors = np.floor(points[:, :3])
+        local = points[:, :3] - floors
+        cells = floors.astype(np.int64) & 255
+        p = self._permutation_array
+
+        dots = []
+        for dx, dy, dz in _CORNERS:
+            h = p[p[p[(cells[:, 0] + dx) & 255] + ((cells[:, 1] + dy) & 255)] + ((cells[:, 2] + dz) & 255)]
+            g = _GRADIENT_ARRAY[h % 12]
+            dots.append(g[:, 0] * (local[:, 0] - dx) + g[:, 1] * (local[:, 1] - dy) + g[:, 2] * (local[:, 2] - dz))
+
+        fade = local * local * local * (local * (local * 6 - 15) + 10)
+        u, v, w = fade[:, 0], fade[:, 1], fade[:, 2]
+        x00 = dots[0] + w * (dots[1] - dots[0])
+        x01 = dots[2] + w * (dots[3] - dots[2])
+        x10 = dots[4] + w * (dots[5] - dots[4])
+        x11 = dots[6] + w * (dots[7] - dots[6])
+        y0 = x00 + v * (x01 - x00)
+        y1 = x10 + v * (x11 - x10)
+        return y0 + u * (y1 - y0)
+
+    def fbm(self, x: float, y: float, z: float, octaves: int = 4, lacunarity: float = 2.0,
+            gain: float = 0.5, turbulent: bool = False) -> float:
+        # fractal brownian motion: a sum of octaves of noise at rising frequency and falling amplitude.
+        # turbulence sums the absolute values instead, which gives sharp creases
+        total, frequency, amplitude = 0.0, 1.0, 1.0
+        for _ in range(octaves):
+            n = self.noise(x * frequency, y * frequency, z * frequency)
+            total += amplitude * (abs(n) if turbulent else n)
+            frequency *= lacunarity
+            amplitude *= gain
+        return total
+
+    def fbm_many(self, points: np.ndarray, octaves: int = 4, lacunarity: float = 2.0,
+                 gain: float = 0.5, turbulent: bool = False) -> np.ndarray:
+        total = np.zeros(len(points))
+        frequency, amplitude = 1.0, 1.0
+        for _ in range(octaves):
+            n = self.noise_many(points[:, :3] * frequency)
+            total += amplitude * (np.abs(n) if turbulent else n)
+            frequency *= lacunarity
+            amplitude *= gain
+        return total
+
+
+# the permutation and gradient tables shared by every noise pattern that doesn't bring its own
+default_noise = PerlinNoise()
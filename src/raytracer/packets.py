@@ -0,0 +1,271 @@
+from __future__ import annotations
+from . import EPSILON
+from .camera import Camera, Tile
+from .matrices import Matrix
+from .rays import Ray
+from .scene import World
+from .shapes import Cone, Cube, Cylinder, Group, Plane, Shape, SmoothTriangle, Sphere, Triangle
+from typing import Callable, Dict, Iterable, List, Tuple
+import numpy as np
+
+# a packet is a number of rays as two arrays of shape (n, 3): their origins and their directions.
+# the kernels below follow the math of the _local_intersect methods of the shapes, only for all
+# rays of a packet at once. every kernel returns the t values of the possible intersections of
+# every ray as an array of shape (n, k), with nan where there is no intersection
+Packet = Tuple[np.ndarray, np.ndarray]
+
+
+def ray_arrays(rays: Iterable[Ray]) -> Packet:
+    rays = list(rays)
+    origins = np.array([ray.origin[:3] for ray in rays], dtype=float).reshape(-1, 3)
+    directions = np.array([ray.direction[:3] for ray in rays], dtype=float).reshape(-1, 3)
+    return origins, directions
+
+
+def tile_rays(camera: Camera, tile: Tile) -> Packet:
+    # the rays through the centers of the pixels of the tile, in the order of tile.pixels()
+    ys, xs = np.mgrid[tile.y:tile.y + tile.height, tile.x:tile.x + tile.width]
+    world_x = camera.half_width - (xs.ravel() + 0.5) * camera.pixel_size
+    world_y = camera.half_height - (ys.ravel() + 0.5) * camera.pixel_size
+    pixels = np.stack([world_x, world_y, np.full(world_x.shape, -1.0)], axis=1)
+
+    inverse = np.array(camera.inverse_transformation.values, dtype=float)
+    pixels = pixels @ inverse[:3, :3].T + inverse[:3, 3]
+    origin = inverse[:3, 3]
+    directions = pixels - origin
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    return np.broadcast_to(origin, directions.shape).copy(), directions
+
+
+def transform_rays(matrix: Matrix, origins: np.ndarray, directions: np.ndarray) -> Packet:
+    m = np.array(matrix.values, dtype=float)
+    return origins @ m[:3, :3].T + m[:3, 3], directions @ m[:3, :3].T
+
+
+def _quadratic(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # both roots in ascending order when a > 0, nan for rays without any
+    discriminant = b * b - 4 * a * c
+    root = np.sqrt(np.where(discriminant < 0, np.nan, discriminant))
+    return (-b - root) / (2 * a), (-b + root) / (2 * a)
+
+
+def sphere_intersections(origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    a = np.einsum('ij,ij->i', directions, directions)
+    b = 2 * np.einsum('ij,ij->i', directions, origins)
+    c = np.einsum('ij,ij->i', origins, origins) - 1
+    return np.stack(_quadratic(a, b, c), axis=1)
+
+
+def plane_intersections(origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    dy = directions[:, 1]
+    parallel = np.abs(dy) < EPSILON
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = -origins[:, 1] / np.where(parallel, np.nan, dy)
+    return t[:, np.newaxis]
+
+
+def cube_intersections(origins: np.ndarray, directions: np.ndarray,
+                       minimum=(-1, -1, -1), maximum=(1, 1, 1)) -> np.ndarray:
+    # _check_axis for the three axes at once
+    minimum, maximum = np.asarray(minimum[:3], dtype=float), np.asarray(maximum[:3], dtype=float)
+    parallel = np.abs(directions) < EPSILON
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        scale = np.where(parallel, np.inf, 1.0 / np.where(parallel, 1.0, directions))
+        t1 = (minimum - origins) * scale
+        t2 = (maximum - origins) * scale
+    t_min = np.max(np.minimum(t1, t2), axis=1)
+    t_max = np.min(np.maximum(t1, t2), axis=1)
+    missed = ~(t_min <= t_max)
+    return np.stack([np.where(missed, np.nan, t_min), np.where(missed, np.nan, t_max)], axis=1)
+
+
+def _within(t: np.ndarray, origins: np.ndarray, directions: np.ndarray, minimum: float, maximum: float) -> np.ndarray:
+    y = origins[:, 1] + t * directions[:, 1]
+    return np.where((minimum < y) & (y < maximum), t, np.nan)
+
+
+def _caps(origins: np.ndarray, directions: np.ndarray, shape, lower_radius: float,
+          upper_radius: float) -> List[np.ndarray]:
+    if not shape.closed:
+        return []
+    dy = directions[:, 1]
+    parallel = np.abs(dy) < EPSILON
+    dy = np.where(parallel, np.nan, dy)
+    caps = []
+    for y, radius in ((shape.minimum, lower_radius), (shape.maximum, upper_radius)):
+        with np.errstate(invalid='ignore'):
+            t = (y - origins[:, 1]) / dy
+        x = origins[:, 0] + t * directions[:, 0]
+        z = origins[:, 2] + t * directions[:, 2]
+        caps.append(np.where(x * x + z * z <= radius, t, np.nan))
+    return caps
+
+
+def cylinder_intersections(origins: np.ndarray, directions: np.ndarray, cylinder: Cylinder) -> np.ndarray:
+    ox, oz = origins[:, 0], origins[:, 2]
+    dx, dz = directions[:, 0], directions[:, 2]
+    a = dx * dx + dz * dz
+    # rays parallel to the y axis only hit the caps
+    a = np.where(np.abs(a) < EPSILON, np.nan, a)
+    b = 2 * ox * dx + 2 * oz * dz
+    c = ox * ox + oz * oz - 1
+    with np.errstate(invalid='ignore'):
+        t0, t1 = _quadratic(a, b, c)
+        candidates = [_within(t0, origins, directions, cylinder.minimum, cylinder.maximum),
+                      _within(t1, origins, directions, cylinder.minimum, cylinder.maximum)]
+        candidates += _caps(origins, directions, cylinder, 1.0, 1.0)
+    return np.stack(candidates, axis=1)
+
+
+def cone_intersections(origins: np.ndarray, directions: np.ndarray, cone: Cone) -> np.ndarray:
+    ox, oy, oz = origins[:, 0], origins[:, 1], origins[:, 2]
+    dx, dy, dz = directions[:, 0], directions[:, 1], directions[:, 2]
+    a = dx * dx - dy * dy + dz * dz
+    b = 2 * ox * dx - 2 * oy * dy + 2 * oz * dz
+    c = ox * ox + oz * oz - oy * oy
+    parallel = np.abs(a) < EPSILON
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t0, t1 = _quadratic(np.where(parallel, np.nan, a), b, c)
+        # a ray parallel to one of the cone's halves hits the other half once, if at all
+        single = np.where(parallel & (np.abs(b) >= EPSILON), -c / (2 * b), np.nan)
+        candidates = [_within(t0, origins, directions, cone.minimum, cone.maximum),
+                      _within(t1, origins, directions, cone.minimum, cone.maximum), single]
+        candidates += _caps(origins, directions, cone, abs(cone.minimum), abs(cone.maximum))
+    return np.stack(candidates, axis=1)
+
+
+def triangle_intersections(origins: np.ndarray, directions: np.ndarray,
+                           triangle: Triangle) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # the t, u and v of every ray, with nan for rays missing the triangle
+    e1 = np.asarray(triangle.e1[:3], dtype=float)
+    e2 = np.asarray(triangle.e2[:3], dtype=float)
+    dir_cross_e2 = np.cross(directions, e2)
+    determinant = dir_cross_e2 @ e1
+    missed = np.abs(determinant) < EPSILON
+    f = 1.0 / np.where(missed, 1.0, determinant)
+    p1_to_origin = origins - np.asarray(triangle.p1[:3], dtype=float)
+    u = f * np.einsum('ij,ij->i', p1_to_origin, dir_cross_e2)
+    origin_cross_e1 = np.cross(p1_to_origin, e1)
+    v = f * np.einsum('ij,ij->i', directions, origin_cross_e1)
+    t = f * (origin_cross_e1 @ e2)
+    missed |= (u < 0) | (u > 1) | (v < 0) | (u + v > 1)
+    return np.where(missed, np.nan, t), u, v
+
+
+# the normal kernels take (n, 3) object space points, and follow _local_normal_at
+
+def _cube_normals(points: np.ndarray) -> np.ndarray:
+    # the component of the largest magnitude, preferring x over y over z like the scalar code
+    axis = np.argmax(np.abs(points), axis=1)
+    normals = np.zeros_like(points)
+    rows = np.arange(len(points))
+    normals[rows, axis] = points[rows, axis]
+    return normals
+
+
+def _cap_normals(shape, points: np.ndarray, sides: np.ndarray) -> np.ndarray:
+    dist = points[:, 0] ** 2 + points[:, 2] ** 2
+    top = (dist < 1) & (points[:, 1] >= shape.maximum - EPSILON)
+    bottom = (dist < 1) & (points[:, 1] <= shape.minimum + EPSILON) & ~top
+    normals = sides
+    normals[top] = (0, 1, 0)
+    normals[bottom] = (0, -1, 0)
+    return normals
+
+
+def _cylinder_normals(cylinder: Cylinder, points: np.ndarray) -> np.ndarray:
+    sides = points * np.array([1.0, 0.0, 1.0])
+    return _cap_normals(cylinder, points, sides)
+
+
+def _cone_normals(cone: Cone, points: np.ndarray) -> np.ndarray:
+    y = np.sqrt(points[:, 0] ** 2 + points[:, 2] ** 2)
+    sides = np.stack([points[:, 0], np.where(points[:, 1] > 0, -y, y), points[:, 2]], axis=1)
+    return _cap_normals(cone, points, sides)
+
+
+def _triangle_normals(triangle: Triangle, points: np.ndarray) -> np.ndarray:
+    if not isinstance(triangle, SmoothTriangle):
+        return np.broadcast_to(np.asarray(triangle.normal[:3], dtype=float), points.shape)
+    # u and v are the barycentric weights of p2 and p3, as found by triangle_intersections
+    e1 = np.asarray(triangle.e1[:3], dtype=float)
+    e2 = np.asarray(triangle.e2[:3], dtype=float)
+    p1_to_point = points - np.asarray(triangle.p1[:3], dtype=float)
+    d00, d01, d11 = e1 @ e1, e1 @ e2, e2 @ e2
+    d20, d21 = p1_to_point @ e1, p1_to_point @ e2
+    denominator = d00 * d11 - d01 * d01
+    u = ((d11 * d20 - d01 * d21) / denominator)[:, np.newaxis]
+    v = ((d00 * d21 - d01 * d20) / denominator)[:, np.newaxis]
+    n1, n2, n3 = (np.asarray(n[:3], dtype=float) for n in (triangle.n1, triangle.n2, triangle.n3))
+    return n2 * u + n3 * v + n1 * (1 - u - v)
+
+
+_Kernel = Callable[[Shape, np.ndarray, np.ndarray], np.ndarray]
+_KERNELS: Dict[type, _Kernel] = {
+    Sphere: lambda shape, o, d: sphere_intersections(o, d),
+    Plane: lambda shape, o, d: plane_intersections(o, d),
+    Cube: lambda shape, o, d: cube_intersections(o, d, shape.minimum, shape.maximum),
+    Cylinder: lambda shape, o, d: cylinder_intersections(o, d, shape),
+    Cone: lambda shape, o, d: cone_intersections(o, d, shape),
+    Triangle: lambda shape, o, d: triangle_intersections(o, d, shape)[0][:, np.newaxis],
+}
+
+
+_NORMALS: Dict[type, Callable[[Shape, np.ndarray], np.ndarray]] = {
+    Sphere: lambda shape, points: points - np.asarray(shape.origin[:3], dtype=float),
+    Plane: lambda shape, points: np.broadcast_to(np.array([0.0, 1.0, 0.0]), points.shape),
+    Cube: lambda shape, points: _cube_normals(points),
+    Cylinder: _cylinder_normals,
+    Cone: _cone_normals,
+    Triangle: _triangle_normals,
+}
+
+
+def _kernel_for(shape: Shape, kernels: dict = None):
+    kernels = _KERNELS if kernels is None else kernels
+    for cls in type(shape).__mro__:
+        kernel = kernels.get(cls)
+        if kernel is not None:
+            return kernel
+    raise ValueError(f'{type(shape).__name__} has no packet kernel')
+
+
+def nearest_hits(shape: Shape, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+    # the smallest non-negative t of every world space ray with the shape, inf when there is none
+    origins, directions = transform_rays(shape.world_to_object_matrix(), origins, directions)
+    ts = _kernel_for(shape)(shape, origins, directions)
+    with np.errstate(invalid='ignore'):
+        return np.where(ts >= 0, ts, np.inf).min(axis=1)
+
+
+def normals_at(shape: Shape, world_points: np.ndarray) -> np.ndarray:
+    # the unit world space normals of the shape at the world space points
+    m = np.array(shape.world_to_object_matrix().values, dtype=float)[:3]
+    local_points = world_points @ m[:, :3].T + m[:, 3]
+    normals = _kernel_for(shape, _NORMALS)(shape, local_points) @ m[:, :3]
+    return normals / np.linalg.norm(normals, axis=1)[:, np.newaxis]
+
+
+def packet_shapes(world: World) -> List[Shape]:
+    # the primitives of the world, for packets to be intersected with one at a time
+    shapes = []
+    for obj in world.objects:
+        for shape in obj.walk():
+            if not isinstance(shape, Group):
+                _kernel_for(shape)
+                shapes.append(shape)
+    return shapes
+
+
+def intersect_packet(shapes: List[Shape], origins: np.ndarray,
+                     directions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the nearest hit of every ray with any of the shapes: its t, inf when nothing was hit,
+    # and the index of the shape hit in shapes, -1 when nothing was hit
+    nearest = np.full(len(origins), np.inf)
+    ids = np.full(len(origins), -1, dtype=np.intp)
+    for index, shape in enumerate(shapes):
+        t = nearest_hits(shape, origins, directions)
+        closer = t < nearest
+        nearest[closer] = t[closer]
+        ids[closer] = index
+    return nearest, ids
@@ -1,9 +1,13 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
 from .matrices import Matrix
-from .shapes import Shape
+from .noise import PerlinNoise, default_noise
+from .shapes import Shape, Plane, Cube, Cylinder, Instance, InstancedShape
+from .textures import Texture, UvMapping
 from .tuples import Color, Point
 import math
+import numpy as np
 
 
 class Pattern(ABC):
@@ -11,16 +15,73 @@ class Pattern(ABC):
         self.first_color = first_color
         self.second_color = second_color
         self.transformation: Matrix = Matrix.identity()
+        # keyed by the shapes themselves. shapes of a prototype seen through an instance
+        # are short-lived wrappers, which compare and hash by their instance and shape
+        self._world_to_pattern: Dict[object, Tuple[tuple, Matrix]] = {}
+        self._inverted: Optional[Matrix] = None
+        self._inverse: Optional[Matrix] = None
+
+    def __getstate__(self):
+        # the cached matrices are left out of copies, they are found again on first use
+        state = self.__dict__.copy()
+        state['_world_to_pattern'] = {}
+        return state
+
+    @property
+    def inverse_transformation(self) -> Matrix:
+        if self._inverted is not self.transformation:
+            self._inverse = self.transformation.inverse()
+            self._inverted = self.transformation
+        return self._inverse
 
     def pattern_at_shape(self, shape: Shape, world_point: Point) -> Color:
-        object_point = shape.world_to_object(world_point)
-        pattern_point = self.transformation.inverse() * object_point
+        pattern_point = self.world_to_pattern(shape) * world_point
         return self.pattern_at(pattern_point)
 
+    def pattern_at_shape_many(self, shape: Shape, world_points: np.ndarray) -> np.ndarray:
+        pattern_points = _transform_points(self.world_to_pattern(shape), world_points)
+        return self.pattern_at_many(pattern_points)
+
+    def world_to_pattern(self, shape: Shape) -> Matrix:
+        # the combined matrix stays valid for as long as neither the pattern's transformation
+        # nor any transformation from the shape up to the world is replaced
+        chain = (self.transformation,) + shape.transformation_chain()
+        cached = self._world_to_pattern.get(shape)
+        if cached is None or not _same_matrices(cached[0], chain):
+            matrix = self.inverse_transformation * shape.world_to_object_matrix()
+            cached = (chain, matrix)
+            self._world_to_pattern[shape] = cached
+        return cached[1]
+
     @abstractmethod
     def pattern_at(self, point: Point) -> Color:
         ...
 
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        # evaluates an (n, 3) array of pattern space points to an (n, 3) array of colors.
+        # patterns without a vectorized implementation fall back to one call per point
+        return np.array([self.pattern_at(Point(x, y, z)) for x, y, z in points[:, :3]], dtype=float).reshape(-1, 3)
+
+
+def _same_matrices(chain1: tuple, chain2: tuple) -> bool:
+    return len(chain1) == len(chain2) and all(m1 is m2 for m1, m2 in zip(chain1, chain2))
+
+
+def _transform_points(matrix: Matrix, points: np.ndarray) -> np.ndarray:
+    m = np.array(matrix.values, dtype=float)
+    return points[:, :3] @ m[:3, :3].T + m[:3, 3]
+
+
+def _alternate(pattern: Pattern, even: np.ndarray) -> np.ndarray:
+    return np.where(even[:, np.newaxis], np.array(pattern.first_color, dtype=float),
+                    np.array(pattern.second_color, dtype=float))
+
+
+def _blend(pattern: Pattern, fraction: np.ndarray) -> np.ndarray:
+    first = np.array(pattern.first_color, dtype=float)
+    distance = np.array(pattern.second_color, dtype=float) - first
+    return first + distance * fraction[:, np.newaxis]
+
 
 class StripePattern(Pattern):
     def pattern_at(self, point: Point) -> Color:
@@ -29,6 +90,9 @@ class StripePattern(Pattern):
         else:
             return self.second_color
 
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        return _alternate(self, np.floor(points[:, 0]) % 2 == 0)
+
 
 class GradientPattern(Pattern):
     def pattern_at(self, point: Point) -> Color:
@@ -36,6 +100,10 @@ class GradientPattern(Pattern):
         fraction = point.x - math.floor(point.x)
         return self.first_color + distance * fraction
 
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        x = points[:, 0]
+        return _blend(self, x - np.floor(x))
+
 
 class RingPattern(Pattern):
     def pattern_at(self, point: Point) -> Color:
@@ -44,6 +112,10 @@ class RingPattern(Pattern):
         else:
             return self.second_color
 
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        x, z = points[:, 0], points[:, 2]
+        return _alternate(self, np.floor(np.sqrt(x * x + z * z)) % 2 == 0)
+
 
 class CheckersPattern(Pattern):
     def pattern_at(self, point: Point) -> Color:
@@ -52,6 +124,9 @@ class CheckersPattern(Pattern):
         else:
             return self.second_color
 
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        return _alternate(self, np.floor(points[:, :3]).sum(axis=1) % 2 == 0)
+
 
 class RadialGradientPattern(Pattern):
     def pattern_at(self, point: Point) -> Color:
@@ -59,3 +134,115 @@ class RadialGradientPattern(Pattern):
         position = math.sqrt(point.x * point.x + point.z * point.z)
         fraction = position - math.floor(position)
         return self.first_color + distance * fraction
+
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        x, z = points[:, 0], points[:, 2]
+        position = np.sqrt(x * x + z * z)
+        return _blend(self, position - np.floor(position))
+
+
+def _mix(pattern: Pattern, fraction: float) -> Color:
+    return pattern.first_color + (pattern.second_color - pattern.first_color) * fraction
+
+
+class NoisePattern(Pattern):
+    def __init__(self, first_color: Color, second_color: Color, noise: PerlinNoise = default_noise):
+        super().__init__(first_color, second_color)
+        self.noise = noise
+
+    def pattern_at(self, point: Point) -> Color:
+        n = self.noise.noise(point.x, point.y, point.z)
+        return _mix(self, min(max((n + 1) / 2, 0.0), 1.0))
+
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        n = self.noise.noise_many(points)
+        return _blend(self, np.clip((n + 1) / 2, 0.0, 1.0))
+
+
+class TurbulencePattern(Pattern):
+    def __init__(self, first_color: Color, second_color: Color, octaves: int = 4, turbulent: bool = True,
+                 noise: PerlinNoise = default_noise):
+        super().__init__(first_color, second_color)
+        self.octaves = octaves
+        self.turbulent = turbulent
+        self.noise = noise
+        # sum of the amplitudes of all octaves, used to bring the fbm value back to [-1, 1]
+        self._amplitude = sum(0.5 ** octave for octave in range(octaves))
+
+    def _fraction(self, value: float) -> float:
+        value = value / self._amplitude
+        return value if self.turbulent else (value + 1) / 2
+
+    def pattern_at(self, point: Point) -> Color:
+        value = self.noise.fbm(point.x, point.y, point.z, self.octaves, turbulent=self.turbulent)
+        return _mix(self, min(max(self._fraction(value), 0.0), 1.0))
+
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        values = self.noise.fbm_many(points, self.octaves, turbulent=self.turbulent)
+        return _blend(self, np.clip(self._fraction(values), 0.0, 1.0))
+
+
+class PerturbedPattern(Pattern):
+    def __init__(self, pattern: Pattern, scale: float = 0.2, noise: PerlinNoise = default_noise):
+        super().__init__(pattern.first_color, pattern.second_color)
+        self.pattern = pattern
+        self.scale = scale
+        self.noise = noise
+
+    def pattern_at(self, point: Point) -> Color:
+        # jitter each coordinate by noise sampled at a different offset, before
+        # handing the point to the wrapped pattern in its own pattern space
+        x, y, z = point.x, point.y, point.z
+        jittered = Point(x + self.noise.noise(x, y, z) * self.scale,
+                         y + self.noise.noise(x, y, z + 1) * self.scale,
+                         z + self.noise.noise(x, y, z + 2) * self.scale)
+        return self.pattern.pattern_at(self.pattern.inverse_transformation * jittered)
+
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        points = points[:, :3]
+        jitter = np.stack([self.noise.noise_many(points + offset) for offset in ((0, 0, 0), (0, 0, 1), (0, 0, 2))],
+                          axis=1)
+        jittered = points + jitter * self.scale
+        return self.pattern.pattern_at_many(_transform_points(self.pattern.inverse_transformation, jittered))
+
+
+def _mapping_for(shape: Shape) -> UvMapping:
+    # shapes of a prototype are mapped like the prototype's own shapes
+    if isinstance(shape, InstancedShape):
+        shape = shape.shape
+    elif isinstance(shape, Instance):
+        shape = shape.prototype
+    if isinstance(shape, Plane):
+        return UvMapping.PLANAR
+    elif isinstance(shape, Cylinder):
+        return UvMapping.CYLINDRICAL
+    elif isinstance(shape, Cube):
+        return UvMapping.CUBIC
+    return UvMapping.SPHERICAL
+
+
+class TexturePattern(Pattern):
+    def __init__(self, texture: Texture, mapping: UvMapping = None, lod: float = 0.0):
+        super().__init__(Color.black(), Color.white())
+        self.texture = texture
+        # without an explicit mapping, the one fitting the textured shape is used
+        self.mapping = mapping
+        # the mipmap level to sample from, fractional levels blend the two closest levels
+        self.lod = lod
+
+    def pattern_at_shape(self, shape: Shape, world_point: Point) -> Color:
+        u, v = (self.mapping or _mapping_for(shape)).map(self.world_to_pattern(shape) * world_point)
+        return self.texture.sample(u, v, self.lod)
+
+    def pattern_at_shape_many(self, shape: Shape, world_points: np.ndarray) -> np.ndarray:
+        u, v = (self.mapping or _mapping_for(shape)).map_many(
+            _transform_points(self.world_to_pattern(shape), world_points))
+        return self.texture.sample_many(u, v, self.lod)
+
+    def pattern_at(self, point: Point) -> Color:
+        u, v = (self.mapping or UvMapping.SPHERICAL).map(point)
+        return self.texture.sample(u, v, self.lod)
+
+    def pattern_at_many(self, points: np.ndarray) -> np.ndarray:
+        u, v = (self.mapping or UvMapping.SPHERICAL).map_many(points)
+        return self.texture.sample_many(u, v, self.lod)
@@ -1,5 +1,8 @@
+from functools import cached_property
+from . import INF
 from .matrices import Matrix
 from .tuples import Point, Vector
+import math
 
 
 class Ray:
@@ -13,4 +16,12 @@ class Ray:
     def transform(self, transformation: Matrix):
         return Ray(transformation * self.origin, transformation * self.direction)
 
+    # both are computed once per ray, for all the bounding boxes it is tested against
+    @cached_property
+    def inverse_direction(self) -> (float, float, float):
+        return tuple(1.0 / c if c != 0 else math.copysign(INF, c) for c in self.direction[:3])
 
+    @cached_property
+    def signs(self) -> (int, int, int):
+        # 1 for the axes the ray runs towards negative infinity along
+        return tuple(int(c < 0) for c in self.inverse_direction)
@@ -0,0 +1,51 @@
+_MASK = (1 << 64) - 1
+_GOLDEN = 0x9e3779b97f4a7c15
+# the bases of the halton sequences used for the first dimensions of every sample
+_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53)
+
+
+def _mix(z: int) -> int:
+    # the splitmix64 finalizer, spreading every input bit over the whole 64 bit output
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & _MASK
+    return z ^ (z >> 31)
+
+
+def hash_key(*values: int) -> int:
+    h = 0
+    for value in values:
+        h = _mix((h + value + _GOLDEN) & _MASK)
+    return h
+
+
+def _to_unit(h: int) -> float:
+    # the top 53 bits as a float in [0, 1)
+    return (h >> 11) * (1.0 / (1 << 53))
+
+
+def radical_inverse(index: int, base: int) -> float:
+    # the digits of index in base, mirrored around the decimal point
+    result, fraction = 0.0, 1.0 / base
+    while index > 0:
+        index, digit = divmod(index, base)
+        result += digit * fraction
+        fraction /= base
+    return result
+
+
+class Sampler:
+    # random numbers in [0, 1) that only depend on what they are for: the pixel, the sample
+    # within the pixel and the dimension, meaning how many numbers that sample used before.
+    # nothing is carried over from one number to the next, so images come out the same however
+    # their pixels are divided over tiles, threads or processes, and in whatever order.
+    # the first dimensions follow halton sequences over the samples of a pixel, shifted by a
+    # random offset per pixel, so a pixel's samples are spread evenly; the others are hashed
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    def sample(self, x: int, y: int, index: int, dimension: int) -> float:
+        if dimension < len(_PRIMES):
+            offset = _to_unit(hash_key(self.seed, x, y, dimension))
+            value = radical_inverse(index, _PRIMES[dimension]) + offset
+            return value - 1.0 if value >= 1.0 else value
+        return _to_unit(hash_key(self.seed, x, y, index, dimension))
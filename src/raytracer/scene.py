@@ -1,69 +1,235 @@
-from .intersections import Intersections, Computations
+from __future__ import annotations
+from .intersections import Intersection, Intersections, Computations
+from .materials import Material, MaterialFeatures, MaterialLighting
 from .rays import Ray
+from .sampling import Sampler
+from .shapes import Instance, Shape
 from .tuples import Color, Point, dot
+from dataclasses import dataclass
 from math import sqrt
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+
+@dataclass
+class RayStatistics:
+    secondary_rays: int = 0
+    terminated_rays: int = 0
+
+
+def _shapes_of(objects) -> Iterator[Shape]:
+    # every shape in the scene, where the shapes of a prototype only count once
+    # however many instances of it there are
+    prototypes = {}
+    for obj in objects:
+        for shape in obj.walk():
+            yield shape
+            if isinstance(shape, Instance) and id(shape.prototype) not in prototypes:
+                prototypes[id(shape.prototype)] = shape.prototype
+    for prototype in prototypes.values():
+        yield from _shapes_of([prototype])
+
+
+def _materials_of(objects) -> Iterator[Material]:
+    # the materials of every shape, and the materials instances replace them with
+    for shape in _shapes_of(objects):
+        yield shape.material
+        if isinstance(shape, Instance) and shape.material_override is not None:
+            yield shape.material_override
 
 
 class World:
     def __init__(self):
         self.objects = []
         self.light_source = None
+        # keyed by the id of the material, which each entry holds on to along with the
+        # version of the material it was recorded for
+        self._material_features: Optional[Dict[int, Tuple[Material, int, MaterialFeatures]]] = None
+        self._material_lighting: Dict[int, MaterialLighting] = {}
+        self._transparent = True
+        # reflected and refracted rays contributing less than this fraction of a pixel's
+        # color are not traced. with russian roulette, some of them are traced anyway
+        # and weighted up, which keeps the image unbiased on average
+        self.min_contribution = 0.001
+        self.russian_roulette = False
+        self.statistics = RayStatistics()
+        # random decisions draw from the sampler, keyed by the pixel sample being traced
+        # and by how many numbers that sample used so far
+        self.sampler = Sampler()
+        self._sample = (0, 0, 0)
+        self._dimension = 0
+        # when set, collects the ids of the objects intersected by any ray traced
+        self.touched_objects: Optional[Set[int]] = None
+
+    def __getstate__(self):
+        # a copy of the world is sent uncompiled, compiling it again is up to its receiver
+        state = self.__dict__.copy()
+        state['_material_features'] = None
+        state['_material_lighting'] = {}
+        state['touched_objects'] = None
+        return state
 
     def add(self, *objects):
         self.objects.extend(objects)
+        self._material_features = None
+        self._material_lighting = {}
+
+    def optimize(self) -> None:
+        # simplifies csg trees in the scene using the bounds of their operands,
+        # which may replace objects of the world with one of their operands or a group
+        self.objects = [obj.optimize() for obj in self.objects]
+        self._material_features = None
+        self._material_lighting = {}
+
+    def compile(self) -> None:
+        # record which shading features each material uses, so shading can skip
+        # whole branches, precompute the lighting terms of every material, and flatten
+        # every object hierarchy to world space matrices. materials changed afterwards
+        # are shaded without the recorded features until the world is compiled again
+        features = {}
+        lighting = {}
+        for obj in self.objects:
+            obj.flatten()
+        for material in _materials_of(self.objects):
+            features[id(material)] = (material, material.version, material.features())
+            if self.light_source is not None:
+                lighting[id(material)] = MaterialLighting(material, self.light_source)
+        self._material_features = features
+        self._material_lighting = lighting
+        self._transparent = any(feature.refractive for _, _, feature in features.values())
+
+    @property
+    def compiled(self) -> bool:
+        return self._material_features is not None
+
+    def _features_of(self, material: Material) -> MaterialFeatures:
+        if self._material_features is not None:
+            cached = self._material_features.get(id(material))
+            if cached is not None and cached[0] is material and cached[1] == material.version:
+                return cached[2]
+        return material.features()
+
+    def _lighting_of(self, material: Material) -> MaterialLighting:
+        lighting = self._material_lighting.get(id(material))
+        if lighting is not None and lighting.current(material, self.light_source):
+            return lighting
+        return MaterialLighting(material, self.light_source)
 
     def intersect(self, ray: Ray) -> Intersections:
-        results = []
+        results = Intersections()
         for obj in self.objects:
-            results += obj.intersect(ray)
-        return Intersections(*results)
+            xs = obj.intersect(ray)
+            if self.touched_objects is not None and xs.count:
+                self.touched_objects.add(id(obj))
+            results.extend(xs)
+        return results
 
-    def shade_hit(self, comps: Computations, remaining: int = 4):
-        shadowed = self.is_shadowed(comps.over_point)
-        surface = comps.object.material.lighting(comps.object, self.light_source, comps.point, comps.eyev,
-                                                 comps.normalv, shadowed)
-        reflected = self.reflected_color(comps, remaining)
-        refracted = self.refracted_color(comps, remaining)
+    def _closest_hit(self, ray: Ray) -> Optional[Intersection]:
+        hit = None
+        for obj in self.objects:
+            xs = obj.intersect(ray)
+            if self.touched_objects is not None and xs.count:
+                self.touched_objects.add(id(obj))
+            i = xs.hit()
+            if i is not None and (hit is None or i.t < hit.t):
+                hit = i
+        return hit
 
+    def shade_hit(self, comps: Computations, remaining: int = 4, weight: float = 1.0):
         material = comps.object.material
-        if material.reflective > 0 and material.transparency > 0:
+        features = self._features_of(material)
+
+        shadowed = self.is_shadowed(comps.over_point)
+        surface = self._lighting_of(material)(comps.object, comps.point, comps.eyev, comps.normalv, shadowed)
+
+        if features.reflective and features.refractive:
             reflectance = comps.schlick()
+            reflected = self.reflected_color(comps, remaining, weight * reflectance)
+            refracted = self.refracted_color(comps, remaining, weight * (1 - reflectance))
             return surface + reflected * reflectance + refracted * (1 - reflectance)
+        elif features.reflective:
+            return surface + self.reflected_color(comps, remaining, weight)
+        elif features.refractive:
+            return surface + self.refracted_color(comps, remaining, weight)
         else:
-            return surface + reflected + refracted
+            return surface
+
+    def color_at(self, ray: Ray, remaining: int = 4, weight: float = 1.0) -> Color:
+        if self.compiled and not self._transparent:
+            # without transparent objects n1 and n2 are never needed, so there is
+            # no need to collect and sort all intersections along the ray
+            hit = self._closest_hit(ray)
+            if not hit:
+                return Color.black()
+            # unless the material was made transparent since the world was compiled
+            if not self._features_of(hit.object.material).refractive:
+                return self.shade_hit(hit.prepare_computations(ray), remaining, weight)
 
-    def color_at(self, ray: Ray, remaining: int = 4) -> Color:
         xs = self.intersect(ray)
         hit = xs.hit()
         if not hit:
             return Color.black()
         comps = hit.prepare_computations(ray, xs)
-        return self.shade_hit(comps, remaining)
+        return self.shade_hit(comps, remaining, weight)
 
     def is_shadowed(self, point: Point) -> bool:
         v = self.light_source.position - point
         distance = v.magnitude
         direction = v.normalize()
 
+        # any intersection between the point and the light will do, not just the closest one
         r = Ray(point, direction)
-        xs = self.intersect(r)
-        hit = xs.hit()
+        for obj in self.objects:
+            xs = obj.intersect(r)
+            if self.touched_objects is not None and xs.count:
+                self.touched_objects.add(id(obj))
+            hit = xs.hit()
+            if hit is not None and hit.t < distance:
+                return True
+        return False
 
-        return hit is not None and hit.t < distance
+    def start_sample(self, x: int, y: int, index: int = 0) -> None:
+        # called by the camera before tracing a sample of pixel x, y
+        self._sample = (x, y, index)
+        self._dimension = 0
 
-    def reflected_color(self, comps: Computations, remaining: int = 4) -> Color:
+    def next_sample(self) -> float:
+        x, y, index = self._sample
+        value = self.sampler.sample(x, y, index, self._dimension)
+        self._dimension += 1
+        return value
+
+    def _survival_factor(self, weight: float) -> Optional[float]:
+        # returns what a secondary ray's color needs to be scaled by,
+        # or None when the ray contributes too little to be traced
+        if weight >= self.min_contribution:
+            return 1.0
+        if self.russian_roulette:
+            survival = weight / self.min_contribution
+            if self.next_sample() < survival:
+                return 1.0 / survival
+        self.statistics.terminated_rays += 1
+        return None
+
+    def reflected_color(self, comps: Computations, remaining: int = 4, weight: float = 1.0) -> Color:
         if remaining <= 0:
             return Color.black()
 
         if comps.object.material.reflective == 0.0:
             return Color.black()
 
+        # the weight is the fraction of the pixel's color the reflected ray contributes
+        weight *= comps.object.material.reflective
+        factor = self._survival_factor(weight)
+        if factor is None:
+            return Color.black()
+
+        self.statistics.secondary_rays += 1
         reflect_ray = Ray(comps.over_point, comps.reflectv)
-        color = self.color_at(reflect_ray, remaining - 1)
+        color = self.color_at(reflect_ray, remaining - 1, weight * factor)
 
-        return color * comps.object.material.reflective
+        return color * comps.object.material.reflective * factor
 
-    def refracted_color(self, comps: Computations, remaining: int = 4) -> Color:
+    def refracted_color(self, comps: Computations, remaining: int = 4, weight: float = 1.0) -> Color:
         if remaining <= 0:
             return Color.black()
 
@@ -79,8 +245,16 @@ class World:
         if sin2_t > 1.0:
             return Color.black()
 
+        weight *= comps.object.material.transparency
+        factor = self._survival_factor(weight)
+        if factor is None:
+            return Color.black()
+
+        self.statistics.secondary_rays += 1
         cos_t = sqrt(1.0 - sin2_t)
         direction = comps.normalv * (n_ratio * cos_i - cos_t) - comps.eyev * n_ratio
         refracted_ray = Ray(comps.under_point, direction)
 
-        return self.color_at(refracted_ray, remaining - 1) * comps.object.material.transparency
+        color = self.color_at(refracted_ray, remaining - 1, weight * factor)
+
+        return color * comps.object.material.transparency * factor
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import List, Optional
+from typing import Iterator, List, Optional, Set
 from . import EPSILON, INF
 from .intersections import Intersection, Intersections
 from .materials import Material
@@ -10,17 +10,107 @@ from .rays import Ray
 from .tuples import Point, Vector, dot, cross
 import itertools
 import math
+import numpy as np
+
+# groups intersect their triangles in one vectorized pass from this many triangles on
+TRIANGLE_ARRAY_THRESHOLD = 4
+
+
+def _geometry_property(name: str) -> property:
+    # an attribute of a shape's geometry, which invalidates what's cached from it when set
+    attribute = '_' + name
+
+    def getter(self):
+        return getattr(self, attribute)
+
+    def setter(self, value):
+        setattr(self, attribute, value)
+        self._geometry_changed()
+    return property(getter, setter)
 
 
 class Shape(ABC):
+    # the attributes of the geometry besides the transformation, see _geometry_property
+    geometry_attributes: tuple = ()
+
     def __init__(self):
         self.origin = Point(0, 0, 0)
-        self.transformation = Matrix.identity()
+        self._transformation = Matrix.identity()
         self.material = Material()
         self.parent: Optional[Shape] = None
+        self._inverted: Optional[Matrix] = None
+        self._inverse: Optional[Matrix] = None
+        # set by flatten(): the matrices taking world space straight to object space and
+        # object space normals straight to world space, whatever the nesting depth
+        self._world_to_object: Optional[Matrix] = None
+        self._normal_to_world: Optional[Matrix] = None
+
+    @property
+    def transformation(self) -> Matrix:
+        return self._transformation
+
+    @transformation.setter
+    def transformation(self, matrix: Matrix):
+        self._transformation = matrix
+        self.unflatten()
+        if self.parent is not None:
+            self.parent.invalidate_bounds()
+
+    def invalidate_bounds(self) -> None:
+        # called when the bounds of this shape changed, so any bounds cached by the
+        # ancestors are recomputed, bottom-up, the next time they are needed
+        if self.parent is not None:
+            self.parent.invalidate_bounds()
+
+    def _geometry_changed(self) -> None:
+        # like a new transformation, changed geometry outdates the bounds and world space
+        # boxes cached from this shape up
+        self.unflatten()
+        self.invalidate_bounds()
+
+    @property
+    def flattened(self) -> bool:
+        return self._world_to_object is not None
+
+    def flatten(self) -> None:
+        # precomputes the world space matrices of this shape and all of its descendants.
+        # flattened shapes intersect world space rays, so only whole hierarchies can be flattened
+        if self.parent is not None and not self.parent.flattened:
+            raise ValueError('only a shape without parent or with a flattened parent can be flattened')
+        for shape in self.walk():
+            shape._flatten_self()
+
+    def _flatten_self(self) -> None:
+        world_to_object = self.inverse_transformation
+        if self.parent:
+            world_to_object = world_to_object * self.parent.world_to_object_matrix()
+        self._world_to_object = world_to_object
+        self._normal_to_world = world_to_object.transpose()
+
+    def unflatten(self) -> None:
+        # a change anywhere in a flattened hierarchy invalidates it as a whole
+        if not self.flattened:
+            return
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        for shape in root.walk():
+            shape._world_to_object = None
+            shape._normal_to_world = None
+
+    @property
+    def inverse_transformation(self) -> Matrix:
+        # the inverse stays valid for as long as the same transformation matrix is assigned
+        if self._inverted is not self.transformation:
+            self._inverse = self.transformation.inverse()
+            self._inverted = self.transformation
+        return self._inverse
 
     def intersect(self, ray: Ray) -> Intersections:
-        local_ray = ray.transform(self.transformation.inverse())
+        if self._world_to_object is not None:
+            # flattened shapes are given the world space ray by their parent
+            return self._local_intersect(ray.transform(self._world_to_object))
+        local_ray = ray.transform(self.inverse_transformation)
         return self._local_intersect(local_ray)
 
     @abstractmethod
@@ -37,12 +127,32 @@ class Shape(ABC):
         ...
 
     def world_to_object(self, point: Point) -> Point:
+        if self._world_to_object is not None:
+            return self._world_to_object * point
         if self.parent:
             point = self.parent.world_to_object(point)
-        return self.transformation.inverse() * point
+        return self.inverse_transformation * point
+
+    def world_to_object_matrix(self) -> Matrix:
+        if self._world_to_object is not None:
+            return self._world_to_object
+        if self.parent:
+            return self.inverse_transformation * self.parent.world_to_object_matrix()
+        return self.inverse_transformation
+
+    def transformation_chain(self) -> tuple:
+        # the transformations from this shape up to the world, which together
+        # determine every world space to object space conversion
+        if self.parent:
+            return (self.transformation,) + self.parent.transformation_chain()
+        return self.transformation,
 
     def normal_to_world(self, normal: Vector) -> Vector:
-        x, y, z, _ = self.transformation.inverse().transpose() * normal
+        if self._normal_to_world is not None:
+            x, y, z, _ = self._normal_to_world * normal
+            return Vector(x, y, z).normalize()
+
+        x, y, z, _ = self.inverse_transformation.transpose() * normal
         normal = Vector(x, y, z).normalize()
 
         if self.parent:
@@ -60,6 +170,17 @@ class Shape(ABC):
     def includes(self, shape: Shape) -> bool:
         return self == shape
 
+    def walk(self) -> Iterator[Shape]:
+        yield self
+
+    def divide(self, threshold: int) -> None:
+        pass
+
+    def optimize(self) -> Shape:
+        # returns the shape to use in place of this one, with csg nodes the bounds of
+        # their operands show to be redundant taken out
+        return self
+
 
 class Sphere(Shape):
     def __init__(self):
@@ -185,6 +306,11 @@ def _calculate_intersections(a: float, b: float, c: float, ray: Ray, _object) ->
 
 
 class Cylinder(Shape):
+    geometry_attributes = ('minimum', 'maximum', 'closed')
+    minimum = _geometry_property('minimum')
+    maximum = _geometry_property('maximum')
+    closed = _geometry_property('closed')
+
     def __init__(self, closed: bool = False):
         super().__init__()
         self.minimum = -INF
@@ -237,6 +363,11 @@ class Cylinder(Shape):
 
 
 class Cone(Shape):
+    geometry_attributes = ('minimum', 'maximum', 'closed')
+    minimum = _geometry_property('minimum')
+    maximum = _geometry_property('maximum')
+    closed = _geometry_property('closed')
+
     def __init__(self, closed: bool = False):
         super().__init__()
         self.minimum = -INF
@@ -299,15 +430,41 @@ class Group(Shape):
         super().__init__()
         self._collection: List[Shape] = []
         self.name = name
+        self._world_bounds: Optional[BoundingBox] = None
+        self._bounds: Optional[BoundingBox] = None
+        # children with finite bounds, the box around them, and children without finite bounds
+        self._split: Optional[(List[Shape], BoundingBox, List[Shape])] = None
+        # the untransformed triangles among the bounded children as arrays, and the other ones.
+        # like the bounds, both are cleared when a child's transformation or geometry changes
+        self._mesh: Optional[(Optional[TriangleArrays], List[Shape])] = None
 
     @property
     def empty(self):
         return len(self._collection) == 0
 
+    @property
+    def count(self):
+        return len(self._collection)
+
     def add_children(self, *children: Shape):
+        self.unflatten()
         for child in children:
+            child.unflatten()
             child.parent = self
             self._collection.append(child)
+        self.invalidate_bounds()
+
+    def remove_child(self, child: Shape) -> None:
+        self.unflatten()
+        self._collection.remove(child)
+        child.parent = None
+        self.invalidate_bounds()
+
+    def invalidate_bounds(self) -> None:
+        self._bounds = None
+        self._split = None
+        self._mesh = None
+        super().invalidate_bounds()
 
     def __getitem__(self, index) -> Shape:
         return self._collection[index]
@@ -315,24 +472,202 @@ class Group(Shape):
     def _local_normal_at(self, point: Point, hit: Intersection = None) -> Vector:
         raise NotImplementedError
 
+    def _flatten_self(self) -> None:
+        super()._flatten_self()
+        _, box, _ = self.split_children()
+        self._world_bounds = box.transform(self._world_to_object.inverse())
+
+    def intersect(self, ray: Ray) -> Intersections:
+        if self._world_to_object is None:
+            return super().intersect(ray)
+
+        # flattened children transform the world space ray themselves
+        return self._intersect_children(ray, self._world_bounds)
+
     def _local_intersect(self, ray: Ray) -> Intersections:
-        xs = Intersections()
-        if self.bounds().intersect(ray).count == 0:
-            return xs
+        _, box, _ = self.split_children()
+        return self._intersect_children(ray, box)
 
-        for _object in self:
-            xs.extend(_object.intersect(ray), to_sort=False)
-        xs.sort()
+    def _intersect_children(self, ray: Ray, box: BoundingBox) -> Intersections:
+        # box only surrounds the bounded children, the unbounded ones are always tested
+        bounded, _, unbounded = self.split_children()
+        xs = Intersections()
+        if bounded and box.slab_test(ray) is not None:
+            triangles, others = self.mesh_children()
+            if triangles is not None:
+                # the triangles are in the space of the group, not in world space
+                local_ray = ray if self._world_to_object is None else ray.transform(self._world_to_object)
+                xs.extend(triangles.intersect(local_ray))
+            for _object in others:
+                xs.extend(_object.intersect(ray))
+        for _object in unbounded:
+            xs.extend(_object.intersect(ray))
         return xs
 
+    def split_children(self) -> (List[Shape], BoundingBox, List[Shape]):
+        # planes and open cylinders or cones would stretch the box of the group to infinity,
+        # and with it the box would no longer rule out any of the other children
+        if self._split is None:
+            bounded, box, unbounded = [], BoundingBox(), []
+            for child in self:
+                child_box = child.parent_space_bounds()
+                if child_box.finite:
+                    bounded.append(child)
+                    box.merge(child_box)
+                else:
+                    unbounded.append(child)
+            self._split = (bounded, box, unbounded)
+        return self._split
+
+    def mesh_children(self) -> (Optional[TriangleArrays], List[Shape]):
+        # the leaves of a divided mesh are mostly triangles without a transformation of their own,
+        # which share the space of the group and can be intersected all at once
+        if self._mesh is None:
+            bounded, _, _ = self.split_children()
+            identity = Matrix.identity().values
+            triangles, others = [], []
+            for child in bounded:
+                if isinstance(child, Triangle) and child.transformation.values == identity:
+                    triangles.append(child)
+                else:
+                    others.append(child)
+            if len(triangles) < TRIANGLE_ARRAY_THRESHOLD:
+                self._mesh = (None, bounded)
+            else:
+                self._mesh = (TriangleArrays(triangles), others)
+        return self._mesh
+
     def bounds(self) -> BoundingBox:
-        box = BoundingBox()
+        if self._bounds is None:
+            box = BoundingBox()
+            for child in self:
+                box.merge(child.parent_space_bounds())
+            self._bounds = box
+        return self._bounds
+
+    def includes(self, shape: Shape) -> bool:
+        return any(child.includes(shape) for child in self)
+
+    def partition_children(self) -> (List[Shape], List[Shape]):
+        # moves the children fitting entirely in either half of the bounds out of the group.
+        # only the bounded children are divided, the unbounded ones stay in the group
+        _, box, _ = self.split_children()
+        left_box, right_box = box.split_bounds()
+        left, right = [], []
+        for child in list(self):
+            child_box = child.parent_space_bounds()
+            if left_box.contains_box(child_box):
+                left.append(child)
+            elif right_box.contains_box(child_box):
+                right.append(child)
+        for child in left + right:
+            self.remove_child(child)
+        return left, right
+
+    def make_subgroup(self, *children: Shape) -> None:
+        subgroup = Group()
+        subgroup.add_children(*children)
+        self.add_children(subgroup)
+
+    def divide(self, threshold: int) -> None:
+        # turns the group into a bounding volume hierarchy of nested groups
+        if threshold <= self.count:
+            left, right = self.partition_children()
+            if left:
+                self.make_subgroup(*left)
+            if right:
+                self.make_subgroup(*right)
         for child in self:
-            box.merge(child.parent_space_bounds())
-        return box
+            child.divide(threshold)
+
+    def optimize(self) -> Shape:
+        changed = False
+        for index, child in enumerate(self._collection):
+            optimized = child.optimize()
+            if optimized is not child:
+                optimized.parent = self
+                self._collection[index] = optimized
+                changed = True
+        if changed:
+            self.unflatten()
+            self.invalidate_bounds()
+        return self
+
+    def walk(self) -> Iterator[Shape]:
+        yield self
+        for child in self:
+            yield from child.walk()
+
+
+class Instance(Shape):
+    # places a shared prototype shape, group or mesh, with its own transformation and
+    # optionally its own material, without copying any of the prototype's shapes
+    def __init__(self, prototype: Shape, material: Material = None):
+        super().__init__()
+        if prototype.parent is not None:
+            raise ValueError('a prototype must not have a parent')
+        self.prototype = prototype
+        self.material_override = material
+
+    def _flatten_self(self) -> None:
+        super()._flatten_self()
+        # the prototype is flattened in its own space once, for all of its instances
+        if not self.prototype.flattened:
+            self.prototype.flatten()
+
+    def _local_intersect(self, ray: Ray) -> Intersections:
+        xs = self.prototype.intersect(ray)
+        return Intersections(*[Intersection(i.t, InstancedShape(self, i.object), i.u, i.v) for i in xs])
+
+    def _local_normal_at(self, point: Point, hit: Intersection = None) -> Vector:
+        raise NotImplementedError
+
+    def bounds(self) -> BoundingBox:
+        return self.prototype.parent_space_bounds()
 
     def includes(self, shape: Shape) -> bool:
-        return any([child.includes(shape) for child in self])
+        return isinstance(shape, InstancedShape) and shape.instance is self
+
+    def optimize(self) -> Shape:
+        prototype = self.prototype.optimize()
+        if prototype is not self.prototype:
+            self.prototype = prototype
+            self.unflatten()
+            self.invalidate_bounds()
+        return self
+
+
+class InstancedShape:
+    # a shape of a prototype as seen through one of its instances, as the object of an intersection
+    __slots__ = ('instance', 'shape')
+
+    def __init__(self, instance: Instance, shape: Shape):
+        self.instance = instance
+        self.shape = shape
+
+    @property
+    def material(self) -> Material:
+        return self.instance.material_override or self.shape.material
+
+    def normal_at(self, world_point: Point, hit: Intersection = None) -> Vector:
+        local_point = self.instance.world_to_object(world_point)
+        local_normal = self.shape.normal_at(local_point, hit)
+        return self.instance.normal_to_world(local_normal)
+
+    def world_to_object_matrix(self) -> Matrix:
+        return self.shape.world_to_object_matrix() * self.instance.world_to_object_matrix()
+
+    def transformation_chain(self) -> tuple:
+        return self.shape.transformation_chain() + self.instance.transformation_chain()
+
+    def __eq__(self, other):
+        return isinstance(other, InstancedShape) and self.instance is other.instance and self.shape is other.shape
+
+    def __hash__(self):
+        return hash((id(self.instance), id(self.shape)))
+
+    def __repr__(self):
+        return f'InstancedShape({self.shape})'
 
 
 class BoundingBox(Cube):
@@ -352,6 +687,53 @@ class BoundingBox(Cube):
         self.include(box.minimum)
         self.include(box.maximum)
 
+    @property
+    def finite(self) -> bool:
+        # false for boxes reaching to infinity, and for empty ones
+        return all(math.isfinite(c) for c in self.minimum[:3] + self.maximum[:3]) and \
+            self.minimum.x <= self.maximum.x and self.minimum.y <= self.maximum.y and \
+            self.minimum.z <= self.maximum.z
+
+    def slab_test(self, ray: Ray) -> Optional[(float, float)]:
+        # where the line of the ray enters and leaves the box, or None when it misses the box.
+        # unlike intersect() it neither transforms the ray nor allocates intersections, and
+        # empty boxes are missed by every ray. the transformation of the box is ignored
+        ix, iy, iz = ray.inverse_direction
+        sx, sy, sz = ray.signs
+        origin = ray.origin
+        minimum, maximum = self.minimum, self.maximum
+
+        t_near = ((maximum.x if sx else minimum.x) - origin.x) * ix
+        t_far = ((minimum.x if sx else maximum.x) - origin.x) * ix
+        ty_near = ((maximum.y if sy else minimum.y) - origin.y) * iy
+        ty_far = ((minimum.y if sy else maximum.y) - origin.y) * iy
+        if t_near > ty_far or ty_near > t_far:
+            return None
+        # comparisons with nan, from rays running along a face, are false and keep the other value
+        if ty_near > t_near:
+            t_near = ty_near
+        if ty_far < t_far:
+            t_far = ty_far
+
+        tz_near = ((maximum.z if sz else minimum.z) - origin.z) * iz
+        tz_far = ((minimum.z if sz else maximum.z) - origin.z) * iz
+        if t_near > tz_far or tz_near > t_far:
+            return None
+        if tz_near > t_near:
+            t_near = tz_near
+        if tz_far < t_far:
+            t_far = tz_far
+        # rays running parallel to a slab outside of it only "meet" it at infinity
+        if t_near == INF or t_far == -INF:
+            return None
+        return t_near, t_far
+
+    def disjoint(self, box: BoundingBox) -> bool:
+        # whether the boxes are separated along any axis, false when in doubt
+        return self.maximum.x < box.minimum.x or box.maximum.x < self.minimum.x or \
+            self.maximum.y < box.minimum.y or box.maximum.y < self.minimum.y or \
+            self.maximum.z < box.minimum.z or box.maximum.z < self.minimum.z
+
     def contains_point(self, point: Point) -> bool:
         return self.minimum.x <= point.x <= self.maximum.x and \
                self.minimum.y <= point.y <= self.maximum.y and \
@@ -360,6 +742,26 @@ class BoundingBox(Cube):
     def contains_box(self, box: BoundingBox) -> bool:
         return self.contains_point(box.minimum) and self.contains_point(box.maximum)
 
+    def split_bounds(self) -> (BoundingBox, BoundingBox):
+        # splits the box in two halves along its longest axis
+        dx = self.maximum.x - self.minimum.x
+        dy = self.maximum.y - self.minimum.y
+        dz = self.maximum.z - self.minimum.z
+        greatest = max(dx, dy, dz)
+
+        x0, y0, z0 = self.minimum.x, self.minimum.y, self.minimum.z
+        x1, y1, z1 = self.maximum.x, self.maximum.y, self.maximum.z
+        if greatest == dx:
+            x0 = x1 = x0 + dx / 2.0
+        elif greatest == dy:
+            y0 = y1 = y0 + dy / 2.0
+        else:
+            z0 = z1 = z0 + dz / 2.0
+
+        left = BoundingBox(self.minimum, Point(x1, y1, z1))
+        right = BoundingBox(Point(x0, y0, z0), self.maximum)
+        return left, right
+
     def transform(self, matrix: Matrix):
         edges = [Point(x, y, z) for x, y, z in itertools.product((self.minimum.x, self.maximum.x),
                                                                  (self.minimum.y, self.maximum.y),
@@ -371,14 +773,23 @@ class BoundingBox(Cube):
 
 
 class Triangle(Shape):
+    geometry_attributes = ('p1', 'p2', 'p3')
+    p1 = _geometry_property('p1')
+    p2 = _geometry_property('p2')
+    p3 = _geometry_property('p3')
+
     def __init__(self, p1: Point, p2: Point, p3: Point):
         super().__init__()
-        self.p1 = p1
-        self.p2 = p2
-        self.p3 = p3
-        self.e1 = p2 - p1
-        self.e2 = p3 - p1
+        self._p1 = p1
+        self._p2 = p2
+        self._p3 = p3
+        self._geometry_changed()
+
+    def _geometry_changed(self) -> None:
+        self.e1 = self.p2 - self.p1
+        self.e2 = self.p3 - self.p1
         self.normal = cross(self.e2, self.e1).normalize()
+        super()._geometry_changed()
 
     def _local_intersect(self, ray: Ray) -> Intersections:
         dir_cross_e2 = cross(ray.direction, self.e2)
@@ -423,6 +834,52 @@ class SmoothTriangle(Triangle):
         return Vector(x, y, z)
 
 
+class TriangleArrays:
+    # the first points and edges of triangles sharing one object space, as contiguous arrays of
+    # their x, y and z components, so a ray is intersected with all of them in a single pass.
+    # hits carry u and v like those of the triangles themselves, for smooth triangles' normals
+    def __init__(self, triangles: List[Triangle]):
+        self.triangles = triangles
+        self.p1 = np.array([triangle.p1[:3] for triangle in triangles], dtype=float).T.copy()
+        self.e1 = np.array([triangle.e1[:3] for triangle in triangles], dtype=float).T.copy()
+        self.e2 = np.array([triangle.e2[:3] for triangle in triangles], dtype=float).T.copy()
+
+    def intersect(self, ray: Ray) -> List[Intersection]:
+        # Triangle._local_intersect for all triangles at once
+        dx, dy, dz = ray.direction[:3]
+        e1x, e1y, e1z = self.e1
+        e2x, e2y, e2z = self.e2
+        cx = dy * e2z - dz * e2y
+        cy = dz * e2x - dx * e2z
+        cz = dx * e2y - dy * e2x
+        determinant = e1x * cx + e1y * cy + e1z * cz
+        parallel = np.abs(determinant) < EPSILON
+        f = 1.0 / np.where(parallel, 1.0, determinant)
+
+        px, py, pz = (component - p1 for component, p1 in zip(ray.origin[:3], self.p1))
+        u = f * (px * cx + py * cy + pz * cz)
+        qx = py * e1z - pz * e1y
+        qy = pz * e1x - px * e1z
+        qz = px * e1y - py * e1x
+        v = f * (dx * qx + dy * qy + dz * qz)
+
+        hits = np.flatnonzero(~parallel & (u >= 0) & (u <= 1) & (v >= 0) & (u + v <= 1))
+        if not len(hits):
+            return []
+        t = f[hits] * (e2x[hits] * qx[hits] + e2y[hits] * qy[hits] + e2z[hits] * qz[hits])
+        triangles = self.triangles
+        return [Intersection(t, triangles[index], u, v)
+                for index, t, u, v in zip(hits.tolist(), t.tolist(), u[hits].tolist(), v[hits].tolist())]
+
+
+def _finite_or_none(boxes) -> tuple:
+    return tuple(box if box.finite else None for box in boxes)
+
+
+def _may_hit(box: Optional[BoundingBox], ray: Ray) -> bool:
+    return box is None or box.slab_test(ray) is not None
+
+
 class OperationType(Enum):
     UNION = "union"
     INTERSECTION = "intersection"
@@ -443,21 +900,51 @@ class Csg(Shape):
     def __init__(self, operation: OperationType, left: Shape, right: Shape):
         super().__init__()
         self.operation = operation
+        # the shapes in the left operand, and the boxes of the whole node and of both operands
+        # in parent space, and the ones of them to cull rays with in parent space and (when
+        # flattened) in world space. boxes reaching to infinity can't rule out anything, so
+        # they're None among the ones to cull with
+        self._left_shapes: Optional[Set[Shape]] = None
+        self._boxes: Optional[(BoundingBox, BoundingBox, BoundingBox)] = None
+        self._culling_boxes: Optional[tuple] = None
+        self._world_boxes: Optional[tuple] = None
+        left.unflatten()
         left.parent = self
         self.left = left
+        right.unflatten()
         right.parent = self
         self.right = right
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_left_shapes'] = None
+        return state
+
+    def invalidate_bounds(self) -> None:
+        # also called when shapes are added to or removed from a group within an operand
+        self._left_shapes = None
+        self._boxes = None
+        self._culling_boxes = None
+        super().invalidate_bounds()
+
+    def left_shapes(self) -> Set[Shape]:
+        if self._left_shapes is None:
+            self._left_shapes = set(self.left.walk())
+        return self._left_shapes
+
     def filter_intersections(self, xs: Intersections) -> Intersections:
+        left_shapes = self.left_shapes()
         # begin outside both children
         inside_left = False
         inside_right = False
         result = Intersections()
         for i in xs:
-            left_hit = self.left.includes(i.object)
+            # shapes of a prototype are hit through the instance placed in the operand
+            obj = i.object
+            left_hit = (obj.instance if isinstance(obj, InstancedShape) else obj) in left_shapes
 
             if self.operation.intersection_allowed(left_hit, inside_left, inside_right):
-                result.append(i, False)
+                result.append(i)
 
             # depending on which object was hit, toggle either inside_left or inside_right
             if left_hit:
@@ -465,22 +952,93 @@ class Csg(Shape):
             else:
                 inside_right = not inside_right
 
-        result.sort()
         return result
 
+    def _flatten_self(self) -> None:
+        super()._flatten_self()
+        to_world = self._world_to_object.inverse()
+        self._world_boxes = _finite_or_none(box.transform(to_world) for box in self.operand_boxes())
+
+    def intersect(self, ray: Ray) -> Intersections:
+        if self._world_to_object is None:
+            return super().intersect(ray)
+        # flattened operands transform the world space ray themselves
+        return self._intersect_operands(ray, self._world_boxes)
+
     def _local_intersect(self, ray: Ray) -> Intersections:
-        xs = self.left.intersect(ray)
-        xs.extend(self.right.intersect(ray))
+        if self._culling_boxes is None:
+            self._culling_boxes = _finite_or_none(self.operand_boxes())
+        return self._intersect_operands(ray, self._culling_boxes)
+
+    def _intersect_operands(self, ray: Ray, boxes: tuple) -> Intersections:
+        box, left_box, right_box = boxes
+        if not _may_hit(box, ray):
+            return Intersections()
+        xs = self.left.intersect(ray) if _may_hit(left_box, ray) else Intersections()
+        # without the left operand there's nothing to intersect with or to subtract from
+        if xs.count == 0 and self.operation is not OperationType.UNION:
+            return xs
+        right = self.right.intersect(ray) if _may_hit(right_box, ray) else Intersections()
+        if right.count == 0 and self.operation is OperationType.INTERSECTION:
+            return right
+        xs.extend(right)
         return self.filter_intersections(xs)
 
+    def operand_boxes(self) -> (BoundingBox, BoundingBox, BoundingBox):
+        # the boxes of the node, the left operand and the right operand in parent space
+        if self._boxes is None:
+            left_box = self.left.parent_space_bounds()
+            right_box = self.right.parent_space_bounds()
+            box = BoundingBox()
+            box.merge(left_box)
+            box.merge(right_box)
+            self._boxes = (box, left_box, right_box)
+        return self._boxes
+
     def _local_normal_at(self, point: Point, hit: Intersection = None) -> Vector:
         raise NotImplementedError
 
     def bounds(self) -> BoundingBox:
-        box = BoundingBox()
-        box.merge(self.left.parent_space_bounds())
-        box.merge(self.right.parent_space_bounds())
-        return box
+        return self.operand_boxes()[0]
 
     def includes(self, shape: Shape) -> bool:
         return self.left.includes(shape) or self.right.includes(shape)
+
+    def divide(self, threshold: int) -> None:
+        self.left.divide(threshold)
+        self.right.divide(threshold)
+
+    def optimize(self) -> Shape:
+        left, right = self.left.optimize(), self.right.optimize()
+        if left is not self.left or right is not self.right:
+            self.unflatten()
+            left.parent = right.parent = self
+            self.left, self.right = left, right
+            self.invalidate_bounds()
+
+        _, left_box, right_box = self.operand_boxes()
+        # boxes reaching to infinity, or transformed from one, tell nothing about overlap
+        if not (left_box.finite and right_box.finite) or not left_box.disjoint(right_box):
+            return self
+        if self.operation is OperationType.DIFFERENCE:
+            # nothing is cut away from the left operand
+            return self._lift(self.left)
+        group = Group()
+        group.transformation = self.transformation
+        if self.operation is OperationType.UNION:
+            # no surface of either operand lies within the other, so none needs filtering
+            group.add_children(self._lift(self.left, False), self._lift(self.right, False))
+        # and an intersection of operands that don't overlap is empty
+        return group
+
+    def _lift(self, operand: Shape, transformed: bool = True) -> Shape:
+        # takes the operand out of the node, in the node's place or within a group taking its place
+        operand.parent = None
+        if transformed:
+            operand.transformation = self.transformation * operand.transformation
+        return operand
+
+    def walk(self) -> Iterator[Shape]:
+        yield self
+        yield from self.left.walk()
+        yield from self.right.walk()
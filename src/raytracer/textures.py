@@ -0,0 +1,208 @@
+from __future__ import annotations
+from enum import Enum
+from typing import Dict, List, Tuple
+from .tuples import Color, Point
+import math
+import os
+import re
+import numpy as np
+
+
+class Texture:
+    def __init__(self, path: str, pixels: np.ndarray, max_value: int):
+        self.path = path
+        self.height, self.width = pixels.shape[:2]
+        # level 0 holds the raw pixel values, for binary files still backed by the mapping;
+        # the smaller levels are built on demand, by averaging 2x2 blocks of the level above
+        self._levels: List[np.ndarray] = [pixels]
+        self._scales: List[float] = [1.0 / max_value]
+
+    def __reduce__(self):
+        # worker processes reload (and map) the file through their own cache
+        # instead of receiving a copy of the pixels
+        return load_texture, (self.path,)
+
+    @property
+    def level_count(self) -> int:
+        return int(math.log2(max(self.width, self.height))) + 1
+
+    def level(self, index: int) -> Tuple[np.ndarray, float]:
+        index = min(max(index, 0), self.level_count - 1)
+        while len(self._levels) <= index:
+            self._levels.append(_downsample(self._levels[-1]) * np.float32(self._scales[-1]))
+            self._scales.append(1.0)
+        return self._levels[index], self._scales[index]
+
+    def sample(self, u: float, v: float, lod: float = 0.0) -> Color:
+        r, g, b = self.sample_many(np.array([u]), np.array([v]), lod)[0]
+        return Color(float(r), float(g), float(b))
+
+    def sample_many(self, u: np.ndarray, v: np.ndarray, lod: float = 0.0) -> np.ndarray:
+        # bilinear lookups within the two mipmap levels around lod, blended linearly
+        lod = min(max(lod, 0.0), self.level_count - 1)
+        lower = int(math.floor(lod))
+        colors = self._bilinear(lower, u, v)
+        if lod > lower:
+            colors = colors + (self._bilinear(lower + 1, u, v) - colors) * (lod - lower)
+        return colors
+
+    def _bilinear(self, index: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        pixels, scale = self.level(index)
+        height, width = pixels.shape[:2]
+        x = np.clip(u, 0.0, 1.0) * (width - 1)
+        y = (1.0 - np.clip(v, 0.0, 1.0)) * (height - 1)
+        x0 = np.minimum(np.floor(x).astype(np.intp), width - 1)
+        y0 = np.minimum(np.floor(y).astype(np.intp), height - 1)
+        x1 = np.minimum(x0 + 1, width - 1)
+        y1 = np.minimum(y0 + 1, height - 1)
+        fx = (x - x0)[:, np.newaxis]
+        fy = (y - y0)[:, np.newaxis]
+        top = pixels[y0, x0] * (1 - fx) + pixels[y0, x1] * fx
+        bottom = pixels[y1, x0] * (1 - fx) + pixels[y1, x1] * fx
+        return (top * (1 - fy) + bottom * fy) * scale
+
+    def __repr__(self):
+        return f'Texture({self.path}, {self.width}x{self.height})'
+
+
+def _downsample(pixels: np.ndarray) -> np.ndarray:
+    height, width = pixels.shape[:2]
+    if height > 1:
+        even = pixels[:height - height % 2]
+        pixels = (even[0::2].astype(np.float32) + even[1::2]) / 2
+    if width > 1:
+        even = pixels[:, :width - width % 2]
+        pixels = (even[:, 0::2].astype(np.float32) + even[:, 1::2]) / 2
+    return pixels.astype(np.float32)
+
+
+# the modification time and texture of every file loaded, by path
+_textures: Dict[str, Tuple[float, Texture]] = {}
+
+
+def load_texture(path: str) -> Texture:
+    # decoded textures are shared by every pattern using the same file, until the file changes.
+    # then the texture of the changed file replaces the old one in the cache
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _textures.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    texture = _read_ppm(path)
+    _textures[path] = (mtime, texture)
+    return texture
+
+
+def _read_ppm(path: str) -> Texture:
+    with open(path, 'rb') as file:
+        data = file.read(4096)
+
+    tokens, offset = _ppm_header(data)
+    magic, width, height, max_value = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+
+    if magic == b'P6':
+        dtype = np.uint8 if max_value < 256 else np.dtype('>u2')
+        pixels = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(height, width, 3))
+    elif magic == b'P3':
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            values = re.sub(rb'#[^\n]*', b'', file.read()).split()
+        pixels = np.array(values[:width * height * 3], dtype=np.uint16).reshape(height, width, 3)
+    else:
+        raise ValueError(f'{path} is not a P3 or P6 PPM file')
+    return Texture(path, pixels, max_value)
+
+
+def _ppm_header(data: bytes) -> Tuple[List[bytes], int]:
+    # the four header values, and the offset of the pixel data following them
+    tokens, position = [], 0
+    while len(tokens) < 4:
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.index(b'\n', position) + 1
+            continue
+        start = position
+        while position < len(data) and not data[position:position + 1].isspace():
+            position += 1
+        if start == position:
+            raise ValueError('incomplete PPM header')
+        tokens.append(data[start:position])
+    # a single whitespace character separates the header from the pixels
+    return tokens, position + 1
+
+
+def spherical_map(point: Point) -> Tuple[float, float]:
+    theta = math.atan2(point.x, point.z)
+    radius = math.sqrt(point.x * point.x + point.y * point.y + point.z * point.z)
+    # clamped against rounding just outside [-1, 1], and the origin maps to the equator
+    cos_phi = max(-1.0, min(1.0, point.y / radius)) if radius > 0 else 0.0
+    phi = math.acos(cos_phi)
+    raw_u = theta / (2 * math.pi)
+    return 1 - (raw_u + 0.5), 1 - phi / math.pi
+
+
+def planar_map(point: Point) -> Tuple[float, float]:
+    return point.x % 1.0, point.z % 1.0
+
+
+def cylindrical_map(point: Point) -> Tuple[float, float]:
+    theta = math.atan2(point.x, point.z)
+    raw_u = theta / (2 * math.pi)
+    return 1 - (raw_u + 0.5), point.y % 1.0
+
+
+def cubic_map(point: Point) -> Tuple[float, float]:
+    # every face of the cube shows the whole texture
+    u, v = cubic_map_many(np.array([point[:3]], dtype=float))
+    return float(u[0]), float(v[0])
+
+
+def spherical_map_many(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    theta = np.arctan2(x, z)
+    radius = np.sqrt(x * x + y * y + z * z)
+    cos_phi = np.divide(y, radius, out=np.zeros(len(y)), where=radius > 0)
+    phi = np.arccos(np.clip(cos_phi, -1.0, 1.0))
+    return 1 - (theta / (2 * np.pi) + 0.5), 1 - phi / np.pi
+
+
+def planar_map_many(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return points[:, 0] % 1.0, points[:, 2] % 1.0
+
+
+def cylindrical_map_many(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    theta = np.arctan2(points[:, 0], points[:, 2])
+    return 1 - (theta / (2 * np.pi) + 0.5), points[:, 1] % 1.0
+
+
+def cubic_map_many(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    ax, ay, az = np.abs(x), np.abs(y), np.abs(z)
+    coord = np.maximum(np.maximum(ax, ay), az)
+    faces = [coord == x, coord == -x, coord == y, coord == -y, coord == z]
+    # right, left, up, down, front and (by default) back faces
+    u = np.select(faces, [(1 - z) % 2.0, (z + 1) % 2.0, (x + 1) % 2.0, (x + 1) % 2.0, (x + 1) % 2.0],
+                  (1 - x) % 2.0) / 2.0
+    v = np.select(faces, [(y + 1) % 2.0, (y + 1) % 2.0, (1 - z) % 2.0, (z + 1) % 2.0, (y + 1) % 2.0],
+                  (y + 1) % 2.0) / 2.0
+    return u, v
+
+
+class UvMapping(Enum):
+    SPHERICAL = 'spherical'
+    PLANAR = 'planar'
+    CYLINDRICAL = 'cylindrical'
+    CUBIC = 'cubic'
+
+    def map(self, point: Point) -> Tuple[float, float]:
+        return _scalar_maps[self](point)
+
+    def map_many(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return _vector_maps[self](points)
+
+
+_scalar_maps = {UvMapping.SPHERICAL: spherical_map, UvMapping.PLANAR: planar_map,
+                UvMapping.CYLINDRICAL: cylindrical_map, UvMapping.CUBIC: cubic_map}
+_vector_maps = {UvMapping.SPHERICAL: spherical_map_many, UvMapping.PLANAR: planar_map_many,
+                UvMapping.CYLINDRICAL: cylindrical_map_many, UvMapping.CUBIC: cubic_map_many}
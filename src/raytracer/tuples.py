@@ -70,12 +70,19 @@ class Point(Tuple):
         kwargs['w'] = TupleType.POINT.value
         return super().__new__(cls, *args, **kwargs)
 
+    def __getnewargs__(self):
+        # w is implied, passing it again when unpickling would fail
+        return self.x, self.y, self.z
+
 
 class Vector(Tuple):
     def __new__(cls, *args, **kwargs):
         kwargs['w'] = TupleType.VECTOR.value
         return super().__new__(cls, *args, **kwargs)
 
+    def __getnewargs__(self):
+        return self.x, self.y, self.z
+
     @property
     def magnitude(self):
         return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
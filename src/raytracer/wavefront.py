@@ -0,0 +1,222 @@
+from __future__ import annotations
+from . import EPSILON
+from .camera import Camera, Tile
+from .canvas import Canvas
+from .intersections import _refractive_indices
+from .lights import PointLight
+from .packets import intersect_packet, nearest_hits, normals_at, packet_shapes, tile_rays
+from .rays import Ray
+from .scene import RayStatistics, World
+from .shapes import Shape
+from .tuples import Color, Point, Vector
+from typing import List, NamedTuple, Tuple
+import time
+import numpy as np
+
+# a wavefront renderer runs the stages of World.color_at for all rays of a tile at once:
+# find the nearest hits, prepare the shading inputs, cast the shadow rays, shade, and gather
+# the reflected and refracted rays that are still worth tracing into the next wave. the
+# interpreter overhead is paid per stage and wave instead of per ray.
+# like Camera.render with a single sample per pixel, rays go through the pixel centers.
+# rays contributing less than the world's min_contribution are always dropped, there is
+# no russian roulette, as its random decisions are drawn in the order of a depth first trace
+
+
+class Wave(NamedTuple):
+    # the rays traced at one depth, the pixel of the tile every ray contributes to,
+    # and the fraction of that pixel's color it contributes
+    origins: np.ndarray
+    directions: np.ndarray
+    pixels: np.ndarray
+    weights: np.ndarray
+
+    def select(self, rows: np.ndarray) -> Wave:
+        return Wave(*(array[rows] for array in self))
+
+
+class Hits(NamedTuple):
+    # the arrays of Computations, one row per ray of a wave that hit something
+    shapes: np.ndarray
+    points: np.ndarray
+    eyev: np.ndarray
+    normals: np.ndarray
+    over_points: np.ndarray
+    under_points: np.ndarray
+
+
+class MaterialArrays:
+    # the materials of the shapes as arrays, indexed like the shapes
+    def __init__(self, shapes: List[Shape]):
+        materials = [shape.material for shape in shapes]
+        self.color = np.array([material.color for material in materials], dtype=float).reshape(-1, 3)
+        self.ambient = np.array([material.ambient for material in materials], dtype=float)
+        self.diffuse = np.array([material.diffuse for material in materials], dtype=float)
+        self.specular = np.array([material.specular for material in materials], dtype=float)
+        self.shininess = np.array([material.shininess for material in materials], dtype=float)
+        self.reflective = np.array([material.reflective for material in materials], dtype=float)
+        self.transparency = np.array([material.transparency for material in materials], dtype=float)
+        self.patterned = [index for index, material in enumerate(materials) if material.pattern]
+
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.einsum('ij,ij->i', a, b)
+
+
+def prepare_hits(shapes: List[Shape], wave: Wave, t: np.ndarray, ids: np.ndarray) -> Hits:
+    points = wave.origins + wave.directions * t[:, np.newaxis]
+    eyev = -wave.directions
+    normals = np.empty_like(points)
+    for index in np.unique(ids):
+        rows = ids == index
+        normals[rows] = normals_at(shapes[index], points[rows])
+    inside = _dot(normals, eyev) < 0
+    normals[inside] = -normals[inside]
+    return Hits(ids, points, eyev, normals, points + normals * EPSILON, points - normals * EPSILON)
+
+
+def shadowed(shapes: List[Shape], light: PointLight, points: np.ndarray) -> np.ndarray:
+    v = np.array(light.position[:3], dtype=float) - points
+    distances = np.linalg.norm(v, axis=1)
+    directions = v / distances[:, np.newaxis]
+    # any shape between the point and the light will do, so only the rows
+    # not found to be in shadow yet are tested against the next shape
+    result = np.zeros(len(points), dtype=bool)
+    for shape in shapes:
+        rows = np.flatnonzero(~result)
+        if not len(rows):
+            break
+        result[rows] = nearest_hits(shape, points[rows], directions[rows]) < distances[rows]
+    return result
+
+
+def lighting(shapes: List[Shape], materials: MaterialArrays, light: PointLight, hits: Hits,
+             in_shadow: np.ndarray) -> np.ndarray:
+    # Material.lighting for every hit
+    ids = hits.shapes
+    color = materials.color[ids]
+    for index in materials.patterned:
+        rows = ids == index
+        if rows.any():
+            shape = shapes[index]
+            color[rows] = shape.material.pattern.pattern_at_shape_many(shape, hits.points[rows])
+
+    intensity = np.array(light.intensity, dtype=float)
+    effective_color = color * intensity
+    lightv = np.array(light.position[:3], dtype=float) - hits.points
+    lightv /= np.linalg.norm(lightv, axis=1)[:, np.newaxis]
+
+    ambient = effective_color * materials.ambient[ids][:, np.newaxis]
+    light_dot_normal = _dot(lightv, hits.normals)
+    lit = ~in_shadow & (light_dot_normal >= 0)
+    diffuse = effective_color * np.where(lit, materials.diffuse[ids] * light_dot_normal, 0.0)[:, np.newaxis]
+
+    reflectv = hits.normals * (2 * light_dot_normal)[:, np.newaxis] - lightv
+    reflect_dot_eye = _dot(reflectv, hits.eyev)
+    highlighted = lit & (reflect_dot_eye > 0)
+    factor = np.power(np.where(highlighted, reflect_dot_eye, 1.0), materials.shininess[ids])
+    specular = intensity * np.where(highlighted, materials.specular[ids] * factor, 0.0)[:, np.newaxis]
+    return ambient + diffuse + specular
+
+
+def refractive_indices(world: World, wave: Wave, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # n1 and n2 depend on every intersection along the ray, not just the nearest one, so
+    # they are found the scalar way. only rays hitting transparent materials need them
+    n1, n2 = np.ones(len(rows)), np.ones(len(rows))
+    for k, row in enumerate(rows):
+        ray = Ray(Point(*wave.origins[row]), Vector(*wave.directions[row]))
+        xs = world.intersect(ray)
+        hit = xs.hit()
+        if hit is not None:
+            n1[k], n2[k] = _refractive_indices(hit, xs)
+    return n1, n2
+
+
+def _schlick(cos_i: np.ndarray, n1: np.ndarray, n2: np.ndarray, sin2_t: np.ndarray) -> np.ndarray:
+    denser = n1 > n2
+    cos = np.where(denser, np.sqrt(np.maximum(1.0 - sin2_t, 0.0)), cos_i)
+    r0 = ((n1 - n2) / (n1 + n2)) ** 2
+    return np.where(denser & (sin2_t > 1.0), 1.0, r0 + (1 - r0) * (1 - cos) ** 5)
+
+
+def next_wave(world: World, materials: MaterialArrays, wave: Wave, hits: Hits) -> Wave:
+    # the reflected and refracted rays of the hits, as World.reflected_color and
+    # World.refracted_color would trace them
+    reflective = materials.reflective[hits.shapes]
+    transparency = materials.transparency[hits.shapes]
+    directions = wave.directions
+    cos_i = _dot(hits.eyev, hits.normals)
+
+    n1, n2 = np.ones(len(cos_i)), np.ones(len(cos_i))
+    refracting = np.flatnonzero(transparency > 0)
+    n1[refracting], n2[refracting] = refractive_indices(world, wave, refracting)
+    n_ratio = n1 / n2
+    sin2_t = n_ratio ** 2 * (1 - cos_i ** 2)
+
+    reflect_weights = wave.weights * reflective
+    refract_weights = wave.weights * transparency
+    both = (reflective > 0) & (transparency > 0)
+    reflectance = _schlick(cos_i, n1, n2, sin2_t)
+    reflect_weights[both] *= reflectance[both]
+    refract_weights[both] *= 1 - reflectance[both]
+
+    reflecting = reflective > 0
+    refracting = (transparency > 0) & (sin2_t <= 1.0)
+    traced_reflections = reflecting & (reflect_weights >= world.min_contribution)
+    traced_refractions = refracting & (refract_weights >= world.min_contribution)
+    statistics = world.statistics
+    statistics.secondary_rays += int(traced_reflections.sum() + traced_refractions.sum())
+    statistics.terminated_rays += int((reflecting & ~traced_reflections).sum() +
+                                      (refracting & ~traced_refractions).sum())
+
+    reflectv = directions - hits.normals * (2 * _dot(directions, hits.normals))[:, np.newaxis]
+    cos_t = np.sqrt(np.maximum(1.0 - sin2_t, 0.0))
+    refractv = hits.normals * (n_ratio * cos_i - cos_t)[:, np.newaxis] - hits.eyev * n_ratio[:, np.newaxis]
+    r, t = traced_reflections, traced_refractions
+    return Wave(np.concatenate([hits.over_points[r], hits.under_points[t]]),
+                np.concatenate([reflectv[r], refractv[t]]),
+                np.concatenate([wave.pixels[r], wave.pixels[t]]),
+                np.concatenate([reflect_weights[r], refract_weights[t]]))
+
+
+def render_tile_wavefront(camera: Camera, world: World, shapes: List[Shape], materials: MaterialArrays,
+                          tile: Tile, remaining: int = 4) -> np.ndarray:
+    # the colors of the pixels of the tile, in the order of tile.pixels(), as an (n, 3) array
+    origins, directions = tile_rays(camera, tile)
+    colors = np.zeros((len(origins), 3))
+    wave = Wave(origins, directions, np.arange(len(origins)), np.ones(len(origins)))
+    while len(wave.origins):
+        t, ids = intersect_packet(shapes, wave.origins, wave.directions)
+        hit = ids >= 0
+        wave = wave.select(hit)
+        hits = prepare_hits(shapes, wave, t[hit], ids[hit])
+        in_shadow = shadowed(shapes, world.light_source, hits.over_points)
+        surface = lighting(shapes, materials, world.light_source, hits, in_shadow)
+        np.add.at(colors, wave.pixels, surface * wave.weights[:, np.newaxis])
+        if remaining <= 0:
+            break
+        wave = next_wave(world, materials, wave, hits)
+        remaining -= 1
+    return colors
+
+
+def render_wavefront(camera: Camera, world: World, tile_size: int = 64) -> Canvas:
+    # renders the primitives of the world, which can't contain csg or instances
+    image = Canvas(camera.hsize, camera.vsize)
+    world.compile()
+    world.statistics = RayStatistics()
+    shapes = packet_shapes(world)
+    materials = MaterialArrays(shapes)
+    tiles = list(camera.tiles(tile_size))
+
+    print(f'Rendering {len(tiles)} tiles in waves...')
+    start = time.perf_counter()
+    for tile in tiles:
+        colors = render_tile_wavefront(camera, world, shapes, materials, tile)
+        image.write_tile(tile, [Color(*color) for color in colors.tolist()])
+
+    duration = time.perf_counter() - start
+    print(f'Rendered in {duration:.2f} seconds')
+    statistics = world.statistics
+    print(f'Traced {statistics.secondary_rays} secondary rays, '
+          f'skipped {statistics.terminated_rays} with too little contribution')
+    return image
@@ -0,0 +1,51 @@
+from math import pi
+from os import sep
+from raytracer.camera import Camera
+from raytracer.canvas import write_ppm_to_file
+from raytracer.lights import PointLight
+from raytracer.materials import Material
+from raytracer.matrices import *
+from raytracer.obj_file import parse_obj_file
+from raytracer.scene import World
+from raytracer.shapes import Instance
+from raytracer.tuples import Color, Point, Vector
+import tracemalloc
+
+
+def teapot():
+    parser = parse_obj_file(f'..{sep}resources{sep}teapot.obj')
+    return parser.obj_to_group()
+
+
+def teapots(prototype, rows=25, columns=40):
+    # 1,000 instances of one parsed teapot, each with its own placement and color
+    instances = []
+    for row in range(rows):
+        for column in range(columns):
+            material = Material()
+            material.color = Color(row / rows, 0.5, column / columns)
+            instance = Instance(prototype, material)
+            instance.transformation = translation((column - columns / 2) * 40, 0, row * 40) * \
+                rotation_y(column * pi / 10) * rotation_x(-pi / 2)
+            instances.append(instance)
+    return instances
+
+
+if __name__ == '__main__':
+    tracemalloc.start()
+    prototype = teapot()
+    after_parsing, _ = tracemalloc.get_traced_memory()
+
+    world = World()
+    world.add(*teapots(prototype))
+    world.light_source = PointLight(Point(-500, 500, -500), Color.white())
+
+    camera = Camera(60, 30, pi / 3)
+    camera.transformation = view_transform(Point(0, 300, -400), Point(0, 0, 400), Vector(0, 1, 0))
+
+    canvas = camera.render(world)
+    _, peak = tracemalloc.get_traced_memory()
+    print(f'Memory: {after_parsing / 2 ** 20:.1f} MiB for the prototype, '
+          f'{peak / 2 ** 20:.1f} MiB peak for 1000 instances')
+
+    write_ppm_to_file(canvas.to_ppm(), f'..{sep}..{sep}resources{sep}teapot_instances.ppm')
@@ -0,0 +1,68 @@
+from math import pi
+from raytracer.animation import Animation, Keyframes, render_sequence
+from raytracer.matrices import scaling, translation, view_transform, rotation_y
+from raytracer.shapes import Group, Sphere
+from raytracer.tuples import Point, Vector
+from .test_camera import build_scene
+import os
+import pytest
+
+
+@pytest.fixture
+def scene():
+    group = Group()
+    for x in range(-2, 3):
+        s = Sphere()
+        s.transformation = translation(x * 2.5, 0, 0)
+        group.add_children(s)
+    return build_scene(group, hsize=12, vsize=6, floor=False, eye=Point(0, 0, -15))
+
+
+class TestAnimation:
+    def test_keyframes_interpolate_between_and_hold_outside(self):
+        keys = Keyframes({0: translation(0, 0, 0), 10: translation(10, 0, 0)})
+        assert keys(-5) == translation(0, 0, 0)
+        assert keys(5) == translation(5, 0, 0)
+        assert keys(10) == translation(10, 0, 0)
+        assert keys(20) == translation(10, 0, 0)
+
+    def test_keyframes_interpolate_rotation_along_the_shortest_arc(self):
+        keys = Keyframes({0: rotation_y(0), 10: rotation_y(pi)})
+        assert keys(5) == rotation_y(pi / 2)
+        assert keys(5).inverse() == rotation_y(-pi / 2)
+        keys = Keyframes({0: rotation_y(-pi / 4), 10: rotation_y(pi / 4)})
+        assert keys(5) == rotation_y(0)
+
+    def test_keyframes_interpolate_translation_rotation_and_scaling_separately(self):
+        keys = Keyframes({0: translation(0, 0, 0) * rotation_y(0) * scaling(1, 1, 1),
+                          10: translation(4, 0, 0) * rotation_y(pi / 2) * scaling(3, 1, 1)})
+        assert keys(5) == translation(2, 0, 0) * rotation_y(pi / 4) * scaling(2, 1, 1)
+
+    def test_animation_sets_transformations_per_frame(self, scene):
+        camera, world = scene
+        sphere = world.objects[0][2]
+        animation = Animation()
+        animation.animate(sphere, Keyframes({0: translation(0, 0, 0), 4: translation(0, 4, 0)}))
+        animation.apply(2)
+        assert sphere.transformation == translation(0, 2, 0)
+        assert world.objects[0].bounds().maximum == Point(6, 3, 1)
+
+    def test_rendering_sequence_writes_numbered_frames(self, scene, tmp_path):
+        camera, world = scene
+        animation = Animation()
+        animation.animate(world.objects[0], lambda frame: rotation_y(frame * pi / 8))
+        file_name = str(tmp_path / 'frame_{:02d}.ppm')
+        canvases = render_sequence(camera, world, animation, range(3), file_name, processes=1, divide_threshold=2)
+        assert len(canvases) == 3
+        assert sorted(os.listdir(tmp_path)) == ['frame_00.ppm', 'frame_01.ppm', 'frame_02.ppm']
+
+    def test_parallel_sequence_matches_serial_sequence(self, scene):
+        camera, world = scene
+        animation = Animation()
+        animation.animate(camera, lambda frame: view_transform(Point(frame, 0, -15), Point(0, 0, 0), Vector(0, 1, 0)))
+        serial = render_sequence(camera, world, animation, range(2), None, processes=1)
+        parallel = render_sequence(camera, world, animation, range(2), None, processes=2)
+        for first, second in zip(serial, parallel):
+            for y in range(camera.vsize):
+                for x in range(camera.hsize):
+                    assert first.pixel_at(x, y) == second.pixel_at(x, y)
@@ -1,10 +1,44 @@
 from math import pi, sqrt
-from raytracer.camera import Camera
-from raytracer.matrices import Matrix, rotation_y, translation
-from raytracer.tuples import Point, Vector
+from raytracer.camera import Camera, MAX_PROGRESSIVE_SAMPLES
+from raytracer.lights import PointLight
+from raytracer.matrices import Matrix, rotation_y, translation, view_transform
+from raytracer.scene import World
+from raytracer.shapes import Plane, Sphere
+from raytracer.tuples import Color, Point, Vector
 import pytest
 
 
+def build_scene(*objects, hsize=20, vsize=10, floor=True, eye=Point(0, 1, -6)):
+    # the objects above a floor plane, lit from the upper left, and a camera looking at the origin.
+    # when there is a floor, it is the first object of the world
+    w = World()
+    w.light_source = PointLight(Point(-10, 10, -10), Color.white())
+    if floor:
+        plane = Plane()
+        plane.transformation = translation(0, -1, 0)
+        w.add(plane)
+    w.add(*objects)
+    c = Camera(hsize, vsize, pi / 3)
+    c.transformation = view_transform(eye, Point(0, 0, 0), Vector(0, 1, 0))
+    return c, w
+
+
+def assert_same_image(image, expected, tolerance=None):
+    # pixels are compared as colors, or per channel within the tolerance when given one
+    for y in range(expected.height):
+        for x in range(expected.width):
+            if tolerance is None:
+                assert image.pixel_at(x, y) == expected.pixel_at(x, y), (x, y)
+            else:
+                for a, b in zip(image.pixel_at(x, y), expected.pixel_at(x, y)):
+                    assert abs(a - b) < tolerance, (x, y)
+
+
+@pytest.fixture
+def scene():
+    return build_scene(Sphere(), vsize=12)
+
+
 class TestCamera:
     def test_construct_camera(self):
         hsize = 160
@@ -43,3 +77,29 @@ class TestCamera:
         assert r.origin == Point(0, 2, -5)
         assert r.direction == Vector(sqrt(2) / 2, 0, -sqrt(2) / 2)
 
+    def test_construct_ray_through_point_within_pixel(self):
+        c = Camera(201, 101, pi / 2)
+        r = c.ray_for_pixel(99, 49, 1.5, 1.5)
+        assert r.direction == Vector(0, 0, -1)
+
+    def test_render_without_time_left_returns_coarse_image(self, scene):
+        c, w = scene
+        image = c.render(w, time_budget=0)
+        for y in range(c.vsize):
+            for x in range(c.hsize):
+                block = c.pixel_color(w, x - x % 8, y - y % 8)
+                assert image.pixel_at(x, y) == block
+
+    def test_render_with_time_left_adds_samples_per_pixel(self, scene):
+        c, w = scene
+        image = c.render(w, time_budget=60)
+        full = c.render(w)
+        differing = 0
+        for y in range(c.vsize):
+            for x in range(c.hsize):
+                colors = [c.pixel_color(w, x, y)] + \
+                         [c._sample_color(w, x, y, index) for index in range(1, MAX_PROGRESSIVE_SAMPLES)]
+                assert image.pixel_at(x, y) == sum(colors, Color.black()) * (1 / len(colors))
+                differing += image.pixel_at(x, y) != full.pixel_at(x, y)
+        # edges are antialiased
+        assert differing > 0
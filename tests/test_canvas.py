@@ -1,5 +1,9 @@
 from raytracer.tuples import Color
-from raytracer.canvas import Canvas
+from raytracer.camera import Tile
+from raytracer.canvas import Canvas, TiledCanvas, write_ppm_to_file
+import numpy as np
+import os
+import pytest
 
 
 class TestCanvas:
@@ -50,3 +54,61 @@ class TestCanvas:
         c = Canvas(5, 3)
         ppm = c.to_ppm()
         assert ppm[-1][-1] == '\n'
+
+
+def gradient(x, y):
+    return Color(x / 37, y / 23, 0.5 - x / 50)
+
+
+class TestTiledCanvas:
+    def test_pixels_are_kept_in_file_by_tile(self, tmp_path):
+        c = TiledCanvas(37, 23, str(tmp_path / 'image.bin'), tile_size=16)
+        assert not hasattr(c, '_pixels')
+        assert os.path.getsize(c.path) == 2 * 3 * 16 * 16 * 3 * 4
+        assert c.pixel_at(36, 22) == Color.black()
+        c.write_pixel(20, 17, Color(0.25, 0.5, 1))
+        assert c.pixel_at(20, 17) == Color(0.25, 0.5, 1)
+        assert list(c._tiles[1, 1, 1, 4]) == [0.25, 0.5, 1]
+
+    @pytest.mark.parametrize('dtype', [np.float64, np.uint8])
+    def test_ppm_matches_canvas(self, tmp_path, dtype):
+        expected = Canvas(37, 23)
+        c = TiledCanvas(37, 23, str(tmp_path / 'image.bin'), tile_size=16, dtype=dtype)
+        for y in range(23):
+            for x in range(37):
+                expected.write_pixel(x, y, gradient(x, y))
+                c.write_pixel(x, y, gradient(x, y))
+        assert list(c.ppm_lines()) == expected.to_ppm()
+        write_ppm_to_file(c.ppm_lines(), str(tmp_path / 'image.ppm'))
+        with open(tmp_path / 'image.ppm') as file:
+            assert file.read() == ''.join(expected.to_ppm())
+
+    def test_ppm_of_32_bit_pixels_is_within_rounding(self, tmp_path):
+        expected = Canvas(37, 23)
+        c = TiledCanvas(37, 23, str(tmp_path / 'image.bin'), tile_size=16)
+        for y in range(23):
+            for x in range(37):
+                expected.write_pixel(x, y, gradient(x, y))
+                c.write_pixel(x, y, gradient(x, y))
+        for y in range(23):
+            assert np.abs(np.array(c._row_values(y)) - expected._row_values(y)).max() <= 1
+
+    @pytest.mark.parametrize('tile', [Tile(16, 0, 16, 16), Tile(32, 16, 5, 7), Tile(10, 10, 20, 5)])
+    def test_writing_tiles(self, tmp_path, tile):
+        c = TiledCanvas(37, 23, str(tmp_path / 'image.bin'), tile_size=16)
+        c.write_tile(tile, [gradient(x, y) for x, y in tile.pixels()])
+        for y in range(23):
+            for x in range(37):
+                inside = tile.x <= x < tile.x + tile.width and tile.y <= y < tile.y + tile.height
+                color = gradient(x, y) if inside else Color.black()
+                assert np.allclose(c.pixel_at(x, y), color, atol=1e-6)
+
+    def test_8_bit_pixels_are_rounded_and_clamped(self, tmp_path):
+        c = TiledCanvas(4, 4, str(tmp_path / 'image.bin'), tile_size=2, dtype=np.uint8)
+        c.write_pixel(3, 1, Color(1.5, 0.5, -0.5))
+        assert list(c._tiles[0, 1, 1, 1]) == [255, 128, 0]
+        assert c.pixel_at(3, 1) == Color(1, 128 / 255, 0)
+
+    def test_unsupported_dtype(self, tmp_path):
+        with pytest.raises(ValueError):
+            TiledCanvas(4, 4, str(tmp_path / 'image.bin'), dtype=np.int16)
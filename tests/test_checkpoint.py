@@ -0,0 +1,108 @@
+from raytracer.checkpoint import Checkpoint, render_with_checkpoint, scene_hash
+from raytracer.lights import PointLight
+from raytracer.matrices import translation
+from raytracer.patterns import StripePattern
+from raytracer.shapes import Cylinder, Group, Sphere
+from raytracer.tuples import Color, Point
+from .test_camera import assert_same_image, build_scene
+import pytest
+
+
+def striped_scene():
+    group = Group()
+    group.add_children(Sphere())
+    camera, world = build_scene(group)
+    world.objects[0].material.pattern = StripePattern(Color.white(), Color.black())
+    return camera, world
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'image.checkpoint')
+
+
+class TestCheckpoint:
+    def test_scene_hash_is_the_same_for_the_same_scene(self):
+        camera, world = striped_scene()
+        camera.render(world)
+        assert scene_hash(camera, world) == scene_hash(*striped_scene())
+
+    def test_scene_hash_changes_with_the_scene(self):
+        camera, world = striped_scene()
+        expected = scene_hash(camera, world)
+        world.objects[1][0].transformation = translation(0, 0.5, 0)
+        assert scene_hash(camera, world) != expected
+        camera, world = striped_scene()
+        world.objects[0].material.pattern.second_color = Color(1, 0, 0)
+        assert scene_hash(camera, world) != expected
+
+    def test_scene_hash_changes_with_geometry(self):
+        camera, world = build_scene(Cylinder())
+        expected = scene_hash(camera, world)
+        world.objects[1].maximum = 2
+        assert scene_hash(camera, world) != expected
+
+    def test_render_resumes_from_completed_tiles(self, path):
+        camera, world = striped_scene()
+        checkpoint = Checkpoint(path, camera, world, tile_size=4)
+        checkpoint.start()
+        first = next(camera.tiles(4))
+        marked = [Color(1, 0, 1)] * (first.width * first.height)
+        checkpoint.add(first, marked)
+        checkpoint.save()
+
+        image = render_with_checkpoint(camera, world, path, tile_size=4)
+        expected = camera.render(world)
+        for x, y in first.pixels():
+            assert image.pixel_at(x, y) == Color(1, 0, 1)
+        for y in range(camera.vsize):
+            for x in range(first.width, camera.hsize):
+                assert image.pixel_at(x, y) == expected.pixel_at(x, y)
+
+    def test_checkpoint_of_another_scene_is_ignored(self, path):
+        camera, world = striped_scene()
+        render_with_checkpoint(camera, world, path, tile_size=4)
+        world.light_source = PointLight(Point(10, 10, -10), Color.white())
+        image = render_with_checkpoint(camera, world, path, tile_size=4)
+        assert_same_image(image, camera.render(world))
+        assert Checkpoint(path, camera, world, tile_size=4).load()
+
+    def test_interrupted_render_saves_completed_tiles(self, path, monkeypatch):
+        camera, world = striped_scene()
+        rendered = []
+        render_tile = camera.render_tile
+
+        def crash_after_three_tiles(world, tile, image):
+            if len(rendered) == 3:
+                raise KeyboardInterrupt
+            rendered.append(tile)
+            render_tile(world, tile, image)
+
+        monkeypatch.setattr(camera, 'render_tile', crash_after_three_tiles)
+        with pytest.raises(KeyboardInterrupt):
+            render_with_checkpoint(camera, world, path, tile_size=4)
+        checkpoint = Checkpoint(path, camera, world, tile_size=4)
+        assert checkpoint.load()
+        assert list(checkpoint.tiles) == rendered
+
+        monkeypatch.undo()
+        image = render_with_checkpoint(camera, world, path, tile_size=4)
+        assert_same_image(image, camera.render(world))
+
+    def test_incomplete_last_line_is_skipped(self, path):
+        camera, world = striped_scene()
+        render_with_checkpoint(camera, world, path, tile_size=4)
+        with open(path, 'rt') as file:
+            lines = file.readlines()
+        with open(path, 'wt') as file:
+            file.writelines(lines[:-1])
+            file.write(lines[-1][:20])
+        checkpoint = Checkpoint(path, camera, world, tile_size=4)
+        assert checkpoint.load()
+        assert len(checkpoint.tiles) == len(lines) - 2
+
+        image = render_with_checkpoint(camera, world, path, tile_size=4)
+        assert_same_image(image, camera.render(world))
+        checkpoint = Checkpoint(path, camera, world, tile_size=4)
+        assert checkpoint.load()
+        assert len(checkpoint.tiles) == len(lines) - 1
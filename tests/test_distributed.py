@@ -0,0 +1,66 @@
+from raytracer.distributed import Coordinator, render_distributed, run_worker, _receive
+from raytracer.patterns import StripePattern
+from raytracer.shapes import Sphere
+from raytracer.tuples import Color
+from .test_camera import assert_same_image, build_scene
+import pickle
+import socket
+import threading
+import pytest
+
+
+@pytest.fixture
+def scene():
+    camera, world = build_scene(Sphere())
+    world.objects[0].material.reflective = 0.3
+    return camera, world
+
+
+def crashing_worker(host, port):
+    # receives the scene and a tile, then disappears without answering
+    with socket.create_connection((host, port)) as connection:
+        _receive(connection)
+        _receive(connection)
+
+
+class TestDistributed:
+    def test_render_with_local_worker_processes(self, scene):
+        camera, world = scene
+        image = render_distributed(camera, world, workers=2, tile_size=4, timeout=30)
+        assert_same_image(image, camera.render(world))
+
+    def test_tiles_of_dead_workers_are_retried(self, scene):
+        camera, world = scene
+        coordinator = Coordinator(camera, world, tile_size=8)
+        host, port = coordinator.address
+
+        def workers():
+            crashing_worker(host, port)
+            run_worker(host, port)
+
+        thread = threading.Thread(target=workers)
+        thread.start()
+        image = coordinator.render(timeout=30)
+        thread.join()
+        assert coordinator.retried_tiles == 1
+        assert_same_image(image, camera.render(world))
+
+    def test_render_without_workers_left_fails(self, scene):
+        camera, world = scene
+        coordinator = Coordinator(camera, world, tile_size=8)
+        thread = threading.Thread(target=crashing_worker, args=coordinator.address)
+        thread.start()
+        with pytest.raises(ConnectionError):
+            coordinator.render(idle_timeout=0.5)
+        thread.join()
+
+    def test_scene_is_sent_without_caches(self, scene):
+        camera, world = scene
+        world.objects[0].material.pattern = StripePattern(Color.white(), Color.black())
+        camera.render(world)
+        coordinator = Coordinator(camera, world)
+        coordinator._server.close()
+        sent_camera, sent_world = pickle.loads(coordinator._scene)
+        assert not sent_world.compiled
+        assert sent_world._material_lighting == {}
+        assert sent_world.objects[0].material.pattern._world_to_pattern == {}
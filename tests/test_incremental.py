@@ -0,0 +1,52 @@
+from raytracer.incremental import IncrementalRenderer
+from raytracer.lights import PointLight
+from raytracer.matrices import translation
+from raytracer.shapes import Sphere
+from raytracer.tuples import Color, Point
+from .test_camera import build_scene
+import pytest
+
+
+@pytest.fixture
+def two_spheres():
+    left = Sphere()
+    left.transformation = translation(-3, 0, 0)
+    right = Sphere()
+    right.transformation = translation(3, 0, 0)
+    c, w = build_scene(left, right, hsize=32, vsize=16, floor=False, eye=Point(0, 0, -10))
+    w.light_source = PointLight(Point(0, 10, -10), Color.white())
+    return c, w
+
+
+class TestIncrementalRenderer:
+    def test_first_update_renders_everything(self, two_spheres):
+        camera, world = two_spheres
+        renderer = IncrementalRenderer(camera, world, 8)
+        renderer.update()
+        assert renderer.rendered_tiles == 8
+
+    def test_update_only_renders_tiles_of_changed_object(self, two_spheres):
+        camera, world = two_spheres
+        renderer = IncrementalRenderer(camera, world, 8)
+        renderer.render()
+        right = world.objects[1]
+        right.transformation = translation(3, 1, 0)
+        image = renderer.update(right)
+        assert 0 < renderer.rendered_tiles < 8
+
+        expected = camera.render(world)
+        for y in range(camera.vsize):
+            for x in range(camera.hsize):
+                assert image.pixel_at(x, y) == expected.pixel_at(x, y)
+
+    def test_object_moved_into_empty_tiles_is_rendered(self, two_spheres):
+        camera, world = two_spheres
+        renderer = IncrementalRenderer(camera, world, 8)
+        renderer.render()
+        added = Sphere()
+        added.transformation = translation(0, 2, 0)
+        world.add(added)
+        image = renderer.update(added)
+        assert 0 < renderer.rendered_tiles < 8
+        assert image.pixel_at(16, 2) == camera.render(world).pixel_at(16, 2)
+        assert image.pixel_at(16, 2) != Color.black()
@@ -63,6 +63,31 @@ class TestIntersections:
         xs = Intersections(i1, i2, i3, i4)
         assert xs.hit() == i4
 
+    def test_appended_and_extended_intersections_are_read_in_order(self):
+        s = Sphere()
+        xs = Intersections(Intersection(5, s))
+        xs.append(Intersection(-1, s))
+        xs.extend(Intersections(Intersection(3, s), Intersection(-2, s)))
+        xs.extend([Intersection(4, s), Intersection(1, s)])
+        assert xs.count == 6
+        assert xs.hit().t == 1
+        assert [i.t for i in xs] == [-2, -1, 1, 3, 4, 5]
+        assert xs[2] is xs.hit()
+
+    def test_to_sort_arguments_are_still_accepted(self):
+        s = Sphere()
+        xs = Intersections(Intersection(2, s))
+        xs.append(Intersection(1, s), to_sort=False)
+        xs.extend(Intersections(Intersection(0.5, s)), to_sort=False)
+        assert [i.t for i in xs] == [0.5, 1, 2]
+
+    def test_hit_of_extended_intersections_with_negative_t(self):
+        s = Sphere()
+        xs = Intersections(Intersection(-5, s))
+        xs.extend(Intersections(Intersection(-1, s)))
+        xs.extend(Intersections())
+        assert xs.hit() is None
+
     def test_precomputing_state_of_intersection(self):
         r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
         shape = Sphere()
@@ -107,6 +132,28 @@ class TestIntersections:
         comps = i.prepare_computations(r)
         assert comps.reflectv == Vector(0, sqrt(2) / 2, sqrt(2) / 2)
 
+    def test_reflection_vector_of_hit_from_inside(self):
+        r = Ray(Point(0, 0, 0), Vector(0, sqrt(2) / 2, sqrt(2) / 2))
+        i = Intersection(1, Sphere())
+        comps = i.prepare_computations(r)
+        assert comps.inside
+        assert comps.reflectv == Vector(0, -sqrt(2) / 2, -sqrt(2) / 2)
+
+    def test_offset_points_and_reflection_vector_are_computed_when_used(self):
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        i = Intersection(4, Sphere())
+        comps = i.prepare_computations(r)
+        assert comps._over_point is None and comps._under_point is None and comps._reflectv is None
+        assert comps.over_point is comps.over_point
+        assert comps._under_point is None and comps._reflectv is None
+
+    def test_intersection_objects_have_no_instance_dict(self):
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        xs = Sphere().intersect(r)
+        comps = xs.hit().prepare_computations(r, xs)
+        for obj in (xs, xs.hit(), comps):
+            assert not hasattr(obj, '__dict__')
+
     @pytest.mark.parametrize("index,n1,n2", [(0, 1.0, 1.5),
                                              (1, 1.5, 2.0),
                                              (2, 2.0, 2.5),
@@ -130,6 +177,23 @@ class TestIntersections:
         assert comps.n1 == n1
         assert comps.n2 == n2
 
+    def test_n1_and_n2_ignore_intersections_beyond_the_hit(self, glass_sphere):
+        a = glass_sphere()
+        b = glass_sphere()
+        b.material.refractive_index = 2.0
+        r = Ray(Point(0, 0, -4), Vector(0, 0, 1))
+        xs = Intersections(Intersection(2, a), Intersection(3, b), Intersection(4, b), Intersection(5, a))
+        comps = xs[0].prepare_computations(r, xs)
+        assert comps.n1 == 1.0
+        assert comps.n2 == 1.5
+
+    def test_n1_and_n2_without_intersection_list(self, glass_sphere):
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        i = Intersection(4, glass_sphere())
+        comps = i.prepare_computations(r)
+        assert comps.n1 == 0.0
+        assert comps.n2 == 0.0
+
     def test_under_point_is_offset_below_the_surface(self, glass_sphere):
         r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
         shape = glass_sphere()
@@ -1,6 +1,6 @@
 from math import sqrt
 from raytracer.lights import PointLight
-from raytracer.materials import Material
+from raytracer.materials import Material, MaterialLighting
 from raytracer.patterns import StripePattern
 from raytracer.shapes import Sphere
 from raytracer.tuples import Color, Point, Vector
@@ -86,6 +86,41 @@ class TestMaterials:
         assert m.transparency == 0.0
         assert m.refractive_index == 1.0
 
+    def test_lighting_without_specular_term(self, background):
+        m = background['m']
+        m.specular = 0
+        eyev = Vector(0, 0, -1)
+        normalv = Vector(0, 0, -1)
+        light = PointLight(Point(0, 0, -10), Color(1, 1, 1))
+        lighting = MaterialLighting(m, light)
+        assert lighting.specular_color is None
+        assert lighting(Sphere(), background['position'], eyev, normalv) == Color(1.0, 1.0, 1.0)
+
+    def test_lighting_without_diffuse_and_specular_terms_is_ambient(self, background):
+        m = background['m']
+        m.diffuse = 0
+        m.specular = 0
+        m.color = Color(0.5, 1, 1)
+        light = PointLight(Point(0, 0, -10), Color(1, 1, 0.5))
+        result = MaterialLighting(m, light)(Sphere(), background['position'], Vector(0, 0, -1), Vector(0, 0, -1))
+        assert result == Color(0.05, 0.1, 0.05)
+
+    def test_material_version_counts_changes(self):
+        m = Material()
+        assert m.version == 0
+        m.color = Color(1, 0, 0)
+        m.transparency = 0.5
+        assert m.version == 2
+
+    def test_lighting_terms_are_precomputed_per_material_and_light(self):
+        m = Material()
+        m.color = Color(1, 0.5, 0.25)
+        m.ambient = 0.5
+        lighting = MaterialLighting(m, PointLight(Point(0, 0, -10), Color(0.5, 0.5, 1)))
+        assert lighting.effective_color == Color(0.5, 0.25, 0.25)
+        assert lighting.ambient_color == Color(0.25, 0.125, 0.125)
+        assert lighting.specular_color == Color(0.45, 0.45, 0.9)
+
 
 
 
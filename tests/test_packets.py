@@ -0,0 +1,127 @@
+from math import pi
+from raytracer import EPSILON
+from raytracer.camera import Camera, Tile
+from raytracer.lights import PointLight
+from raytracer.matrices import rotation_x, rotation_z, scaling, translation, view_transform
+from raytracer.packets import intersect_packet, packet_shapes, nearest_hits, normals_at, ray_arrays, tile_rays
+from raytracer.rays import Ray
+from raytracer.scene import World
+from raytracer.shapes import Cone, Csg, Cube, Cylinder, Group, OperationType, Plane, SmoothTriangle, \
+    Sphere, Triangle
+from raytracer.tuples import Color, Point, Vector
+import math
+import random
+import numpy as np
+import pytest
+
+
+def random_rays(count=300, seed=1):
+    generator = random.Random(seed)
+    rays = []
+    for _ in range(count):
+        origin = Point(*(generator.uniform(-4, 4) for _ in range(3)))
+        target = Point(*(generator.uniform(-1.5, 1.5) for _ in range(3)))
+        rays.append(Ray(origin, (target - origin).normalize()))
+    # rays along the axes, parallel to faces and caps
+    rays += [Ray(Point(0.5, -5, 0.25), Vector(0, 1, 0)), Ray(Point(0.5, 0.5, -5), Vector(0, 0, 1)),
+             Ray(Point(-5, 0.5, 0.5), Vector(1, 0, 0)), Ray(Point(0, 0, -5), Vector(0, 0.7071, 0.7071))]
+    return rays
+
+
+def scalar_nearest(shape, ray):
+    hit = shape.intersect(ray).hit()
+    return hit.t if hit else math.inf
+
+
+def shapes():
+    capped = Cylinder(closed=True)
+    capped.minimum, capped.maximum = -1, 2
+    cone = Cone(closed=True)
+    cone.minimum, cone.maximum = -1, 0.5
+    open_cone = Cone()
+    open_cone.transformation = rotation_x(0.3)
+    cube = Cube()
+    cube.transformation = rotation_z(0.4) * scaling(1, 0.5, 2)
+    sphere = Sphere()
+    sphere.transformation = translation(0.5, 0, 0) * scaling(1, 2, 1)
+    plane = Plane()
+    plane.transformation = translation(0, -1, 0)
+    return [sphere, plane, cube, Cylinder(), capped, cone, open_cone,
+            Triangle(Point(0, 1, 0), Point(-1, 0, 0), Point(1, 0, 0)),
+            SmoothTriangle(Point(0, 1, 0), Point(-1, 0, 0), Point(1, 0, 0),
+                           Vector(0, 1, 0), Vector(-1, 0, 0), Vector(1, 0, 0))]
+
+
+class TestPackets:
+    @pytest.mark.parametrize('shape', shapes(), ids=lambda shape: type(shape).__name__)
+    def test_kernels_match_scalar_intersections(self, shape):
+        rays = random_rays()
+        expected = np.array([scalar_nearest(shape, ray) for ray in rays])
+        origins, directions = ray_arrays(rays)
+        t = nearest_hits(shape, origins, directions)
+        assert np.array_equal(np.isinf(t), np.isinf(expected))
+        hit = ~np.isinf(t)
+        assert hit.any()
+        assert np.all(np.abs(t[hit] - expected[hit]) < EPSILON)
+
+    @pytest.mark.parametrize('shape', shapes(), ids=lambda shape: type(shape).__name__)
+    def test_normals_match_scalar_normals(self, shape):
+        rays = random_rays()
+        origins, directions = ray_arrays(rays)
+        t = nearest_hits(shape, origins, directions)
+        hit = ~np.isinf(t)
+        points = origins[hit] + directions[hit] * t[hit][:, np.newaxis]
+        normals = normals_at(shape, points)
+        for ray, normal in zip([ray for ray, h in zip(rays, hit) if h], normals):
+            i = shape.intersect(ray).hit()
+            assert Vector(*normal) == shape.normal_at(ray.position(i.t), i)
+
+    def test_nested_shapes_are_intersected_in_world_space(self):
+        s = Sphere()
+        s.transformation = translation(5, 0, 0)
+        g = Group()
+        g.transformation = scaling(2, 2, 2)
+        g.add_children(s)
+        origins, directions = ray_arrays([Ray(Point(10, 0, -5), Vector(0, 0, 1))])
+        assert nearest_hits(s, origins, directions)[0] == pytest.approx(3)
+
+    def test_tile_rays_match_rays_for_pixels(self):
+        c = Camera(20, 10, pi / 2)
+        c.transformation = view_transform(Point(1, 2, -5), Point(0, 0, 0), Vector(0, 1, 0))
+        tile = Tile(4, 3, 5, 4)
+        origins, directions = tile_rays(c, tile)
+        for (x, y), origin, direction in zip(tile.pixels(), origins, directions):
+            r = c.ray_for_pixel(x, y)
+            assert Point(*origin) == r.origin
+            assert Vector(*direction) == r.direction
+
+    def test_intersect_packet_finds_nearest_shape(self):
+        w = World()
+        w.light_source = PointLight(Point(-10, 10, -10), Color.white())
+        floor = Plane()
+        floor.transformation = translation(0, -1, 0)
+        g = Group()
+        ball = Sphere()
+        box = Cube()
+        box.transformation = translation(3, 0, 0)
+        g.add_children(ball, box)
+        w.add(floor, g)
+        c = Camera(16, 12, pi / 2)
+        c.transformation = view_transform(Point(0, 1, -6), Point(1, 0, 0), Vector(0, 1, 0))
+        tile = next(c.tiles(16))
+        shapes = packet_shapes(w)
+        assert shapes == [floor, ball, box]
+        t, ids = intersect_packet(shapes, *tile_rays(c, tile))
+        for (x, y), nearest, index in zip(tile.pixels(), t, ids):
+            hit = w.intersect(c.ray_for_pixel(x, y)).hit()
+            if hit is None:
+                assert index == -1 and nearest == math.inf
+            else:
+                assert shapes[index] is hit.object
+                assert abs(nearest - hit.t) < EPSILON
+
+    def test_shapes_without_kernel_are_rejected(self):
+        w = World()
+        w.add(Csg(OperationType.UNION, Sphere(), Cube()))
+        with pytest.raises(ValueError):
+            packet_shapes(w)
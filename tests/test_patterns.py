@@ -1,7 +1,11 @@
 from raytracer.matrices import Matrix, scaling, translation
-from raytracer.patterns import Pattern, StripePattern, GradientPattern, RingPattern, CheckersPattern
-from raytracer.shapes import Sphere
+from raytracer.noise import PerlinNoise
+from raytracer.patterns import Pattern, StripePattern, GradientPattern, RingPattern, CheckersPattern, \
+    RadialGradientPattern, NoisePattern, TurbulencePattern, PerturbedPattern
+from raytracer.shapes import Group, Instance, InstancedShape, Sphere
 from raytracer.tuples import Color, Point
+import numpy as np
+import pytest
 
 
 def test_pattern():
@@ -101,3 +105,78 @@ class TestPatterns:
         assert pattern.pattern_at(Point(0, 0, 0)) == Color.white()
         assert pattern.pattern_at(Point(0, 0, 0.99)) == Color.white()
         assert pattern.pattern_at(Point(0, 0, 1.01)) == Color.black()
+
+    def test_world_to_pattern_matrix_follows_changed_transformations(self):
+        group = Group()
+        obj = Sphere()
+        group.add_children(obj)
+        pattern = test_pattern()
+        assert pattern.pattern_at_shape(obj, Point(2, 3, 4)) == Color(2, 3, 4)
+        obj.transformation = scaling(2, 2, 2)
+        assert pattern.pattern_at_shape(obj, Point(2, 3, 4)) == Color(1, 1.5, 2)
+        group.transformation = translation(0, 1, 0)
+        assert pattern.pattern_at_shape(obj, Point(2, 3, 4)) == Color(1, 1, 2)
+        pattern.transformation = translation(1, 0, 0)
+        assert pattern.pattern_at_shape(obj, Point(2, 3, 4)) == Color(0, 1, 2)
+
+    def test_world_to_pattern_matrix_is_cached_once_per_instanced_shape(self):
+        obj = Sphere()
+        first = Instance(obj)
+        first.transformation = translation(1, 0, 0)
+        second = Instance(obj)
+        pattern = test_pattern()
+        for _ in range(3):
+            assert pattern.pattern_at_shape(InstancedShape(first, obj), Point(2, 3, 4)) == Color(1, 3, 4)
+            assert pattern.pattern_at_shape(InstancedShape(second, obj), Point(2, 3, 4)) == Color(2, 3, 4)
+        assert len(pattern._world_to_pattern) == 2
+
+    @pytest.mark.parametrize("pattern_type", [StripePattern, GradientPattern, RingPattern, CheckersPattern,
+                                              RadialGradientPattern, NoisePattern, TurbulencePattern])
+    def test_pattern_at_many_matches_pattern_at(self, pattern_type):
+        pattern = pattern_type(Color(1, 0.5, 0), Color(0, 0.25, 1))
+        points = np.random.default_rng(7).uniform(-3, 3, (50, 3))
+        colors = pattern.pattern_at_many(points)
+        for point, color in zip(points, colors):
+            assert Color(*color) == pattern.pattern_at(Point(*point))
+
+    def test_pattern_at_shape_many_applies_shape_and_pattern_transformation(self):
+        obj = Sphere()
+        obj.transformation = scaling(2, 2, 2)
+        pattern = test_pattern()
+        pattern.transformation = translation(0.5, 1, 1.5)
+        colors = pattern.pattern_at_shape_many(obj, np.array([[2.5, 3, 3.5], [2, 3, 4]]))
+        assert Color(*colors[0]) == Color(0.75, 0.5, 0.25)
+        assert Color(*colors[1]) == Color(0.5, 0.5, 0.5)
+
+    def test_perlin_noise_is_zero_on_lattice_points(self):
+        noise = PerlinNoise()
+        assert noise.noise(0, 0, 0) == 0
+        assert noise.noise(3, -2, 7) == 0
+
+    def test_perlin_noise_is_deterministic_per_seed(self):
+        assert PerlinNoise(1).noise(0.3, 1.7, -2.2) == PerlinNoise(1).noise(0.3, 1.7, -2.2)
+        assert PerlinNoise(1).noise(0.3, 1.7, -2.2) != PerlinNoise(2).noise(0.3, 1.7, -2.2)
+
+    def test_noise_many_and_lattice_cache_match_scalar_noise(self):
+        noise = PerlinNoise(3)
+        cached = PerlinNoise(3, cache_lattice=True)
+        points = np.random.default_rng(3).uniform(-300, 300, (100, 3))
+        values = noise.noise_many(points)
+        for point, value in zip(points, values):
+            assert noise.noise(*point) == pytest.approx(value)
+            assert cached.noise(*point) == pytest.approx(value)
+            assert -1.5 < value < 1.5
+
+    def test_perturbed_pattern_without_scale_matches_wrapped_pattern(self):
+        stripes = StripePattern(Color.white(), Color.black())
+        stripes.transformation = scaling(0.5, 0.5, 0.5)
+        pattern = PerturbedPattern(stripes, scale=0)
+        for x in (0.1, 0.6, 1.2, -0.3):
+            assert pattern.pattern_at(Point(x, 0, 0)) == stripes.pattern_at(Point(2 * x, 0, 0))
+
+    def test_perturbed_pattern_at_many_matches_pattern_at(self):
+        pattern = PerturbedPattern(RingPattern(Color(1, 0, 0), Color(0, 0, 1)), scale=0.5)
+        points = np.random.default_rng(5).uniform(-3, 3, (50, 3))
+        colors = pattern.pattern_at_many(points)
+        for point, color in zip(points, colors):
+            assert Color(*color) == pattern.pattern_at(Point(*point))
@@ -1,3 +1,4 @@
+from raytracer import INF
 from raytracer.matrices import translation, scaling
 from raytracer.rays import Ray
 from raytracer.tuples import Point, Vector
@@ -32,3 +33,10 @@ class TestRays:
         assert r2.origin == Point(2, 6, 12)
         assert r2.direction == Vector(0, 3, 0)
 
+    def test_ray_precomputes_inverse_direction_and_signs(self):
+        r = Ray(Point(1, 2, 3), Vector(2, -4, 0))
+        assert r.inverse_direction == (0.5, -0.25, INF)
+        assert r.signs == (0, 1, 0)
+        r = Ray(Point(1, 2, 3), Vector(0, 0, -0.0))
+        assert r.inverse_direction[2] == -INF
+        assert r.signs == (0, 0, 1)
@@ -0,0 +1,65 @@
+from raytracer.canvas import Canvas
+from raytracer.sampling import Sampler, radical_inverse
+from raytracer.shapes import Sphere
+from raytracer.tuples import Color
+from .test_camera import build_scene
+import pytest
+
+
+@pytest.fixture
+def scene():
+    ball = Sphere()
+    ball.material.reflective = 0.5
+    c, w = build_scene(ball, hsize=16, vsize=8)
+    w.objects[0].material.reflective = 0.5
+    w.min_contribution = 0.4
+    w.russian_roulette = True
+    c.samples = 4
+    return c, w
+
+
+def pixels(image):
+    # plain tuples, so pixels are compared exactly
+    return [tuple(image.pixel_at(x, y)) for y in range(image.height) for x in range(image.width)]
+
+
+class TestSampling:
+    def test_radical_inverse(self):
+        assert [radical_inverse(i, 2) for i in range(5)] == [0, 0.5, 0.25, 0.75, 0.125]
+        assert radical_inverse(5, 3) == pytest.approx(7 / 9)
+
+    def test_samples_only_depend_on_their_key(self):
+        sampler = Sampler()
+        values = [sampler.sample(3, 4, index, dimension) for index in range(4) for dimension in range(20)]
+        assert all(0 <= value < 1 for value in values)
+        assert values == [Sampler().sample(3, 4, index, dimension) for index in range(4) for dimension in range(20)]
+        assert sampler.sample(3, 4, 0, 0) != sampler.sample(4, 3, 0, 0)
+        assert sampler.sample(3, 4, 0, 30) != Sampler(1).sample(3, 4, 0, 30)
+
+    def test_samples_of_a_pixel_are_spread_evenly(self):
+        sampler = Sampler()
+        values = sorted(sampler.sample(7, 2, index, 0) for index in range(8))
+        # a shifted halton sequence in base 2 puts one sample in every eighth
+        assert all(abs((b - a) - 0.125) < 1e-9 for a, b in zip(values, values[1:]))
+
+    def test_image_does_not_depend_on_render_order(self, scene):
+        camera, world = scene
+        expected = camera.render(world)
+        assert world.statistics.terminated_rays > 0
+
+        image = Canvas(camera.hsize, camera.vsize)
+        for tile in reversed(list(camera.tiles(4))):
+            camera.render_tile(world, tile, image)
+        assert pixels(image) == pixels(expected)
+
+    def test_antialiased_pixel_averages_samples_within_the_pixel(self, scene):
+        camera, world = scene
+        world.compile()
+        color = camera.pixel_color(world, 8, 5)
+        samples = []
+        for index in range(camera.samples):
+            world.start_sample(8, 5, index)
+            dx, dy = world.next_sample(), world.next_sample()
+            assert 0 <= dx < 1 and 0 <= dy < 1
+            samples.append(world.color_at(camera.ray_for_pixel(8, 5, dx, dy)))
+        assert color == sum(samples, Color.black()) * (1 / camera.samples)
@@ -2,10 +2,11 @@ from math import pi, sqrt
 from raytracer.camera import Camera
 from raytracer.intersections import Intersection, Intersections
 from raytracer.lights import PointLight
+from raytracer.materials import Material
 from raytracer.matrices import scaling, view_transform, translation
 from raytracer.rays import Ray
 from raytracer.scene import World
-from raytracer.shapes import Sphere, Plane
+from raytracer.shapes import Csg, Cube, Instance, OperationType, Sphere, Plane
 from raytracer.tuples import Point, Color, Vector
 from .test_patterns import test_pattern
 import pytest
@@ -82,6 +83,98 @@ class TestScene:
         c = w.color_at(r)
         assert c == inner.material.color
 
+    def test_compile_records_material_features(self, default_world):
+        w = default_world
+        glass = Sphere()
+        glass.material.transparency = 1.0
+        glass.material.reflective = 0.9
+        w.add(glass)
+        assert not w.compiled
+        w.compile()
+        assert w.compiled
+        assert w._features_of(w.objects[0].material) == (False, False, False)
+        assert w._features_of(glass.material) == (True, True, False)
+        w.add(Plane())
+        assert not w.compiled
+
+    def test_compile_precomputes_lighting_per_material(self, default_world):
+        w = default_world
+        w.compile()
+        material = w.objects[0].material
+        lighting = w._lighting_of(material)
+        assert w._lighting_of(material) is lighting
+        assert lighting.effective_color == Color(0.8, 1.0, 0.6)
+        # a new light is not lit with the terms of the old one
+        w.light_source = PointLight(Point(0, 0.25, 0), Color(1, 1, 1))
+        assert w._lighting_of(material) is not lighting
+        assert w._lighting_of(material).light is w.light_source
+
+    def test_materials_and_light_changed_after_render_are_shaded_anew(self, default_world):
+        w = default_world
+        cam = Camera(5, 5, pi / 3)
+        cam.transformation = view_transform(Point(0, 0, -5), Point(0, 0, 0), Vector(0, 1, 0))
+        cam.render(w)
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        w.objects[0].material.color = Color(1, 0, 0)
+        w.light_source.intensity = Color(0.5, 0.5, 0.5)
+        assert w.color_at(r) == Color(0.23791, 0, 0)
+
+    def test_compile_records_features_of_instanced_prototypes(self):
+        w = World()
+        glass = Sphere()
+        glass.material.transparency = 1.0
+        w.add(Instance(glass), Instance(glass))
+        w.compile()
+        assert w._transparent
+        assert w._features_of(glass.material).refractive
+
+    def test_compile_records_features_of_instance_materials(self, default_world):
+        w = default_world
+        glass = Material()
+        glass.transparency = 1.0
+        glass.refractive_index = 1.5
+        instance = Instance(Sphere(), glass)
+        instance.transformation = translation(0, 0, -3)
+        w.add(instance)
+        cam = Camera(5, 5, pi / 3)
+        cam.transformation = view_transform(Point(0, 0, -6), Point(0, 0, 0), Vector(0, 1, 0))
+        expected = [w.color_at(cam.ray_for_pixel(x, y)) for y in range(5) for x in range(5)]
+        image = cam.render(w)
+        assert w._transparent
+        assert w._features_of(glass).refractive
+        assert [image.pixel_at(x, y) for y in range(5) for x in range(5)] == expected
+
+    def test_compiled_opaque_world_shades_like_uncompiled_world(self, default_world):
+        w = default_world
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        expected = w.color_at(r)
+        w.compile()
+        assert w.color_at(r) == expected
+        assert w.color_at(r) == Color(0.38066, 0.47583, 0.2855)
+
+    def test_compiled_world_notices_materials_changed_afterwards(self, default_world):
+        w = default_world
+        w.compile()
+        material = w.objects[0].material
+        material.transparency = 1.0
+        material.refractive_index = 1.5
+        assert w._features_of(material).refractive
+        assert w.compiled
+        r = Ray(Point(0, 0.1, -5), Vector(0, 0, 1))
+        assert w.color_at(r) == Color(0.51352, 0.61690, 0.41014)
+
+    def test_optimizing_world_replaces_redundant_csg_objects(self, default_world):
+        w = default_world
+        cube = Cube()
+        cube.transformation = translation(0, 0, 5)
+        c = Csg(OperationType.DIFFERENCE, w.objects[0], cube)
+        w.objects[0] = c
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        expected = w.color_at(r)
+        w.optimize()
+        assert isinstance(w.objects[0], Sphere)
+        assert w.color_at(r) == expected
+
     def test_render_world_with_camera(self, default_world):
         w = default_world
         c = Camera(11, 11, pi / 2)
@@ -187,6 +280,51 @@ class TestScene:
         color = w.reflected_color(comps, 0)
         assert color == Color.black()
 
+    def test_reflected_color_with_too_little_contribution(self, default_world):
+        w = default_world
+        w.min_contribution = 0.1
+        shape = Plane()
+        shape.material.reflective = 0.5
+        shape.transformation = translation(0, -1, 0)
+        w.add(shape)
+        r = Ray(Point(0, 0, -3), Vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+        i = Intersection(sqrt(2), shape)
+        comps = i.prepare_computations(r)
+        assert w.reflected_color(comps, 4, 0.1) == Color.black()
+        assert w.statistics.terminated_rays == 1
+        assert w.reflected_color(comps, 4, 0.2) == Color(0.19033, 0.23791, 0.14274)
+        assert w.statistics.secondary_rays == 1
+
+    def test_mildly_reflective_surfaces_stop_recursing(self):
+        w = World()
+        w.light_source = PointLight(Point(0, 0, 0), Color.white())
+        lower = Plane()
+        lower.material.reflective = 0.1
+        lower.transformation = translation(0, -1, 0)
+        upper = Plane()
+        upper.material.reflective = 0.1
+        upper.transformation = translation(0, 1, 0)
+        w.add(lower, upper)
+        w.min_contribution = 0.005
+        w.color_at(Ray(Point(0, 0, 0), Vector(0, 1, 0)))
+        assert w.statistics.secondary_rays == 2
+        assert w.statistics.terminated_rays == 1
+
+    def test_russian_roulette_weights_up_surviving_rays(self, default_world):
+        w = default_world
+        w.min_contribution = 1.0
+        w.russian_roulette = True
+        shape = Plane()
+        shape.material.reflective = 0.5
+        shape.transformation = translation(0, -1, 0)
+        w.add(shape)
+        r = Ray(Point(0, 0, -3), Vector(0, -sqrt(2) / 2, sqrt(2) / 2))
+        comps = Intersection(sqrt(2), shape).prepare_computations(r)
+        colors = [w.reflected_color(comps) for _ in range(20)]
+        survivors = [c for c in colors if c != Color.black()]
+        assert 0 < len(survivors) < 20
+        assert all(c == Color(0.38066, 0.47583, 0.2855) for c in survivors)
+
     def test_refracted_color_with_opaque_surface(self, default_world):
         w = default_world
         shape = w.objects[0]
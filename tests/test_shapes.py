@@ -1,10 +1,13 @@
 from math import sqrt, pi
 
+import pickle
 import pytest
+import random
 
 from raytracer.matrices import translation, scaling, rotation_z, rotation_y, rotation_x
 from raytracer.shapes import *
 from raytracer.tuples import Vector, Point
+from .test_camera import assert_same_image, build_scene
 
 
 def test_shape():
@@ -498,6 +501,168 @@ class TestGroups:
         assert box.minimum == Point(-4.5, -3, -5)
         assert box.maximum == Point(4, 7, 4.5)
 
+    def test_walk_visits_group_and_all_descendants(self):
+        s1 = Sphere()
+        s2 = Sphere()
+        inner = Group()
+        inner.add_children(s2)
+        outer = Group()
+        outer.add_children(s1, inner)
+        assert list(outer.walk()) == [outer, s1, inner, s2]
+
+    def test_flattened_hierarchy_intersects_and_shades_like_nested_one(self):
+        g1 = Group()
+        g1.transformation = rotation_y(pi / 2)
+        g2 = Group()
+        g2.transformation = scaling(1, 2, 3)
+        g1.add_children(g2)
+        s = Sphere()
+        s.transformation = translation(5, 0, 0)
+        g2.add_children(s)
+        r = Ray(Point(0, 0, 0), Vector(0, 0, -1))
+        xs = g1.intersect(r)
+        assert xs.count == 2
+        n = s.normal_at(Point(1.7321, 1.1547, -5.5774))
+        p = s.world_to_object(Point(-2, 0, -10))
+
+        g1.flatten()
+        assert g1.flattened and g2.flattened and s.flattened
+        flat_xs = g1.intersect(r)
+        assert [i.t for i in flat_xs] == pytest.approx([i.t for i in xs])
+        assert s.normal_at(Point(1.7321, 1.1547, -5.5774)) == n
+        assert s.world_to_object(Point(-2, 0, -10)) == p
+
+    def test_changing_transformation_unflattens_whole_hierarchy(self):
+        g = Group()
+        s = Sphere()
+        g.add_children(s)
+        g.flatten()
+        s.transformation = translation(0, 0, 1)
+        assert not g.flattened and not s.flattened
+        assert s.world_to_object(Point(0, 0, 0)) == Point(0, 0, -1)
+
+    def test_only_whole_hierarchies_can_be_flattened(self):
+        g = Group()
+        s = Sphere()
+        g.add_children(s)
+        with pytest.raises(ValueError):
+            s.flatten()
+
+    def test_splitting_bounding_box_along_longest_axis(self):
+        box = BoundingBox(Point(-1, -2, -3), Point(9, 5.5, 3))
+        left, right = box.split_bounds()
+        assert left.minimum == Point(-1, -2, -3)
+        assert left.maximum == Point(4, 5.5, 3)
+        assert right.minimum == Point(4, -2, -3)
+        assert right.maximum == Point(9, 5.5, 3)
+
+    def test_partitioning_children_of_group(self):
+        s1 = Sphere()
+        s1.transformation = translation(-2, 0, 0)
+        s2 = Sphere()
+        s2.transformation = translation(2, 0, 0)
+        s3 = Sphere()
+        g = Group()
+        g.add_children(s1, s2, s3)
+        left, right = g.partition_children()
+        assert list(g) == [s3]
+        assert left == [s1]
+        assert right == [s2]
+
+    def test_subdividing_group_partitions_its_children(self):
+        s1 = Sphere()
+        s1.transformation = translation(-2, -2, 0)
+        s2 = Sphere()
+        s2.transformation = translation(-2, 2, 0)
+        s3 = Sphere()
+        s3.transformation = scaling(4, 4, 4)
+        g = Group()
+        g.add_children(s1, s2, s3)
+        g.divide(1)
+        assert g[0] == s3
+        subgroup = g[1]
+        assert isinstance(subgroup, Group)
+        assert subgroup.count == 2
+        assert list(subgroup[0]) == [s1]
+        assert list(subgroup[1]) == [s2]
+
+    def test_group_bounds_follow_changed_child_transformation(self):
+        s = Sphere()
+        inner = Group()
+        inner.add_children(s)
+        outer = Group()
+        outer.add_children(inner)
+        assert outer.bounds().maximum == Point(1, 1, 1)
+        s.transformation = translation(2, 0, 0)
+        assert outer.bounds().maximum == Point(3, 1, 1)
+
+    @pytest.mark.parametrize("flattened", [False, True])
+    def test_group_bounds_follow_changed_child_geometry(self, flattened):
+        cylinder = Cylinder()
+        cylinder.minimum, cylinder.maximum = 0, 1
+        g = Group()
+        g.add_children(cylinder)
+        r = Ray(Point(0, 5, -5), Vector(0, 0, 1))
+        if flattened:
+            g.flatten()
+        assert g.intersect(r).count == 0
+        cylinder.maximum = 10
+        if flattened:
+            g.flatten()
+        assert g.intersect(r).count == 2
+        assert g.bounds().maximum == Point(1, 10, 1)
+
+
+class TestInstances:
+    def test_instance_intersects_its_prototype_with_own_transformation(self):
+        prototype = Group()
+        s = Sphere()
+        s.transformation = translation(0, 0, 1)
+        prototype.add_children(s)
+        instance = Instance(prototype)
+        instance.transformation = translation(0, 0, 2)
+        xs = instance.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1)))
+        assert [i.t for i in xs] == [7, 9]
+        assert xs[0].object == InstancedShape(instance, s)
+        assert instance.includes(xs[0].object)
+        assert not prototype.includes(xs[0].object)
+
+    def test_normal_on_instanced_shape(self):
+        s = Sphere()
+        instance = Instance(s)
+        instance.transformation = translation(5, 0, 0) * scaling(1, 2, 1)
+        shape = InstancedShape(instance, s)
+        reference = Sphere()
+        reference.transformation = instance.transformation
+        p = Point(5, sqrt(2), -sqrt(2) / 2)
+        assert shape.normal_at(p) == reference.normal_at(p)
+
+    def test_instances_share_prototype_but_not_material(self):
+        s = Sphere()
+        s.material.ambient = 0.5
+        first = Instance(s)
+        override = Material()
+        second = Instance(s, override)
+        assert InstancedShape(first, s).material is s.material
+        assert InstancedShape(second, s).material is override
+
+    def test_flattening_instances_flattens_prototype_once(self):
+        prototype = Group()
+        prototype.add_children(Sphere())
+        g = Group()
+        g.add_children(Instance(prototype), Instance(prototype))
+        g.flatten()
+        assert prototype.flattened
+        xs = g.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1)))
+        assert [i.t for i in xs] == [4, 4, 6, 6]
+
+    def test_prototype_cannot_have_parent(self):
+        g = Group()
+        s = Sphere()
+        g.add_children(s)
+        with pytest.raises(ValueError):
+            Instance(s)
+
 
 class TestBoundingBoxes:
     def test_create_empty_bounding_box(self):
@@ -582,6 +747,7 @@ class TestBoundingBoxes:
         r = Ray(origin, norm_direction)
         xs = box.intersect(r)
         assert (xs.count > 0) is result
+        assert (box.slab_test(r) is not None) is result
 
     @pytest.mark.parametrize("origin, direction, result", [(Point(15, 1, 2), Vector(-1, 0, 0), True),
                                                            (Point(-5, -1, 4), Vector(1, 0, 0), True),
@@ -602,6 +768,25 @@ class TestBoundingBoxes:
         r = Ray(origin, norm_direction)
         xs = box.intersect(r)
         assert (xs.count > 0) is result
+        assert (box.slab_test(r) is not None) is result
+
+    def test_slab_test_returns_where_line_enters_and_leaves_box(self):
+        box = BoundingBox(Point(-1, -2, -3), Point(1, 2, 3))
+        assert box.slab_test(Ray(Point(0, 0, -5), Vector(0, 0, 1))) == (2, 8)
+        assert box.slab_test(Ray(Point(0, 0, 5), Vector(0, 0, 1))) == (-8, -2)
+        assert box.slab_test(Ray(Point(0, 5, 0), Vector(0, -1, 0))) == (3, 7)
+
+    def test_slab_test_with_ray_running_along_face(self):
+        box = BoundingBox(Point(-1, -1, -1), Point(1, 1, 1))
+        assert box.slab_test(Ray(Point(1, 0, -5), Vector(0, 0, 1))) is not None
+        assert box.slab_test(Ray(Point(1.001, 0, -5), Vector(0, 0, 1))) is None
+
+    def test_slab_test_with_empty_and_infinite_boxes(self):
+        r = Ray(Point(0, 0, -5), Vector(0, 0, 1))
+        assert BoundingBox().slab_test(r) is None
+        assert Plane().bounds().slab_test(Ray(Point(0, 1, -5), Vector(0, 0, 1))) is None
+        assert Plane().bounds().slab_test(Ray(Point(0, 1, 0), Vector(0, -1, 0))) is not None
+        assert Cylinder().bounds().slab_test(r) is not None
 
     def test_intersect_ray_group_doesnt_test_children_if_box_is_missed(self):
         child = test_shape()
@@ -619,6 +804,57 @@ class TestBoundingBoxes:
         xs = g.intersect(r)
         assert child.saved_ray
 
+    def test_unbounded_children_dont_widen_group_box(self):
+        child = test_shape()
+        floor = Plane()
+        floor.transformation = translation(0, -1, 0)
+        g = Group()
+        g.add_children(child, floor)
+        bounded, box, unbounded = g.split_children()
+        assert bounded == [child]
+        assert unbounded == [floor]
+        assert box.minimum == Point(-1, -1, -1)
+        assert box.maximum == Point(1, 1, 1)
+        assert not g.bounds().finite
+
+    def test_unbounded_children_are_tested_when_box_is_missed(self):
+        child = test_shape()
+        floor = Plane()
+        floor.transformation = translation(0, -5, 0)
+        g = Group()
+        g.add_children(child, floor)
+        g.flatten()
+        r = Ray(Point(0, 0, -5), Vector(0, -1, 0))
+        xs = g.intersect(r)
+        assert not child.saved_ray
+        assert xs.count == 1
+        assert xs[0].object is floor
+
+    def test_child_becoming_unbounded_moves_out_of_group_box(self):
+        cylinder = Cylinder()
+        cylinder.minimum, cylinder.maximum = 0, 1
+        g = Group()
+        g.add_children(cylinder, Sphere())
+        assert g.split_children()[2] == []
+        cylinder.minimum = -INF
+        bounded, box, unbounded = g.split_children()
+        assert unbounded == [cylinder]
+        assert box.maximum == Point(1, 1, 1)
+        assert g.intersect(Ray(Point(0, -5, -5), Vector(0, 0, 1))).count == 2
+
+    def test_subdividing_group_leaves_unbounded_children_in_group(self):
+        s1 = Sphere()
+        s1.transformation = translation(-2, 0, 0)
+        s2 = Sphere()
+        s2.transformation = translation(2, 0, 0)
+        cylinder = Cylinder()
+        g = Group()
+        g.add_children(s1, cylinder, s2)
+        g.divide(1)
+        assert g[0] is cylinder
+        assert list(g[1]) == [s1]
+        assert list(g[2]) == [s2]
+
 
 class TestTriangles:
     def test_constructing_triangle(self):
@@ -721,6 +957,82 @@ class TestSmoothTriangles:
         assert comps.normalv == Vector(-0.5547, 0.83205, 0)
 
 
+def random_triangles(count, seed=1):
+    generator = random.Random(seed)
+    triangles = []
+    for index in range(count):
+        p1, p2, p3 = (Point(*(generator.uniform(-1, 1) for _ in range(3))) for _ in range(3))
+        if index % 2:
+            triangles.append(Triangle(p1, p2, p3))
+        else:
+            triangles.append(SmoothTriangle(p1, p2, p3, Vector(0, 1, 0), Vector(-1, 0, 0), Vector(1, 0, 0)))
+    return triangles
+
+
+class TestTriangleArrays:
+    def test_arrays_match_triangles(self):
+        triangles = random_triangles(16)
+        arrays = TriangleArrays(triangles)
+        generator = random.Random(2)
+        hits = 0
+        for _ in range(200):
+            origin = Point(generator.uniform(-1, 1), generator.uniform(-1, 1), -3)
+            r = Ray(origin, (Point(0, 0, generator.uniform(-1, 1)) - origin).normalize())
+            expected = sorted((i for t in triangles for i in t._local_intersect(r)), key=lambda i: i.t)
+            xs = sorted(arrays.intersect(r), key=lambda i: i.t)
+            assert [i.object for i in xs] == [i.object for i in expected]
+            for i, e in zip(xs, expected):
+                assert i.t == pytest.approx(e.t) and i.u == pytest.approx(e.u) and i.v == pytest.approx(e.v)
+            hits += len(xs)
+        assert hits > 0
+
+    def test_parallel_ray_misses_arrays(self):
+        arrays = TriangleArrays([Triangle(Point(0, 1, 0), Point(-1, 0, 0), Point(1, 0, 0))] * 4)
+        assert arrays.intersect(Ray(Point(0, -1, -2), Vector(0, 1, 0))) == []
+
+    def test_group_intersects_untransformed_triangles_as_arrays(self):
+        triangles = random_triangles(TRIANGLE_ARRAY_THRESHOLD)
+        moved = Triangle(Point(0, 1, 0), Point(-1, 0, 0), Point(1, 0, 0))
+        moved.transformation = translation(0, 0, 0.5)
+        s = Sphere()
+        g = Group()
+        g.add_children(*triangles, moved, s)
+        arrays, others = g.mesh_children()
+        assert arrays.triangles == triangles
+        assert others == [moved, s]
+        g.remove_child(triangles[0])
+        arrays, others = g.mesh_children()
+        assert arrays is None and len(others) == TRIANGLE_ARRAY_THRESHOLD + 1
+
+    def test_group_arrays_follow_edited_triangle_points(self):
+        triangles = [Triangle(Point(0, 1, z), Point(-1, 0, z), Point(1, 0, z)) for z in range(TRIANGLE_ARRAY_THRESHOLD)]
+        g = Group()
+        g.add_children(*triangles)
+        r = Ray(Point(5, 0.5, -5), Vector(0, 0, 1))
+        assert g.intersect(r).count == 0
+        triangles[2].p1, triangles[2].p2, triangles[2].p3 = Point(5, 1, 2), Point(4, 0, 2), Point(6, 0, 2)
+        xs = g.intersect(r)
+        assert xs.count == 1
+        assert xs[0].object is triangles[2] and xs[0].t == 7
+
+    @pytest.mark.parametrize('flatten', [False, True])
+    def test_group_of_triangles_matches_separate_triangles(self, flatten):
+        g = Group()
+        g.transformation = translation(1, 0, 0) * rotation_y(0.5)
+        g.add_children(*random_triangles(12))
+        if flatten:
+            g.flatten()
+        r = Ray(Point(1.1, 0.1, -5), Vector(0, 0, 1))
+        xs = g.intersect(r)
+        assert xs.count > 1
+        assert [i.t for i in xs] == sorted(i.t for i in xs)
+        for i in xs:
+            e = i.object._local_intersect(Ray(g.world_to_object(r.origin), g.world_to_object(r.direction)))
+            assert e.count == 1 and i.t == pytest.approx(e[0].t)
+            # smooth triangles interpolate their normals with the u and v of the hit
+            assert i.object.normal_at(r.position(i.t), i) == i.object.normal_at(r.position(i.t), e[0])
+
+
 class TestCsg:
     def test_constructing_csg(self):
         s1 = Sphere()
@@ -802,3 +1114,138 @@ class TestCsg:
         box = c.bounds()
         assert box.minimum == Point(-1, -1, -1)
         assert box.maximum == Point(3, 4, 5)
+
+    def test_csg_doesnt_test_operands_if_box_is_missed(self):
+        left = test_shape()
+        right = test_shape()
+        right.transformation = translation(0, 0, 1)
+        c = Csg(OperationType.UNION, left, right)
+        xs = c.intersect(Ray(Point(0, 3, -5), Vector(0, 0, 1)))
+        assert xs.count == 0
+        assert not left.saved_ray
+        assert not right.saved_ray
+
+    def test_difference_doesnt_test_right_operand_if_left_is_missed(self):
+        left = test_shape()
+        left.transformation = translation(5, 0, 0)
+        right = test_shape()
+        c = Csg(OperationType.DIFFERENCE, left, right)
+        xs = c.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1)))
+        assert xs.count == 0
+        assert not left.saved_ray
+        assert not right.saved_ray
+
+    def test_union_with_missed_operand_keeps_hits_of_other_operand(self):
+        left = Sphere()
+        left.transformation = translation(5, 0, 0)
+        right = Sphere()
+        c = Csg(OperationType.UNION, left, right)
+        c.flatten()
+        xs = c.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1)))
+        assert [i.object for i in xs] == [right, right]
+
+    @pytest.mark.parametrize("flattened", [False, True])
+    def test_csg_with_infinite_operand_is_not_culled(self, flattened):
+        c = Csg(OperationType.INTERSECTION, Cube(), Plane())
+        plane = Plane()
+        plane.transformation = translation(0, 0.5, 0)
+        d = Csg(OperationType.DIFFERENCE, Cube(), plane)
+        if flattened:
+            c.flatten()
+            d.flatten()
+        r = Ray(Point(0, 5, 0), Vector(0, -1, 0))
+        assert [i.t for i in c.intersect(r)] == [5, 6]
+        assert [i.t for i in d.intersect(r)] == [4, 4.5]
+
+    def test_csg_of_instances_filters_by_instance(self):
+        prototype = Sphere()
+        left = Instance(prototype)
+        right = Instance(prototype)
+        right.transformation = translation(0, 0, 0.5)
+        c = Csg(OperationType.DIFFERENCE, left, right)
+        c.flatten()
+        xs = c.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1)))
+        assert [i.t for i in xs] == [4, 4.5]
+        assert [i.object.instance for i in xs] == [left, right]
+
+    def test_optimizing_difference_drops_right_operand_it_cannot_overlap(self):
+        left = Sphere()
+        left.transformation = translation(1, 0, 0)
+        c = Csg(OperationType.DIFFERENCE, left, Cube())
+        c.transformation = scaling(2, 2, 2)
+        c.right.transformation = translation(5, 0, 0)
+        optimized = c.optimize()
+        assert optimized is left
+        assert left.parent is None
+        assert left.transformation == scaling(2, 2, 2) * translation(1, 0, 0)
+
+    def test_optimizing_intersection_of_disjoint_operands_leaves_empty_group(self):
+        right = Sphere()
+        right.transformation = translation(0, 3, 0)
+        c = Csg(OperationType.INTERSECTION, Sphere(), right)
+        optimized = c.optimize()
+        assert isinstance(optimized, Group)
+        assert optimized.empty
+        assert optimized.intersect(Ray(Point(0, 0, -5), Vector(0, 0, 1))).count == 0
+
+    def test_optimizing_union_of_disjoint_operands_makes_group(self):
+        left = Sphere()
+        right = Sphere()
+        right.transformation = translation(3, 0, 0)
+        c = Csg(OperationType.UNION, left, right)
+        c.transformation = translation(0, 1, 0)
+        optimized = c.optimize()
+        assert isinstance(optimized, Group)
+        assert list(optimized) == [left, right]
+        assert optimized.transformation == translation(0, 1, 0)
+        assert right.transformation == translation(3, 0, 0)
+        r = Ray(Point(-5, 1, 0), Vector(1, 0, 0))
+        assert [i.t for i in optimized.intersect(r)] == [4, 6, 7, 9]
+
+    def test_optimizing_keeps_overlapping_operands(self):
+        right = Sphere()
+        right.transformation = translation(0.5, 0, 0)
+        for operation in OperationType:
+            c = Csg(operation, Sphere(), right)
+            assert c.optimize() is c
+            right.parent = None
+
+    def test_optimizing_keeps_infinite_operands(self):
+        c = Csg(OperationType.INTERSECTION, Cube(), Plane())
+        assert c.optimize() is c
+        cylinder = Cylinder()
+        cylinder.transformation = translation(5, 0, 0)
+        d = Csg(OperationType.DIFFERENCE, Sphere(), cylinder)
+        assert d.optimize() is d
+
+    def test_optimizing_replaces_nested_nodes(self):
+        inner_right = Sphere()
+        inner_right.transformation = translation(5, 0, 0)
+        inner = Csg(OperationType.DIFFERENCE, Sphere(), inner_right)
+        outer = Csg(OperationType.UNION, inner, Cube())
+        g = Group()
+        g.add_children(outer)
+        assert g.optimize() is g
+        assert g[0] is outer
+        assert isinstance(outer.left, Sphere)
+        assert outer.left.parent is outer
+        assert inner not in outer.left_shapes()
+
+    def test_left_operand_shapes_follow_changes_to_groups(self):
+        s1 = Sphere()
+        s2 = Sphere()
+        s2.transformation = translation(0, 0, 0.5)
+        g = Group()
+        g.add_children(s1)
+        c = Csg(OperationType.UNION, g, Sphere())
+        assert s2 not in c.left_shapes()
+        g.add_children(s2)
+        assert s2 in c.left_shapes()
+
+    def test_rendered_csg_renders_the_same_after_pickling(self):
+        cube = Cube()
+        cube.transformation = translation(0.5, 0.5, -0.5)
+        camera, world = build_scene(Csg(OperationType.DIFFERENCE, Sphere(), cube))
+        image = camera.render(world)
+        copy = pickle.loads(pickle.dumps(world))
+        assert_same_image(camera.render(copy), image)
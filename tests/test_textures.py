@@ -0,0 +1,104 @@
+from math import sqrt
+from raytracer.patterns import TexturePattern
+from raytracer.shapes import Instance, InstancedShape, Plane, Sphere
+from raytracer.textures import load_texture, UvMapping, _textures
+from raytracer.tuples import Color, Point
+import numpy as np
+import os
+import pickle
+import pytest
+
+
+@pytest.fixture
+def ppm_files(tmp_path):
+    # a 2x2 image: red, green on the top row, blue, white on the bottom row
+    pixels = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)]
+    p3 = tmp_path / 'image_p3.ppm'
+    p3.write_text('P3\n# a comment\n2 2\n255\n' + '\n'.join(' '.join(map(str, p)) for p in pixels) + '\n')
+    p6 = tmp_path / 'image_p6.ppm'
+    p6.write_bytes(b'P6\n2 2\n255\n' + bytes(c for p in pixels for c in p))
+    return str(p3), str(p6)
+
+
+class TestTextures:
+    def test_reading_p3_and_p6_files(self, ppm_files):
+        p3, p6 = ppm_files
+        for path in ppm_files:
+            texture = load_texture(path)
+            assert (texture.width, texture.height) == (2, 2)
+            assert texture.sample(0, 1) == Color(1, 0, 0)
+            assert texture.sample(1, 1) == Color(0, 1, 0)
+            assert texture.sample(0, 0) == Color(0, 0, 1)
+            assert texture.sample(1, 0) == Color(1, 1, 1)
+        assert isinstance(load_texture(p6).level(0)[0], np.memmap)
+
+    def test_bilinear_sampling_between_pixels(self, ppm_files):
+        texture = load_texture(ppm_files[1])
+        assert texture.sample(0.5, 1) == Color(0.5, 0.5, 0)
+
+    def test_mipmap_levels_average_the_level_above(self, ppm_files):
+        texture = load_texture(ppm_files[1])
+        assert texture.level_count == 2
+        assert texture.sample(0.3, 0.3, 1) == Color(0.5, 0.5, 0.5)
+        assert texture.sample(0, 1, 0.5) == Color(0.75, 0.25, 0.25)
+
+    def test_textures_are_cached_and_pickled_by_path(self, ppm_files):
+        texture = load_texture(ppm_files[1])
+        assert load_texture(ppm_files[1]) is texture
+        assert pickle.loads(pickle.dumps(texture)) is texture
+
+    def test_changed_file_replaces_cached_texture(self, ppm_files):
+        path = ppm_files[1]
+        texture = load_texture(path)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        reloaded = load_texture(path)
+        assert reloaded is not texture
+        assert [cached for _, cached in _textures.values()].count(texture) == 0
+        assert load_texture(path) is reloaded
+
+    def test_not_a_ppm_file(self, tmp_path):
+        path = tmp_path / 'image.ppm'
+        path.write_text('P2\n1 1\n255\n0\n')
+        with pytest.raises(ValueError):
+            load_texture(str(path))
+
+    @pytest.mark.parametrize("point,u,v", [(Point(0, 0, -1), 0.0, 0.5),
+                                           (Point(1, 0, 0), 0.25, 0.5),
+                                           (Point(0, 0, 1), 0.5, 0.5),
+                                           (Point(0, 1, 0), 0.5, 1.0),
+                                           (Point(0, -1, 0), 0.5, 0.0),
+                                           (Point(sqrt(2) / 2, sqrt(2) / 2, 0), 0.25, 0.75),
+                                           (Point(0, 0, 0), 0.5, 0.5)])
+    def test_spherical_mapping(self, point, u, v):
+        assert UvMapping.SPHERICAL.map(point) == pytest.approx((u, v))
+        mapped_u, mapped_v = UvMapping.SPHERICAL.map_many(np.array([point[:3]]))
+        assert (mapped_u[0], mapped_v[0]) == pytest.approx((u, v))
+
+    @pytest.mark.parametrize("mapping", list(UvMapping))
+    def test_scalar_and_vectorized_mappings_agree(self, mapping):
+        points = np.random.default_rng(11).uniform(-1, 1, (30, 3))
+        us, vs = mapping.map_many(points)
+        for point, u, v in zip(points, us, vs):
+            assert mapping.map(Point(*point)) == pytest.approx((u, v))
+
+    @pytest.mark.parametrize("point,u,v", [(Point(-0.5, 0.5, 1), 0.25, 0.75),
+                                           (Point(1, 0.5, -0.5), 0.75, 0.75),
+                                           (Point(0.5, 1, -0.5), 0.75, 0.75),
+                                           (Point(-0.5, -1, 0.5), 0.25, 0.75)])
+    def test_cubic_mapping(self, point, u, v):
+        assert UvMapping.CUBIC.map(point) == pytest.approx((u, v))
+
+    def test_texture_pattern_picks_mapping_from_shape(self, ppm_files):
+        pattern = TexturePattern(load_texture(ppm_files[1]))
+        assert pattern.pattern_at_shape(Plane(), Point(0.0, 0, 0.5)) == Color(0.5, 0, 0.5)
+        assert pattern.pattern_at_shape(Sphere(), Point(0, -1, 0)) == Color(0.5, 0.5, 1)
+        colors = pattern.pattern_at_shape_many(Plane(), np.array([[0.0, 0, 0.5], [0.5, 0, 0.0]]))
+        assert Color(*colors[0]) == Color(0.5, 0, 0.5)
+        assert Color(*colors[1]) == Color(0.5, 0.5, 1)
+
+    def test_texture_pattern_maps_instanced_shapes_like_their_prototype(self, ppm_files):
+        pattern = TexturePattern(load_texture(ppm_files[1]))
+        plane = Plane()
+        instance = Instance(plane)
+        assert pattern.pattern_at_shape(InstancedShape(instance, plane), Point(0.0, 0, 0.5)) == Color(0.5, 0, 0.5)
@@ -1,4 +1,5 @@
 from math import sqrt
+import pickle
 from raytracer.tuples import Tuple, TupleType, Point, Vector, dot, cross, Color
 
 
@@ -29,6 +30,12 @@ class TestTuples:
         v = Vector(4, -4, 3)
         assert v == Tuple(4, -4, 3, 0.0)
 
+    def test_points_and_vectors_survive_pickling(self):
+        p = pickle.loads(pickle.dumps(Point(4, -4, 3)))
+        v = pickle.loads(pickle.dumps(Vector(4, -4, 3)))
+        assert type(p) is Point and p == Point(4, -4, 3)
+        assert type(v) is Vector and v == Vector(4, -4, 3)
+
     def test_compare_2_points_for_equality(self):
         p1 = Point(4, -4, 3)
         p2 = Point(4, -4, 3)
@@ -0,0 +1,76 @@
+from raytracer.matrices import rotation_z, scaling, translation
+from raytracer.patterns import CheckersPattern, StripePattern
+from raytracer.shapes import Cone, Csg, Cube, Cylinder, Group, OperationType, Sphere
+from raytracer.tuples import Color, Point
+from raytracer.wavefront import render_wavefront
+from .test_camera import assert_same_image, build_scene
+import pytest
+
+
+def checkered_scene(*objects):
+    c, w = build_scene(*objects, hsize=24, vsize=16, eye=Point(0, 1.5, -6))
+    floor = w.objects[0]
+    floor.material.pattern = CheckersPattern(Color.white(), Color(0.2, 0.3, 0.4))
+    # 3d checkers flip on rounding errors at y = 0, so the plane is kept clear of that
+    floor.material.pattern.transformation = translation(0, 0.5, 0)
+    return c, w
+
+
+def assert_matches_render(c, w):
+    expected = c.render(w)
+    expected_statistics = w.statistics
+    image = render_wavefront(c, w, tile_size=10)
+    assert_same_image(image, expected, tolerance=1e-6)
+    assert w.statistics == expected_statistics
+
+
+class TestWavefront:
+    def test_diffuse_scene_matches_render(self):
+        s = Sphere()
+        s.material.pattern = StripePattern(Color(1, 0, 0), Color(0, 0, 1))
+        s.material.pattern.transformation = scaling(0.2, 0.2, 0.2)
+        cube = Cube()
+        cube.transformation = translation(2, 0, 1) * rotation_z(0.3) * scaling(0.5, 0.5, 0.5)
+        cylinder = Cylinder(closed=True)
+        cylinder.minimum, cylinder.maximum = -1, 0
+        cylinder.transformation = translation(-2, 0, 1) * scaling(0.5, 1, 0.5)
+        cone = Cone(closed=True)
+        cone.minimum, cone.maximum = -1, 0
+        cone.transformation = translation(0, 1.5, 2)
+        g = Group()
+        g.transformation = translation(0, 0, 1)
+        g.add_children(cube, cylinder, cone)
+        assert_matches_render(*checkered_scene(s, g))
+
+    def test_reflections_match_render(self):
+        c, w = checkered_scene()
+        w.objects[0].material.reflective = 0.5
+        mirror = Sphere()
+        mirror.material.reflective = 0.9
+        mirror.material.color = Color(0.1, 0.1, 0.1)
+        other = Sphere()
+        other.transformation = translation(-2, 0, -1) * scaling(0.5, 0.5, 0.5)
+        w.add(mirror, other)
+        assert_matches_render(c, w)
+
+    def test_glass_matches_render(self):
+        glass = Sphere()
+        glass.material.transparency = 0.9
+        glass.material.reflective = 0.9
+        glass.material.refractive_index = 1.5
+        glass.material.diffuse = 0.1
+        bubble = Sphere()
+        bubble.transformation = scaling(0.5, 0.5, 0.5)
+        bubble.material.transparency = 1.0
+        bubble.material.refractive_index = 1.0
+        behind = Sphere()
+        behind.transformation = translation(1, 0, 3)
+        c, w = checkered_scene(glass, bubble, behind)
+        assert_matches_render(c, w)
+        assert w.statistics.secondary_rays > 0
+        assert w.statistics.terminated_rays > 0
+
+    def test_csg_is_rejected(self):
+        c, w = checkered_scene(Csg(OperationType.UNION, Sphere(), Cube()))
+        with pytest.raises(ValueError):
+            render_wavefront(c, w)